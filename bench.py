@@ -0,0 +1,254 @@
+# bench.py
+# Offline benchmark for the bot's hot paths. Runs against synthetic state and the in-memory fakes in fakes.py,
+# so no token or network is needed.
+#
+#   python bench.py                                  # all cases, default scale
+#   python bench.py --tickets 10000 --users 100000   # production-like scale
+#   python bench.py --case on_message --case close_ticket --json results.json
+#
+# Everything runs inside a temporary working directory, so the real state files are never touched.
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+GUILD_ID = 945694600377552916
+STAFF_ID = 1_100_000_000_000_000_000
+TICKET_USER_BASE = 1_200_000_000_000_000_000
+ACCOUNT_USER_BASE = 1_300_000_000_000_000_000
+
+CASES = ["leaderboard", "update_all_spender_roles", "check_inactivity", "on_message", "create_ticket_for_user", "close_ticket"]
+# Full-scan cases are far slower per op than per-event ones
+DEFAULT_ITERATIONS = {"update_all_spender_roles": 5, "check_inactivity": 5, "leaderboard": 50}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark the bot's hot paths against in-memory Discord fakes.")
+    p.add_argument("--case", action="append", choices=CASES, help="Case to run (repeatable, default: all)")
+    p.add_argument("--tickets", type=int, default=1000, help="Open tickets in synthetic state")
+    p.add_argument("--users", type=int, default=10000, help="Users in accounting.json")
+    p.add_argument("--members", type=int, default=5000, help="Accounting users that are guild members")
+    p.add_argument("--history", type=int, default=30, help="Messages per ticket channel (transcript size)")
+    p.add_argument("--iterations", type=int, default=200, help="Ops per per-event case")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per REST call")
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--json", dest="json_out", help="Also write results to this JSON file")
+    return p.parse_args(argv)
+
+
+# ---------------------------
+# Synthetic state
+# ---------------------------
+def make_accounting(rng: random.Random, users: int) -> Dict[str, Any]:
+    data = {"totals": {"gamepass": 0, "groupfunds": 0, "ingame": 0, "other": 0}, "methods": {}, "users": {}}
+    for i in range(users):
+        # long-tailed spend, roughly like production
+        data["users"][str(ACCOUNT_USER_BASE + i)] = {"spent": round(rng.lognormvariate(3.5, 1.6), 2)}
+    return data
+
+
+def make_tickets(rng: random.Random, tickets: int, channel_base: int) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    data = {}
+    subtypes = ["gamepass", "groupfunds", "ingame"]
+    methods = ["paypal", "crypto", "binance", "wise"]
+    for i in range(tickets):
+        uid = TICKET_USER_BASE + i
+        created = now - timedelta(hours=rng.uniform(1, 24 * 14))
+        # ~10% of tickets are stale enough to be warned on the next inactivity pass
+        idle = timedelta(hours=rng.uniform(0, 60)) if rng.random() > 0.1 else timedelta(days=3, hours=rng.uniform(1, 24))
+        amount = rng.choice([1000, 2000, 5000, 10000, 25000])
+        data[str(uid)] = [{
+            "channel_id": channel_base + i,
+            "user_id": uid,
+            "created_at": created.isoformat(),
+            "last_activity": max(created, now - idle).isoformat(),
+            "delivery_type": "Robux",
+            "subtype": rng.choice(subtypes),
+            "payment_method": rng.choice(methods),
+            "amount": amount,
+            "total_cost": amount / 1000 * 5.0,
+            "warned": False,
+            "warn_time": None,
+        }]
+    return data
+
+
+class Bench:
+    def __init__(self, main, args: argparse.Namespace):
+        from fakes import FakeWorld
+
+        self.main = main
+        self.background = sys.modules["extensions.background"]
+        self.tickets = sys.modules["extensions.tickets"]
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.channel_base = 1_400_000_000_000_000_000
+
+        accounting = make_accounting(self.rng, args.users)
+        tickets = make_tickets(self.rng, args.tickets, self.channel_base)
+        main.write_state(main.ACCOUNTING_JSON, accounting)
+        main.write_json(main.TICKET_JSON, tickets)
+        main.ticket_store.replace_all(main.load_tickets())
+        main.pending_auto_closes.clear()
+
+        world = self.world = FakeWorld(main.bot, GUILD_ID, latency=args.latency_ms / 1000.0)
+        guild = world.guild
+        support = world.add_bot_layout(main)
+        self.staff = guild.add_member(STAFF_ID, "staff", roles=[support])
+
+        for i in range(min(args.members, args.users)):
+            uid = ACCOUNT_USER_BASE + i
+            guild.add_member(uid, f"buyer{i}")
+
+        self.ticket_channels = []
+        now = datetime.now(timezone.utc)
+        for uid, user_tickets in tickets.items():
+            owner = guild.add_member(int(uid), f"ticket{int(uid) % 100000}")
+            for t in user_tickets:
+                chan = guild.add_text_channel(t["channel_id"], f"ticket-{owner.name}", category_id=None)
+                self.ticket_channels.append((chan, owner))
+                for n in range(args.history):
+                    author = owner if n % 2 else self.staff
+                    chan.add_history(author, f"message {n} in {chan.name}", created_at=now - timedelta(minutes=args.history - n))
+
+    # Each op returns an awaitable; run_case times them one by one
+    def ops_leaderboard(self) -> Callable:
+        async def op():
+            await self.main.slash_leaderboard.callback(self.interaction(self.staff))
+        return op
+
+    def ops_update_all_spender_roles(self) -> Callable:
+        async def op():
+            await self.background.update_all_spender_roles.coro()
+        return op
+
+    def ops_check_inactivity(self) -> Callable:
+        async def op():
+            await self.background.check_inactivity.coro()
+        return op
+
+    def ops_on_message(self) -> Callable:
+        from fakes import FakeMessage
+
+        async def op():
+            chan, owner = self.rng.choice(self.ticket_channels)
+            author = owner if self.rng.random() < 0.6 else self.staff
+            await self.tickets.on_message(FakeMessage(chan, author, "any update on my order?"))
+        return op
+
+    def ops_create_ticket_for_user(self) -> Callable:
+        counter = iter(range(10**9))
+
+        async def op():
+            member = self.world.guild.add_member(TICKET_USER_BASE + 50_000_000 + next(counter), "newbuyer")
+            interaction = self.interaction(member)
+            await self.tickets.create_ticket_for_user(interaction, delivery_type="Robux", subtype="gamepass", payment_method="paypal", amount=5000)
+        return op
+
+    def ops_close_ticket(self) -> Callable:
+        targets = iter(list(self.ticket_channels))
+
+        async def op():
+            chan, _ = next(targets)
+            await self.main.close_ticket(chan, closer=self.staff, reason="Benchmark close")
+        return op
+
+    def interaction(self, user, channel=None):
+        from fakes import FakeInteraction
+        return FakeInteraction(self.world.rest, user, channel)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_case(main, args: argparse.Namespace, case: str) -> Dict[str, Any]:
+    bench = Bench(main, args)
+    op = getattr(bench, f"ops_{case}")()
+    iterations = DEFAULT_ITERATIONS.get(case, args.iterations)
+    if case == "close_ticket":
+        iterations = min(iterations, len(bench.ticket_channels))
+
+    rest_before = bench.world.rest.calls
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        await op()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    # let fire-and-forget tasks (sticky reposts, error replies) settle so they don't leak into the next case
+    pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for t in pending:
+        t.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    latencies.sort()
+    return {
+        "case": case,
+        "ops": iterations,
+        "ops_per_sec": iterations / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rest_calls_per_op": (bench.world.rest.calls - rest_before) / max(iterations, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_table(results: List[Dict[str, Any]]):
+    header = f"{'case':<26}{'ops':>7}{'ops/sec':>12}{'p50 ms':>10}{'p99 ms':>10}{'REST/op':>9}{'peak RSS MB':>13}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['case']:<26}{r['ops']:>7}{r['ops_per_sec']:>12.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['rest_calls_per_op']:>9.1f}{r['peak_rss_mb']:>13.1f}")
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    import main
+
+    await main.load_extensions()
+    results = []
+    for case in args.case or CASES:
+        results.append(await run_case(main, args, case))
+    return results
+
+
+def cli(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo_dir)
+    # main.py reads and writes its state files relative to the cwd; keep it away from the real ones
+    os.environ["GIT_SYNC"] = "0"
+    os.environ.setdefault("TOKEN", "")
+    with tempfile.TemporaryDirectory(prefix="xts-bench-") as workdir:
+        os.chdir(workdir)
+        results = asyncio.run(run(args))
+        # main.py writes state files from a background thread; let them land before the directory goes
+        sys.modules["main"].state_writer.flush()
+        os.chdir(repo_dir)
+
+    print(f"\nscale: tickets={args.tickets} users={args.users} members={args.members} history={args.history} latency={args.latency_ms}ms")
+    print_table(results)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    cli()
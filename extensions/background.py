@@ -0,0 +1,154 @@
+# extensions/background.py
+# The bot's background loops (inactivity warnings and auto-closes, spender roles), loaded as a discord.py
+# extension so /reload-extension can swap their code without a restart. All state stays in main.
+import logging
+import time
+from typing import Optional, Dict, List
+
+import discord
+from discord.ext import commands, tasks
+
+import main
+
+log = logging.getLogger("xts.background")
+
+# ---------------------------
+# Background Task: Inactivity checks
+# ---------------------------
+@tasks.loop(minutes=60)
+async def check_inactivity():
+    # runs every hour
+    main.rest_priority.set(main.REST_BACKGROUND)
+    now = time.time()
+    changed = False
+    # Scan a snapshot: handlers keep updating the store while this awaits Discord, and every write below
+    # is conditional on the ticket being unchanged since the snapshot, so their updates always win
+    snapshot = main.ticket_store.snapshot()
+    # Look up the owners of every ticket due a warning in one batch per guild
+    due_owners: Dict[int, List[int]] = {}
+    for uid, user_tickets in snapshot.items():
+        for data in user_tickets:
+            if not main.leads_shard(main.shard_for_guild(data.guild_id)):
+                continue
+            chan = main.bot.get_channel(data.channel_id)
+            if chan and not data.warned and now - data.last_activity >= main.INACTIVITY_WARN_AFTER:
+                due_owners.setdefault(chan.guild.id, []).append(data.user_id)
+    owners: Dict[tuple, Optional[discord.Member]] = {}
+    for guild_id, user_ids in due_owners.items():
+        guild = main.bot.get_guild(guild_id)
+        for user_id, member in (await main.member_resolver.resolve(guild, user_ids)).items():
+            owners[(guild_id, user_id)] = member
+
+    for uid, user_tickets in snapshot.items():
+        for data in user_tickets:
+            if not main.leads_shard(main.shard_for_guild(data.guild_id)):
+                continue  # another process holds this shard's lease
+            if main.job_queue.active(data.channel_id):
+                continue  # being closed or moved right now
+            try:
+                channel_id = data.channel_id
+                user_id = int(uid)
+                # if > 3 days and not warned -> send warning
+                if not data.warned:
+                    if now - data.last_activity >= main.INACTIVITY_WARN_AFTER:
+                        # send warning ping to user in channel
+                        try:
+                            chan = main.bot.get_channel(channel_id) or await main.bot.fetch_channel(channel_id)
+                            if chan:
+                                user = owners.get((chan.guild.id, user_id))
+                                if user is None and (chan.guild.id, user_id) not in owners:
+                                    user = (await main.member_resolver.resolve(chan.guild, [user_id]))[user_id]
+                                if user:
+                                    await chan.send(content=f"{user.mention} • Your ticket is inactive. It will automatically close in 24 hours unless you reply.")
+                                    # mark warned
+                                    if main.ticket_store.update(channel_id, expected=data, warned=True, warn_time=now):
+                                        changed = True
+                        except Exception:
+                            pass
+                else:
+                    # if warned, check if warn_time >=24h ago -> auto close
+                    if data.warn_time is not None and now - data.warn_time >= main.INACTIVITY_CLOSE_AFTER:
+                        # auto-close, unless the ticket saw activity while we were scanning
+                        found = main.ticket_store.find(channel_id)
+                        if not found or found[1] is not data:
+                            continue
+                        try:
+                            chan = main.bot.get_channel(channel_id)
+                            if chan:
+                                # fetch a "system" user for closer? use bot.user
+                                main.job_queue.submit(channel_id, "auto-close", lambda report, chan=chan: main.close_ticket(chan, closer=main.bot.user, reason="Auto-closed due to inactivity"))
+                            else:
+                                # channel missing; just remove ticket entry
+                                main.ticket_store.remove(channel_id)
+                                changed = True
+                        except Exception:
+                            # attempt removal
+                            main.ticket_store.remove(channel_id)
+                            changed = True
+            except Exception:
+                log.exception("Inactivity check error", extra={"user": uid, "channel": data.channel_id})
+    if changed:
+        main.save_tickets()
+
+# ---------------------------
+# Background Task: Spender roles
+# ---------------------------
+@tasks.loop(minutes=1)  # adjust frequency as needed
+async def update_all_spender_roles():
+    main.rest_priority.set(main.REST_BACKGROUND)
+    for guild in main.bot.guilds:
+        if not main.leads_shard(main.shard_for_guild(guild.id)):
+            continue
+        role_thresholds = main.guild_config(guild.id).role_thresholds
+        lowest_threshold = min(threshold for threshold, _ in role_thresholds)
+        data = main.read_accounting(guild.id)
+        members = await main.member_resolver.resolve(guild, [int(uid) for uid, info in data.get("users", {}).items() if info.get("spent", 0) >= lowest_threshold])
+        for uid, info in data.get("users", {}).items():
+            member = members.get(int(uid))
+            if not member:
+                continue  # skip if user not in guild
+
+            amount_spent = info.get("spent", 0)
+            assigned_role = None
+
+            # Determine the highest tier role the user qualifies for
+            for threshold, role_id in role_thresholds:
+                if amount_spent >= threshold:
+                    assigned_role = guild.get_role(role_id)
+                    break
+
+            if not assigned_role:
+                continue  # user doesn't qualify for any role
+
+            # Remove lower-tier roles
+            roles_to_remove = [guild.get_role(rid) for t, rid in role_thresholds if rid != assigned_role.id]
+            roles_to_remove = [r for r in roles_to_remove if r in member.roles]
+
+            try:
+                if roles_to_remove:
+                    await member.remove_roles(*roles_to_remove, reason="Upgrading spender role")
+                if assigned_role not in member.roles:
+                    await member.add_roles(assigned_role, reason="Spender role based on balance")
+            except Exception as e:
+                log.warning("Error updating roles for %s: %s", member, e, extra={"user": member.id})
+
+
+LOOPS = (check_inactivity, update_all_spender_roles)
+
+
+async def start_loops():
+    # on_ready fires again after a reconnect; the loops are already running then
+    for loop in LOOPS:
+        if not loop.is_running():
+            loop.start()
+
+
+async def setup(bot: commands.Bot):
+    bot.add_listener(start_loops, "on_ready")
+    if bot.is_ready():
+        await start_loops()  # (re)loaded while connected
+
+
+async def teardown(bot: commands.Bot):
+    for loop in LOOPS:
+        loop.cancel()
@@ -0,0 +1,202 @@
+# extensions/reports.py
+# Staff lookups over open and closed tickets and the DM outbox, loaded as a discord.py extension so
+# /reload-extension can swap their code without a restart. All state stays in main.
+import io
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+import main
+
+# ---------------------------
+# /sales-report (staff only): grouped queries over the closed-ticket facts
+# ---------------------------
+@app_commands.command(name="sales-report", description="Orders and revenue from closed tickets, grouped (staff only)")
+@app_commands.describe(group="How to group the closed tickets", days="Look back this many days (0 = all history)", format="Table in chat or a CSV file", include_unpaid="Also count tickets closed without payment")
+@app_commands.choices(
+    group=[app_commands.Choice(name=g, value=g) for g in main.REPORT_GROUPS],
+    format=[app_commands.Choice(name="table", value="table"), app_commands.Choice(name="csv", value="csv")],
+)
+async def sales_report_cmd(interaction: discord.Interaction, group: str = "subtype", days: app_commands.Range[int, 0, 3650] = 30, format: str = "table", include_unpaid: bool = False):
+    member = interaction.user
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
+        return
+
+    until = time.time() + 1
+    since = until - days * 86400 if days else 0.0
+    rows = await main.state_writer.run(lambda: main.sales_facts_for(interaction.guild_id).report(group, since, until, paid_only=not include_unpaid))
+    if not rows:
+        await interaction.response.send_message("No closed tickets in that range.", ephemeral=True)
+        return
+
+    span = f"last {days} days" if days else "all history"
+    table = main.sales_report_table(rows)
+    if format == "table" and len(table) <= 1900:
+        await interaction.response.send_message(f"**Sales by {group}** ({span})\n```\n{table}\n```", ephemeral=True)
+        return
+    file = discord.File(io.BytesIO(main.sales_report_csv(rows).encode("utf-8")), filename=f"sales_{group}_{datetime.now(timezone.utc):%Y%m%d}.csv")
+    await interaction.response.send_message(f"**Sales by {group}** ({span}) • {len(rows)} rows", file=file, ephemeral=True)
+
+
+# ---------------------------
+# /ticket-history and /ticket-history-range (staff only): closed-ticket lookups
+# ---------------------------
+async def send_history(interaction: discord.Interaction, title: str, records: List[Dict[str, Any]], newest_first: bool):
+    if not records:
+        await interaction.response.send_message("No closed tickets found.", ephemeral=True)
+        return
+    shown = records[:main.HISTORY_PAGE] if newest_first else records[-main.HISTORY_PAGE:]
+    embed = discord.Embed(title=title, description="\n".join(main.format_history_line(r) for r in shown)[:4000], color=discord.Color.blue())
+    paid = [r for r in records if r.get("paid")]
+    embed.set_footer(text=f"{len(records)} closed • {len(paid)} paid • ${sum(float(r.get('total_cost') or 0.0) for r in paid):,.2f} revenue")
+    if len(records) > len(shown):
+        file = discord.File(io.BytesIO(main.history_csv(records).encode("utf-8")), filename="ticket_history.csv")
+        await interaction.response.send_message(embed=embed, file=file, ephemeral=True)
+    else:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@app_commands.command(name="ticket-history", description="A user's most recent closed tickets (staff only)")
+@app_commands.describe(user="The ticket owner", limit="How many tickets to return (newest first)")
+async def ticket_history_cmd(interaction: discord.Interaction, user: discord.User, limit: app_commands.Range[int, 1, 500] = main.HISTORY_PAGE):
+    member = interaction.user
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
+        return
+    records = await main.state_writer.run(lambda: main.ticket_history_for(interaction.guild_id).for_user(user.id, limit))
+    await send_history(interaction, f"Ticket History - {user}", records, newest_first=True)
+
+
+@app_commands.command(name="ticket-history-range", description="Closed tickets between two dates, UTC (staff only)")
+@app_commands.describe(start="First day, YYYY-MM-DD", end="Last day (inclusive), YYYY-MM-DD; defaults to today", user="Only this user's tickets")
+async def ticket_history_range_cmd(interaction: discord.Interaction, start: str, end: Optional[str] = None, user: Optional[discord.User] = None):
+    member = interaction.user
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
+        return
+    try:
+        since = datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        until = datetime.strptime(end, "%Y-%m-%d").replace(tzinfo=timezone.utc) if end else datetime.now(timezone.utc)
+    except ValueError:
+        await interaction.response.send_message("Dates must look like 2025-01-31.", ephemeral=True)
+        return
+    until = until.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    if until <= since:
+        await interaction.response.send_message("End date is before the start date.", ephemeral=True)
+        return
+    records = await main.state_writer.run(lambda: main.ticket_history_for(interaction.guild_id).between(since.timestamp(), until.timestamp(), user_id=user.id if user else None))
+    title = f"Closed Tickets {since:%Y-%m-%d} → {(until - timedelta(days=1)):%Y-%m-%d}" + (f" - {user}" if user else "")
+    await send_history(interaction, title, records, newest_first=False)
+
+
+# ---------------------------
+# /dm-outbox (staff view, admins retry or clear): queued and undeliverable customer DMs
+# ---------------------------
+@app_commands.command(name="dm-outbox", description="Queued and failed customer DMs (staff only)")
+@app_commands.describe(action="view (default), retry-dead to requeue failed DMs, clear-dead to drop them (admins)")
+@app_commands.choices(action=[app_commands.Choice(name=a, value=a) for a in ("view", "retry-dead", "clear-dead")])
+async def dm_outbox_cmd(interaction: discord.Interaction, action: str = "view"):
+    member = interaction.user
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
+        return
+    if action != "view":
+        if not isinstance(member, discord.Member) or not main.is_admin_member(member):
+            await interaction.response.send_message("No permission.", ephemeral=True)
+            return
+        if action == "retry-dead":
+            await interaction.response.send_message(f"Requeued {main.dm_outbox.retry_dead()} failed DMs.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"Dropped {main.dm_outbox.clear_dead()} failed DMs.", ephemeral=True)
+        return
+
+    queue = main.dm_outbox.queue
+    retrying = [e for e in queue if e["attempts"]]
+    lines = [f"**Queued:** {len(queue)} ({len(retrying)} retrying) • **Sent since start:** {main.dm_outbox.sent}"]
+    if queue:
+        lines.append(f"Next delivery <t:{int(min(e['next_at'] for e in queue))}:R>")
+    if main.dm_outbox.dead:
+        lines.append(f"\n**Failed ({len(main.dm_outbox.dead)}), newest first:**")
+        for e in reversed(main.dm_outbox.dead[-10:]):
+            lines.append(f"<@{e['user_id']}> • {e['kind']} • <t:{int(e.get('failed_at') or e['created_at'])}:R> • {e['error']}")
+    embed = discord.Embed(title="DM Outbox", description="\n".join(lines)[:4000], color=discord.Color.blue())
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+# ---------------------------
+# /tickets find (staff only): open-ticket search over the ticket store's indexes
+# ---------------------------
+FIND_PAGE = 15
+FIND_ORDERS = {
+    "idle": ("last_activity", False),     # longest without activity first
+    "active": ("last_activity", True),    # most recent activity first
+    "oldest": ("created_at", False),
+    "newest": ("created_at", True),
+}
+
+tickets_group = app_commands.Group(name="tickets", description="Open ticket lookups (staff only)")
+
+
+def format_open_ticket_line(ticket: "main.Ticket") -> str:
+    kind = (ticket.subtype or ticket.delivery_type or "other").lower()
+    warned = " ⚠️" if ticket.warned else ""
+    return (f"<#{ticket.channel_id}> <@{ticket.user_id}> • {kind} {ticket.amount:,} R$ • ${ticket.total_cost:,.2f} {ticket.payment_method or ''}"
+            f" • opened <t:{int(ticket.created_at)}:R> • active <t:{int(ticket.last_activity)}:R>{warned}")
+
+
+@tickets_group.command(name="find", description="Search open tickets by owner, type, payment, amount or age (staff only)")
+@app_commands.describe(
+    user="Only this user's tickets", subtype="Robux type, e.g. gamepass", payment_method="e.g. paypal",
+    min_amount="Smallest Robux amount", max_amount="Largest Robux amount",
+    opened_hours="Opened at least this many hours ago", idle_hours="No activity for at least this many hours",
+    sort="Result order", page="Page of results",
+)
+@app_commands.choices(sort=[app_commands.Choice(name=o, value=o) for o in FIND_ORDERS])
+async def tickets_find_cmd(interaction: discord.Interaction, user: Optional[discord.User] = None, subtype: Optional[str] = None,
+                           payment_method: Optional[str] = None, min_amount: Optional[app_commands.Range[int, 0]] = None,
+                           max_amount: Optional[app_commands.Range[int, 0]] = None, opened_hours: Optional[app_commands.Range[float, 0]] = None,
+                           idle_hours: Optional[app_commands.Range[float, 0]] = None, sort: str = "idle", page: app_commands.Range[int, 1] = 1):
+    member = interaction.user
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
+        return
+
+    now = time.time()
+    order, descending = FIND_ORDERS[sort]
+    started = time.perf_counter()
+    found = main.ticket_store.search(
+        guild_id=interaction.guild_id or main.PRIMARY_GUILD_ID,
+        user_id=user.id if user else None,
+        subtype=subtype.strip() if subtype else None,
+        payment_method=payment_method.strip() if payment_method else None,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        created_before=now - opened_hours * 3600 if opened_hours is not None else None,
+        active_before=now - idle_hours * 3600 if idle_hours is not None else None,
+        order=order,
+        descending=descending,
+    )
+    took = (time.perf_counter() - started) * 1000
+    if not found:
+        await interaction.response.send_message("No open tickets match.", ephemeral=True)
+        return
+
+    pages = (len(found) + FIND_PAGE - 1) // FIND_PAGE
+    page = min(page, pages)
+    shown = found[(page - 1) * FIND_PAGE:page * FIND_PAGE]
+    embed = discord.Embed(title=f"Open Tickets ({sort})", description="\n".join(format_open_ticket_line(t) for t in shown)[:4000], color=discord.Color.blue())
+    embed.set_footer(text=f"Page {page}/{pages} • {len(found)} matches • ${sum(t.total_cost for t in found):,.2f} pending • {took:.1f} ms")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+COMMANDS = (sales_report_cmd, ticket_history_cmd, ticket_history_range_cmd, dm_outbox_cmd, tickets_group)
+
+
+async def setup(bot: commands.Bot):
+    for command in COMMANDS:
+        bot.tree.add_command(command)
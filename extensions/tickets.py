@@ -0,0 +1,851 @@
+# extensions/tickets.py
+# The ticket flow: the panel and its views, ticket creation, /close, /close-without-payment,
+# /confirm-payment, /next, /add-user-to-ticket, their prefix versions and the on_message listener.
+# Loaded as a discord.py extension so /reload-extension can swap this code without a restart; the
+# tickets themselves, the close/archive path and the job queue stay in main.
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from discord.ui import View, Select, Button, Modal, TextInput
+
+import main
+
+# ---------------------------
+# Embeds
+# ---------------------------
+def ticket_info_embed(user: discord.User, delivery_type: str, subtype: Optional[str],
+                      payment_method: str, amount: float, total_cost: float,
+                      notes: Optional[str]) -> discord.Embed:
+    embed = discord.Embed(title="Ticket Created", color=discord.Color.blurple(), timestamp=datetime.now(timezone.utc))
+    embed.add_field(name="User", value=f"{user.mention} ({user})", inline=False)
+    embed.add_field(name="Delivery Type", value=delivery_type, inline=True)
+    if subtype:
+        embed.add_field(name="Subtype", value=subtype, inline=True)
+    embed.add_field(name="Payment Method", value=payment_method, inline=True)
+    embed.add_field(name="Amount (Robux)", value=f"{amount:,}", inline=True)
+    embed.add_field(name="Total Cost", value=f"${total_cost:,.2f}", inline=True)
+    if notes:
+        embed.add_field(name="Payment Instructions", value=notes, inline=False)
+    embed.set_footer(text="Support will be with you shortly.")
+    return embed
+
+
+# Helper: choose a category that isn't full (Discord limit ~50 channels per category)
+def select_ticket_category(guild: discord.Guild, key: str) -> Optional[discord.CategoryChannel]:
+    """Given a CATEGORY_IDS key, return the first CategoryChannel in the guild which has
+    fewer than 50 text channels. CATEGORY_IDS value may be a single int or a list of ints.
+    Returns None if no suitable category is found.
+    """
+    raw = main.guild_config(guild.id).category_ids.get(key)
+    if raw is None:
+        return None
+
+    ids = raw if isinstance(raw, (list, tuple)) else [raw]
+    for cid in ids:
+        try:
+            cat = guild.get_channel(cid)
+        except Exception:
+            cat = None
+        if not cat:
+            continue
+        # CategoryChannel has .text_channels; if not present, fall back to counting by category_id
+        try:
+            count = len(cat.text_channels)
+        except Exception:
+            count = len([c for c in guild.channels if getattr(c, "category_id", None) == cid and isinstance(c, discord.TextChannel)])
+        # If fewer than 50 text channels, use this category
+        if count < 50:
+            return cat
+
+    # None available (all full or invalid) -> return None
+    return None
+
+# ---------------------------
+# Classes
+# ---------------------------
+
+# Main panel view - first select delivery type
+class TicketPanelView(View):
+    def __init__(self, timeout: Optional[float] = None):
+        super().__init__(timeout=timeout)
+        # Add selects/buttons dynamically in __init__
+        self.add_item(DeliverySelect())
+
+class DeliverySelect(Select):
+    def __init__(self):
+        options = [
+            discord.SelectOption(label="Robux", description="Buy Robux (Gamepass / Group Funds / In-Game)", value="robux"),
+            discord.SelectOption(label="Other", description="Other support request", value="other")
+        ]
+        super().__init__(placeholder="Select ticket type...", min_values=1, max_values=1, options=options, custom_id="ticket_panel_delivery")
+
+    async def callback(self, interaction: discord.Interaction):
+        selected = self.values[0]
+        if selected == "robux":
+            # Show robux subtype select view
+            await interaction.response.send_message(embed=discord.Embed(title="Select Robux Delivery Type", description="Choose the delivery subtype."), view=RobuxSubtypeView(), ephemeral=True)
+        else:
+            # For "Other" open a modal to gather details (amount not needed)
+            await interaction.response.send_modal(OtherTicketModal())
+
+class RobuxSubtypeView(View):
+    def __init__(self):
+        super().__init__(timeout=180)
+        self.add_item(RobuxSubtypeSelect())
+        self.add_item(PaymentMethodSelect())  # allow selecting method before modal
+        self.add_item(StartRobuxModalButton())
+
+class RobuxSubtypeSelect(Select):
+    def __init__(self):
+        options = [
+            discord.SelectOption(label="Gamepass", value="gamepass", description="Gamepass delivery"),
+            discord.SelectOption(label="Group Funds", value="groupfunds", description="Group funds delivery"),
+            discord.SelectOption(label="In-Game Gifting", value="ingame", description="In-game gifting")
+        ]
+        super().__init__(placeholder="Select delivery subtype...", min_values=1, max_values=1, options=options)
+
+    async def callback(self, interaction: discord.Interaction):
+        # store selection in view state
+        view: RobuxSubtypeView = self.view  # type: ignore
+        view.delivery_subtype = self.values[0]
+        await interaction.response.send_message(f"Selected subtype: **{self.values[0]}**", ephemeral=True)
+
+class PaymentMethodSelect(Select):
+    def __init__(self):
+        options = [discord.SelectOption(label=method.title(), value=method) for method in main.PAYMENT_FEES.keys()]
+        super().__init__(placeholder="Select payment method...", min_values=1, max_values=1, options=options)
+
+    async def callback(self, interaction: discord.Interaction):
+        view: RobuxSubtypeView = self.view  # type: ignore
+        view.payment_method = self.values[0]
+        await interaction.response.send_message(f"Selected payment method: **{self.values[0]}**", ephemeral=True)
+
+class StartRobuxModalButton(Button):
+    def __init__(self):
+        super().__init__(style=discord.ButtonStyle.success, label="Proceed", custom_id="start_robux_modal")
+
+    async def callback(self, interaction: discord.Interaction):
+        view: RobuxSubtypeView = self.view  # type: ignore
+        delivery_subtype = getattr(view, "delivery_subtype", None)
+        payment_method = getattr(view, "payment_method", None)
+        if not delivery_subtype or not payment_method:
+            await interaction.response.send_message("Please choose a delivery subtype and a payment method before proceeding.", ephemeral=True)
+            return
+        # show modal for amount input
+        modal = RobuxAmountModal(delivery_subtype, payment_method)
+        await interaction.response.send_modal(modal)
+
+class RobuxAmountModal(Modal):
+    def __init__(self, subtype: str, payment_method: str):
+        super().__init__(title="Enter Robux Amount")
+        self.subtype = subtype
+        self.payment_method = payment_method
+        self.amount = TextInput(label="Amount of Robux (only numbers)", placeholder="e.g. 1000", style=discord.TextStyle.short, required=True, max_length=20)
+        self.add_item(self.amount)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            # validate amount
+            raw = self.amount.value.strip().replace(",", "")
+            if not raw.isdigit():
+                await interaction.response.send_message("Amount must be an integer number of Robux.", ephemeral=True)
+                return
+            amount = int(raw)
+            # call ticket creation
+            await create_ticket_for_user(interaction, delivery_type="Robux", subtype=self.subtype, payment_method=self.payment_method, amount=amount)
+        except Exception:
+            main.ticket_log.exception("Error in RobuxAmountModal.on_submit", extra={"user": interaction.user.id})
+            await interaction.response.send_message("An error occurred while creating the ticket. Please try again or contact support.", ephemeral=True)
+
+class OtherTicketModal(Modal):
+    def __init__(self):
+        super().__init__(title="Create Other Ticket")
+        self.details = TextInput(label="Describe your request", style=discord.TextStyle.paragraph, placeholder="Explain the issue or request...", required=True, max_length=2000)
+        self.add_item(self.details)
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            content = self.details.value.strip()
+            await create_ticket_for_user(interaction, delivery_type="Other", subtype=None, payment_method="N/A", amount=0, extra_notes=content)
+        except Exception:
+            main.ticket_log.exception("Error in OtherTicketModal.on_submit", extra={"user": interaction.user.id})
+            await interaction.response.send_message("An error occurred while creating the ticket. Please try again or contact support.", ephemeral=True)
+
+# ---------------------------
+# Ticket Management
+# ---------------------------
+def validate_ticket_creation(user: discord.User, guild: discord.Guild, interaction: discord.Interaction) -> bool:
+    """Validate guild and check existing tickets. Returns False if an error was sent."""
+    if guild is None:
+        asyncio.create_task(interaction.response.send_message("This command must be used in a server (guild).", ephemeral=True))
+        return False
+
+    # Only this guild's tickets count towards the limit (tickets from before guild ids were stored are the primary guild's)
+    user_tickets = [t for t in main.ticket_store.tickets_for(str(user.id)) if (t.guild_id or main.PRIMARY_GUILD_ID) == guild.id]
+    active_tickets = [t for t in user_tickets if guild.get_channel(t.channel_id) is not None]
+    if len(active_tickets) >= 3:
+        asyncio.create_task(interaction.response.send_message("You can have up to 3 active tickets.", ephemeral=True))
+        return False
+    # Clean up stale tickets
+    if len(active_tickets) != len(user_tickets):
+        for t in user_tickets:
+            if t not in active_tickets:
+                main.ticket_store.remove(t.channel_id)
+        main.save_tickets()
+    return True
+
+def determine_category_and_subtype(delivery_type: str, subtype: Optional[str]) -> tuple[str, Optional[str]]:
+    """Determine category_key and subtype_key."""
+    category_key = "other"
+    subtype_key = None
+    if delivery_type.lower() == "robux":
+        if subtype == "gamepass":
+            category_key = "robux_gamepass"
+            subtype_key = "gamepass"
+        elif subtype == "groupfunds":
+            category_key = "robux_groupfunds"
+            subtype_key = "groupfunds"
+        elif subtype == "ingame":
+            category_key = "robux_ingame"
+            subtype_key = "ingame"
+    return category_key, subtype_key
+
+def build_channel_overwrites(guild: discord.Guild, user: discord.User) -> Dict[discord.abc.Snowflake, discord.PermissionOverwrite]:
+    """Build permission overwrites for the ticket channel."""
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(view_channel=False),
+        user: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True, attach_files=True),
+    }
+    support_role = guild.get_role(main.guild_config(guild.id).support_role_id)
+    if support_role:
+        overwrites[support_role] = discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
+    overwrites[guild.me] = discord.PermissionOverwrite(view_channel=True, send_messages=True, manage_channels=True, read_message_history=True)
+    return overwrites
+
+def calculate_total_cost(delivery_type: str, subtype_key: Optional[str], amount: int, payment_method: str) -> tuple[float, Optional[str]]:
+    """Calculate total cost and get notes."""
+    total_cost = 0.0
+    notes = None
+    if delivery_type.lower() == "robux" and subtype_key:
+        price_per_thousand = main.price_for(subtype_key)
+        if price_per_thousand is None:
+            price_per_thousand = 0.0
+        thousands = amount / 1000.0
+        base = thousands * price_per_thousand
+        fee_pct = main.payment_fee_for(payment_method)
+        total_cost = base + (base * (fee_pct / 100.0))
+        pay_info = main.read_json(main.PAYMENT_JSON)
+        notes = pay_info.get(payment_method.lower(), None)
+    return total_cost, notes
+
+def save_ticket_info(user_key: str, channel: discord.TextChannel, delivery_type: str, subtype_key: Optional[str], payment_method: str, amount: int, total_cost: float):
+    """Save ticket metadata."""
+    now = time.time()
+    ticket_info = main.Ticket(
+        channel_id=channel.id,
+        user_id=int(user_key),
+        created_at=now,
+        last_activity=now,
+        delivery_type=delivery_type,
+        subtype=subtype_key,
+        payment_method=payment_method,
+        amount=amount,
+        total_cost=total_cost,
+        guild_id=channel.guild.id,
+    )
+    main.ticket_store.add(ticket_info)
+    main.save_tickets()
+
+async def post_ticket_embed_and_confirm(channel: discord.TextChannel, user: discord.User, delivery_type: str, subtype_key: Optional[str], payment_method: str, amount: int, total_cost: float, notes: Optional[str], extra_notes: Optional[str], interaction: discord.Interaction):
+    """Post embed in channel and confirm to user."""
+    if notes is None:
+        notes = extra_notes
+    embed = ticket_info_embed(user=user, delivery_type=delivery_type, subtype=subtype_key, payment_method=payment_method, amount=amount, total_cost=total_cost, notes=notes)
+    close_view = TicketChannelView(channel_owner_id=user.id)
+    support_role = channel.guild.get_role(main.guild_config(channel.guild.id).support_role_id)
+    await channel.send(content=f"{support_role.mention if support_role else ''} • Ticket created by {user.mention}", embed=embed, view=close_view)
+    await interaction.response.send_message(f"Ticket created: {channel.mention}", ephemeral=True)
+
+    # Post to getting_info
+    getting_info_cat = channel.guild.get_channel(main.guild_config(channel.guild.id).category_ids.get("getting_info"))
+    if getting_info_cat:
+        try:
+            await getting_info_cat.send(f"New ticket {channel.mention} created by {user.mention} • Type: {delivery_type} {('(' + (subtype_key or '') + ')') if subtype_key else ''}")
+        except Exception:
+            pass
+
+async def create_ticket_for_user(interaction: discord.Interaction, delivery_type: str, subtype: Optional[str], payment_method: str, amount: int = 0, extra_notes: Optional[str] = None):
+    """Create a ticket channel for the interaction user, enforce one-ticket-per-user, post embed & instructions."""
+    user = interaction.user
+    # hold the user's lock from the limit check until the ticket is recorded, so a double submit can't
+    # slip past the limit while the first channel is still being created
+    async with main.ticket_store.user_lock(str(user.id)):
+        if not validate_ticket_creation(user, interaction.guild, interaction):
+            return
+
+        category_key, subtype_key = determine_category_and_subtype(delivery_type, subtype)
+
+        # Unique channel name: ticket-username-XXXX
+        safe_name = user.name.lower().replace(" ", "-")[:20]
+        unique_suffix = str(user.id)[-4:]
+        channel_name = f"ticket-{safe_name}-{unique_suffix}"
+
+        overwrites = build_channel_overwrites(interaction.guild, user)
+        category = select_ticket_category(interaction.guild, category_key)
+
+        try:
+            channel = await interaction.guild.create_text_channel(name=channel_name, overwrites=overwrites, category=category, topic=f"Ticket for {user} ({user.id})")
+        except Exception as e:
+            await interaction.response.send_message(f"Failed to create ticket channel: {e}", ephemeral=True)
+            return
+
+        total_cost, notes = calculate_total_cost(delivery_type, subtype_key, amount, payment_method)
+        save_ticket_info(str(user.id), channel, delivery_type, subtype_key, payment_method, amount, total_cost)
+    await post_ticket_embed_and_confirm(channel, user, delivery_type, subtype_key, payment_method, amount, total_cost, notes, extra_notes, interaction)
+
+# ---------------------------
+# Ticket channel View (Close button)
+# ---------------------------
+class TicketChannelView(View):
+    def __init__(self, channel_owner_id: Optional[int] = None):
+        super().__init__(timeout=None)
+        self.channel_owner_id = channel_owner_id
+        self.add_item(CloseTicketButton())
+
+class CloseTicketButton(Button):
+    def __init__(self):
+        super().__init__(style=discord.ButtonStyle.danger, label="Close Ticket", custom_id="close_ticket_btn")
+
+    async def callback(self, interaction: discord.Interaction):
+        # Confirm: show modal or confirm view
+        confirm_view = ConfirmCloseView()
+        await interaction.response.send_message("Are you sure you want to close this ticket? This will delete the channel.", view=confirm_view, ephemeral=True)
+
+class ConfirmCloseView(View):
+    def __init__(self):
+        super().__init__(timeout=60)
+        self.add_item(ConfirmCloseButton())
+        self.add_item(CancelCloseButton())
+
+class ConfirmCloseButton(Button):
+    def __init__(self):
+        super().__init__(style=discord.ButtonStyle.danger, label="Yes, close", custom_id="confirm_close_btn")
+
+    async def callback(self, interaction: discord.Interaction):
+        # Only allow staff or the ticket owner to close
+        channel = interaction.channel
+        if channel is None:
+            await interaction.response.send_message("Couldn't determine channel.", ephemeral=True)
+            return
+        # fetch user ticket owner from the ticket store
+        found = main.ticket_store.find(channel.id)
+        owner_id = int(found[0]) if found else None
+        # permission check: either support role or owner or admin
+        member = interaction.user
+        allowed = False
+        if main.is_admin_member(member) or main.has_support_role(member):
+            allowed = True
+        if owner_id and member.id == owner_id:
+            allowed = True
+        if not allowed:
+            await interaction.response.send_message("You don't have permission to close this ticket.", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+
+        async def run(report):
+            await main.close_ticket(channel, closer=interaction.user, reason="Manual close (button)")
+        await main.queue_close(channel, "close", run, main.job_reporter(interaction=interaction))
+
+class CancelCloseButton(Button):
+    def __init__(self):
+        super().__init__(style=discord.ButtonStyle.secondary, label="Cancel", custom_id="cancel_close_btn")
+
+    async def callback(self, interaction: discord.Interaction):
+        await interaction.response.send_message("Close cancelled.", ephemeral=True)
+
+
+# ---------------------------
+# Inactivity: keep-open button on the warning message
+# ---------------------------
+class KeepTicketOpenButton(Button):
+    def __init__(self):
+        super().__init__(style=discord.ButtonStyle.success, label="🛑 Keep Ticket Open", custom_id="keep_ticket_open")
+
+    async def callback(self, interaction: discord.Interaction):
+        channel = interaction.channel
+        if not isinstance(channel, discord.TextChannel):
+            return
+
+        # Remove from pending closes
+        main.pending_auto_closes.pop(channel.id, None)
+        main.write_pending_closes(main.pending_auto_closes)
+
+        # Confirm the ticket is staying open
+        embed = discord.Embed(
+            title="Ticket Kept Open",
+            description="This ticket will remain open. Inactivity tracking has been reset.",
+            color=discord.Color.green()
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+class KeepTicketOpenView(View):
+    def __init__(self):
+        super().__init__(timeout=None)
+        self.add_item(KeepTicketOpenButton())
+
+
+# ---------------------------
+# Persistent components
+# ---------------------------
+# Views whose buttons must keep working across restarts. Every item has a fixed custom_id and the views
+# never time out, so registering one instance of each in setup() (no REST calls) lets discord.py route
+# clicks on any message that carries them, old or new. After a reload the new classes replace the old
+# ones, since the custom_ids are the same.
+PERSISTENT_VIEWS = [TicketPanelView, TicketChannelView, KeepTicketOpenView]
+
+
+# ---------------------------
+# Ticket panel
+# ---------------------------
+async def ensure_ticket_panels():
+    # on_ready listener: make sure each guild has a working ticket panel
+    main.rest_priority.set(main.REST_BACKGROUND)
+    for guild in main.bot.guilds:
+        await ensure_ticket_panel(guild)
+
+
+async def ensure_ticket_panel(guild: discord.Guild):
+    """Keep the panel that's already posted; only send one if the guild has none with the persistent view.
+
+    The panel's message id is recorded when it's sent, so restarts normally need no REST calls here. Without a
+    record (first start after an upgrade) the channel is scanned once: a panel carrying the persistent select
+    is adopted, while older panels, whose components died with the process that sent them, are replaced.
+    """
+    channel_id = main.guild_config(guild.id).ticket_panel_channel_id
+    record = main.panel_messages.get(str(guild.id))
+    if record and record.get("channel_id") == channel_id:
+        return
+    channel = main.bot.get_channel(channel_id)
+    if not channel or not isinstance(channel, discord.TextChannel):
+        return
+    try:
+        panel_messages_found = []
+        async for msg in channel.history(limit=50):
+            if msg.author == main.bot.user and msg.embeds and any(embed.title == "Create a Ticket" for embed in msg.embeds):
+                panel_messages_found.append(msg)
+        persistent = [msg for msg in panel_messages_found if is_persistent_panel(msg)]
+        if persistent:
+            record_panel_message(guild.id, persistent[0])
+            main.log.info("Adopted existing ticket panel in %s.", channel, extra={"channel": channel.id})
+            return
+        for msg in panel_messages_found:
+            await msg.delete()
+        await send_ticket_panel(channel)
+        main.log.info("Sent new ticket panel in %s.", channel, extra={"channel": channel.id})
+    except Exception:
+        main.log.exception("Error managing ticket panel")
+
+
+def is_persistent_panel(message: discord.Message) -> bool:
+    for row in message.components:
+        for item in getattr(row, "children", [row]):
+            if getattr(item, "custom_id", None) == "ticket_panel_delivery":
+                return True
+    return False
+
+
+def record_panel_message(guild_id: int, message: discord.Message):
+    main.panel_messages[str(guild_id)] = {"channel_id": message.channel.id, "message_id": message.id}
+    main.write_json(main.PANEL_MESSAGES_JSON, main.panel_messages)
+
+
+async def send_ticket_panel(channel: discord.TextChannel):
+    """Send the ticket creation panel to a channel."""
+    view = TicketPanelView()
+    embed = discord.Embed(title="Create a Ticket", description="Select the ticket type below to start.", color=discord.Color.green())
+    embed.add_field(name="Robux", value="Buy Robux (Gamepass / Group Funds / In-Game).", inline=False)
+    embed.add_field(name="Other", value="Other support requests.", inline=False)
+    message = await channel.send(embed=embed, view=view)
+    record_panel_message(channel.guild.id, message)
+
+@app_commands.command(name="ticket-panel", description="Send the ticket creation panel")
+async def ticket_panel(interaction: discord.Interaction):
+    view = TicketPanelView()
+    embed = discord.Embed(title="Create a Ticket", description="Select the ticket type below to start.", color=discord.Color.green())
+    embed.add_field(name="Robux", value="Buy Robux (Gamepass / Group Funds / In-Game).", inline=False)
+    embed.add_field(name="Other", value="Other support requests.", inline=False)
+    await interaction.response.send_message(embed=embed, view=view)
+
+
+# ---------------------------
+# Slash /close command
+# ---------------------------
+async def handle_close(closer: discord.User, target: discord.TextChannel, is_prefix: bool = False, interaction: Optional[discord.Interaction] = None, ctx: Optional[commands.Context] = None):
+    """Shared logic for closing tickets: acknowledge and lock right away, finish as a background job."""
+    if interaction is not None:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+    # the prefix command may run inside the channel being deleted; its final status goes nowhere then
+    report = main.job_reporter(interaction=interaction, channel=ctx.channel if is_prefix and ctx else None)
+
+    async def run(report):
+        await complete_close(closer, target)
+        if not (is_prefix and ctx and ctx.channel.id == target.id):
+            await report("Ticket closed successfully.")
+
+    await main.queue_close(target, "close", run, report)
+
+
+async def complete_close(closer: discord.User, target: discord.TextChannel):
+    """The slow half of a manual close: queue the buyer's DM, record the sale, archive and delete."""
+    # Find user and ticket amount
+    ticket_amount = 0.0
+    uid_found = None
+    found = main.ticket_store.find(target.id)
+    if found:
+        uid_found, ticket = found
+        ticket_amount = ticket.total_cost
+
+    # DM user (delivered by the outbox; the close doesn't wait for it)
+    if uid_found:
+        dm_message = (
+            "✅ **This transaction has been completed!**\n\n"
+            "It has been a pleasure doing business with you! "
+            "Feel free to vouch 💖\n\n"
+            "**HOW TO VOUCH:**\n"
+            "➡️ [Go to the vouch channel](https://discord.com/channels/945694600377552916/965514182986452992)\n\n"
+            "**Be very detailed on your vouches to Shiba!**\n\n"
+            "__Example:__\n"
+            "+Vouch <@1183784957232029742> (items) (price) (your feedback) (photo/proof)\n\n"
+            "+Vouch <@1183784957232029742> 20,000 Robux via Group Payout, 110$! Very Fast. "
+            "(Attached an image/photo)\n\n"
+            "📌 **Please follow the exact format including the '+' as it registers to a bot.**"
+        )
+        embed = discord.Embed(
+            title="Transaction Completed 🎉",
+            description=dm_message,
+            color=discord.Color.green()
+        )
+        main.dm_outbox.enqueue(int(uid_found), "completed", target.id, embed=embed)
+
+    # Update accounting
+    if ticket_amount > 0 and uid_found:
+        main.record_sale(ticket)
+
+    # Close ticket
+    await main.close_ticket(target, closer, reason="Manual close", paid=bool(ticket_amount > 0 and uid_found))
+
+@app_commands.command(name="close", description="Close a ticket (staff only). If no channel provided, will attempt to close current channel.")
+@app_commands.describe(channel="The ticket channel to close (optional)")
+async def slash_close(interaction: discord.Interaction, channel: Optional[discord.TextChannel] = None):
+    member = interaction.user
+    if not isinstance(member, discord.Member):
+        await interaction.response.send_message("This command must be run in a server.", ephemeral=True)
+        return
+
+    has_support = main.has_support_role(member)
+    if not (main.is_admin_member(member) or has_support):
+        await interaction.response.send_message("You don't have permission to close tickets.", ephemeral=True)
+        return
+
+    target = channel or interaction.channel
+    if not isinstance(target, discord.TextChannel):
+        await interaction.response.send_message("Please provide a valid channel or run this command inside the ticket channel.", ephemeral=True)
+        return
+
+    await handle_close(member, target, is_prefix=False, interaction=interaction)
+
+# ---------------------------
+# Prefix ?close command
+# ---------------------------
+@commands.command(name="close")
+async def prefix_close(ctx: commands.Context, channel: Optional[discord.TextChannel] = None):
+    member = ctx.author
+    if not isinstance(member, discord.Member):
+        await ctx.send("This command must be run in a server.")
+        return
+
+    has_support = main.has_support_role(member)
+    if not (main.is_admin_member(member) or has_support):
+        await ctx.send("You don't have permission to close tickets.")
+        return
+
+    target = channel or ctx.channel
+    if not isinstance(target, discord.TextChannel):
+        await ctx.send("Please provide a valid channel or run this command inside the ticket channel.")
+        return
+
+    await handle_close(member, target, is_prefix=True, ctx=ctx)
+
+
+# ---------------------------
+# on_message listener: ticket activity and stage, sticky reposts
+# ---------------------------
+async def on_message(message: discord.Message):
+    # update ticket last_activity if owner posts in their ticket channel
+    if message.author.bot:
+        return
+    chan = message.channel
+    # Remove from pending auto-closes if someone sends a message
+    main.pending_auto_closes.pop(chan.id, None)
+    # check if this channel is a ticket channel in the ticket store
+    found = main.ticket_store.find(chan.id)
+    if found:
+        uid, ticket = found
+        # if author is the ticket owner, also clear the inactivity warning
+        if int(uid) == message.author.id:
+            main.ticket_store.update(chan.id, last_activity=time.time(), warned=False, warn_time=None)
+        # a staff reply to a new ticket means someone picked it up; it waits on the payment check from here
+        elif ticket.stage == "new" and isinstance(message.author, discord.Member) and (main.is_admin_member(message.author) or main.has_support_role(message.author)):
+            main.ticket_store.update(chan.id, last_activity=time.time(), stage="payment", stage_since=time.time())
+        # also update if support replies? spec said track messages by ticket owner; but let's update last_activity on any new messages in ticket channel
+        else:
+            main.ticket_store.update(chan.id, last_activity=time.time())
+        main.save_tickets()
+
+    # Sticky messages
+    ch_id = str(chan.id)
+    if ch_id in main.sticky_messages:
+        # Cancel existing task
+        if ch_id in main.sticky_tasks:
+            main.sticky_tasks[ch_id].cancel()
+        # Create new task
+        async def send_sticky():
+            main.rest_priority.set(main.REST_BACKGROUND)
+            await asyncio.sleep(3)  # Delay before sending sticky message
+            try:
+                # Delete old sticky message if exists
+                if ch_id in main.sticky_message_ids:
+                    try:
+                        old_msg = await chan.fetch_message(main.sticky_message_ids[ch_id])
+                        await old_msg.delete()
+                    except Exception:
+                        pass
+                # Send new sticky message
+                msg = await chan.send(main.sticky_messages[ch_id])
+                main.sticky_message_ids[ch_id] = msg.id
+                main.write_json(main.STICKY_IDS_JSON, main.sticky_message_ids)
+            except Exception as e:
+                main.sticky_log.warning("Failed to send sticky: %s", e, extra={"channel": chan.id})
+            main.sticky_tasks.pop(ch_id, None)
+        task = asyncio.create_task(send_sticky())
+        main.sticky_tasks[ch_id] = task
+
+
+# ---------------------------
+# /confirm-payment
+# ---------------------------
+@app_commands.command(name="confirm-payment", description="Confirm the payment and move ticket to proper category")
+async def slash_conf(interaction: discord.Interaction):
+    await handle_confirmation(interaction.user, interaction.channel, is_prefix=False, interaction=interaction)
+
+@commands.command(name="confirm-payment")
+async def prefix_conf(ctx: commands.Context):
+    await handle_confirmation(ctx.author, ctx.channel, is_prefix=True)
+
+
+async def handle_confirmation(user, channel, is_prefix=False, interaction=None):
+    """Handles moving the ticket and sending the right embed"""
+    report = main.job_reporter(interaction=interaction if not is_prefix else None, channel=channel if is_prefix else None)
+    found = main.ticket_store.find(channel.id)
+    ticket = found[1] if found else None
+
+    if not ticket:
+        await report("This is not a valid ticket channel.")
+        return
+
+    robux_type = ticket.subtype
+
+    # Check staff permission
+    if isinstance(user, discord.Member):
+        if not (main.is_admin_member(user) or main.has_support_role(user)):
+            await report("You do not have permission to confirm tickets.")
+            return
+
+    # Determine new category and embed content
+    category_id = None
+    embed = None
+    if robux_type == "ingame":
+        # in-game tickets get a plain ".igg" message instead of an embed
+        category_id = main.guild_config(channel.guild.id).needs_category_ids["ingame"]
+    elif robux_type == "groupfunds":
+        category_id = main.guild_config(channel.guild.id).needs_category_ids["groupfunds"]
+        embed = discord.Embed(
+            title="Group Funds Details Required",
+            description=(
+                "Please provide us with the following:\n\n"
+                "(Username) - (Amount) - Group Funds\n\n"
+                "**Example:**\n`xAriefyk - 1000 - Group Funds`\n"
+                "FOLLOW THE EXAMPLE CLOSELY"
+            ),
+            color=discord.Color.blue()
+        )
+    elif robux_type == "gamepass":
+        category_id = main.guild_config(channel.guild.id).needs_category_ids["gamepass"]
+        embed = discord.Embed(
+            title="Gamepass Purchase Details Required",
+            description=(
+                "Please send the following:\n\n"
+                "• Gamepass link(s)\n"
+                "• Price of each gamepass\n"
+                "• Example:\n"
+                "https://www.roblox.com/game-pass/1016516725/unnamed\n"
+                "44286"
+            ),
+            color=discord.Color.green()
+        )
+    else:
+        await report("Robux type not found in this ticket.")
+        return
+
+    if not is_prefix and interaction:
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+    # Move the channel in the background; channel edits can wait out rate limits
+    async def move(report):
+        new_category = main.bot.get_channel(category_id)
+        if not new_category:
+            await report("Error: target category not found.")
+            return
+        await channel.edit(category=new_category)
+        # back in the queue, now for whoever handles this subtype's deliveries
+        if main.ticket_store.update(channel.id, stage=f"needs_{robux_type}", stage_since=time.time(), claimed_by=None):
+            main.save_tickets()
+        if embed is None:
+            await channel.send(".igg")
+        else:
+            await channel.send(embed=embed)
+        if not is_prefix:
+            await report("Ticket confirmed and moved.")
+
+    if not main.job_queue.submit(channel.id, "confirm-payment", move, report):
+        await report("This ticket is already being closed or moved.")
+
+
+# ---------------------------
+# /next: claim from the staff work queue (see main.TicketStore.claim_next)
+# ---------------------------
+@app_commands.command(name="next", description="Claim the next ticket in the work queue (staff only)")
+@app_commands.describe(stage="Only take from this stage (default: paid work first, then payment checks, then new tickets)")
+@app_commands.choices(stage=[app_commands.Choice(name=label, value=key) for key, label in main.TICKET_STAGES.items()])
+async def next_ticket_cmd(interaction: discord.Interaction, stage: Optional[str] = None):
+    member = interaction.user
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
+        return
+    guild_id = interaction.guild_id or main.PRIMARY_GUILD_ID
+    stages = [stage] if stage else list(main.TICKET_STAGES)
+    # claimed tickets whose channel is gone (deleted by hand) are dropped rather than handed out
+    while True:
+        ticket = main.ticket_store.claim_next(guild_id, stages, member.id)
+        if ticket is None or main.bot.get_channel(ticket.channel_id) is not None:
+            break
+        main.ticket_store.remove(ticket.channel_id)
+    if ticket is None:
+        await interaction.response.send_message("Nothing waiting" + (f" in {main.TICKET_STAGES[stage]}." if stage else ". All caught up."), ephemeral=True)
+        return
+    main.save_tickets()
+    depths = main.ticket_store.queue_depths(guild_id)
+    waiting = " • ".join(f"{main.TICKET_STAGES[s]}: {n}" for s, n in depths.items() if n) or "queue empty"
+    await interaction.response.send_message(
+        f"Claimed <#{ticket.channel_id}> for <@{ticket.user_id}> • {(ticket.subtype or ticket.delivery_type).lower()} {ticket.amount:,} R$ "
+        f"(${ticket.total_cost:,.2f}) • opened <t:{int(ticket.created_at)}:R> • now **{main.TICKET_STAGES[ticket.stage]}**\nStill waiting: {waiting}",
+        ephemeral=True,
+    )
+    channel = main.bot.get_channel(ticket.channel_id)
+    try:
+        await channel.send(f"{member.mention} has picked up this ticket.")
+    except discord.HTTPException:
+        pass
+
+
+# ---------------------------
+# /closefail or ?closefail <channel?> staff only
+# ---------------------------
+
+# Slash version
+@app_commands.command(name="close-without-payment", description="Close a ticket without adding money to balance (staff only)")
+@app_commands.describe(channel="The ticket channel to close (optional)")
+async def slash_closefail(interaction: discord.Interaction, channel: Optional[discord.TextChannel] = None):
+    member = interaction.user
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to close tickets.", ephemeral=True)
+        return
+
+    target = channel or interaction.channel
+    if not isinstance(target, discord.TextChannel):
+        await interaction.response.send_message("Please provide a valid channel or run this command inside the ticket channel.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    # Close the ticket with failure logic
+    async def run(report):
+        await main.closefail_ticket(target, closer=member, reason="Manual closefail")
+        await report("Ticket closed without payment.")
+    await main.queue_close(target, "close-without-payment", run, main.job_reporter(interaction=interaction))
+
+# Prefix version
+@commands.command(name="close-without-payment")
+async def prefix_closefail(ctx: commands.Context, channel: Optional[discord.TextChannel] = None):
+    member = ctx.author
+    if not (main.is_admin_member(member) or main.has_support_role(member)):
+        await ctx.send("You don't have permission to close tickets.")
+        return
+
+    target = channel or ctx.channel
+    if not isinstance(target, discord.TextChannel):
+        await ctx.send("Please provide a valid channel or run this command inside the ticket channel.")
+        return
+
+    # Close the ticket with failure logic
+    async def run(report):
+        await main.closefail_ticket(target, closer=member, reason="Manual closefail")
+        if ctx.channel.id != target.id:
+            await report("Ticket closed without payment.")
+    await main.queue_close(target, "close-without-payment", run, main.job_reporter(channel=ctx.channel))
+
+
+# ---------------------------
+# /add-user-to-ticket
+# ---------------------------
+@app_commands.command(name="add-user-to-ticket", description="Add a user to the ticket (staff only).")
+@app_commands.describe(user="The user to add to the ticket")
+async def add_people_cmd(interaction: discord.Interaction, user: discord.User):
+    member = interaction.user
+    if not isinstance(member, discord.Member) or not (main.is_admin_member(member) or main.has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to add users to tickets.", ephemeral=True)
+        return
+
+    channel = interaction.channel
+    if not isinstance(channel, discord.TextChannel):
+        await interaction.response.send_message("This command can only be used in a ticket channel.", ephemeral=True)
+        return
+
+    # Build overwrites for the user
+    overwrites = channel.overwrites_for(user)
+    overwrites.view_channel = True
+    overwrites.send_messages = True
+    await channel.set_permissions(user, overwrite=overwrites)
+
+    await interaction.response.send_message(f"{user.mention} has been added to the ticket.", ephemeral=True)
+
+
+COMMANDS = (ticket_panel, slash_close, slash_conf, next_ticket_cmd, slash_closefail, add_people_cmd)
+PREFIX_COMMANDS = (prefix_close, prefix_conf, prefix_closefail)
+
+
+async def setup(bot: commands.Bot):
+    for view_cls in PERSISTENT_VIEWS:
+        bot.add_view(view_cls())
+    for command in COMMANDS:
+        bot.tree.add_command(command)
+    for command in PREFIX_COMMANDS:
+        bot.add_command(command)
+    # extension listeners are removed again on unload, so a reload never doubles them up
+    bot.add_listener(on_message)
+    bot.add_listener(ensure_ticket_panels, "on_ready")
@@ -0,0 +1,365 @@
+# fakes.py
+# In-memory stand-ins for the discord.py objects main.py touches (guild, channels, members, messages,
+# interactions). Used by bench.py and replay.py to drive the bot's handlers without a token or network.
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+
+import discord
+
+_snowflakes = itertools.count(1_500_000_000_000_000_000)
+
+
+def next_id() -> int:
+    return next(_snowflakes)
+
+
+class FakeREST:
+    """Counts simulated REST calls and optionally adds latency to each one."""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+
+
+class FakeRole:
+    def __init__(self, id: int, name: str):
+        self.id = id
+        self.name = name
+
+    @property
+    def mention(self) -> str:
+        return f"<@&{self.id}>"
+
+    def __repr__(self):
+        return f"<FakeRole id={self.id} name={self.name!r}>"
+
+
+class FakeUser:
+    def __init__(self, rest: FakeREST, id: int, name: str, bot: bool = False):
+        self._rest = rest
+        self.id = id
+        self.name = name
+        self.bot = bot
+        self.dms: List[Dict[str, Any]] = []
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    @property
+    def display_name(self) -> str:
+        return self.name
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await self._rest.call()
+        self.dms.append({"content": content, **kwargs})
+
+
+class FakeMember(FakeUser):
+    def __init__(self, rest: FakeREST, guild: "FakeGuild", id: int, name: str, roles: Optional[List[FakeRole]] = None, bot: bool = False):
+        super().__init__(rest, id, name, bot=bot)
+        self.guild = guild
+        self.roles: List[FakeRole] = roles or []
+
+    async def add_roles(self, *roles: FakeRole, reason: Optional[str] = None):
+        await self._rest.call()
+        for role in roles:
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles: FakeRole, reason: Optional[str] = None):
+        await self._rest.call()
+        self.roles = [r for r in self.roles if r not in roles]
+
+
+class FakeAttachment:
+    def __init__(self, url: str):
+        self.url = url
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", author: FakeUser, content: str = "", embeds: Optional[List[discord.Embed]] = None, created_at: Optional[datetime] = None):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = embeds or []
+        self.attachments: List[FakeAttachment] = []
+        self.created_at = created_at or datetime.now(timezone.utc)
+        # commands.Context reads the connection state off the message
+        self._state = channel.guild._state
+
+    async def delete(self):
+        await self.channel._rest.call()
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeChannel:
+    def __init__(self, rest: FakeREST, guild: "FakeGuild", id: int, name: str, category_id: Optional[int] = None, topic: Optional[str] = None):
+        self._rest = rest
+        self.guild = guild
+        self.id = id
+        self.name = name
+        self.category_id = category_id
+        self.topic = topic
+        self.messages: Dict[int, FakeMessage] = {}
+        self.overwrites: Dict[Any, Any] = {}
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    @property
+    def category(self):
+        return self.guild.get_channel(self.category_id) if self.category_id else None
+
+    def __str__(self):
+        return self.name
+
+    def add_history(self, author: FakeUser, content: str, created_at: Optional[datetime] = None) -> FakeMessage:
+        msg = FakeMessage(self, author, content, created_at=created_at)
+        self.messages[msg.id] = msg
+        return msg
+
+    async def send(self, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None, embeds: Optional[List[discord.Embed]] = None, **kwargs) -> FakeMessage:
+        await self._rest.call()
+        msg = FakeMessage(self, self.guild.me, content or "", embeds=embeds or ([embed] if embed else []))
+        self.messages[msg.id] = msg
+        return msg
+
+    async def fetch_message(self, id: int) -> FakeMessage:
+        await self._rest.call()
+        msg = self.messages.get(id)
+        if msg is None:
+            raise discord.NotFound(FakeHTTPResponse(404), "Unknown Message")
+        return msg
+
+    async def history(self, limit: Optional[int] = 100, oldest_first: bool = False):
+        msgs = list(self.messages.values())
+        if not oldest_first:
+            msgs.reverse()
+        if limit is not None:
+            msgs = msgs[:limit]
+        # Discord pages history 100 messages per request
+        for i, msg in enumerate(msgs):
+            if i % 100 == 0:
+                await self._rest.call()
+            yield msg
+
+    async def delete(self, reason: Optional[str] = None):
+        await self._rest.call()
+        self.guild._channels.pop(self.id, None)
+
+    async def edit(self, *, category: Optional["FakeCategory"] = None, overwrites: Optional[Dict[Any, Any]] = None, **kwargs):
+        await self._rest.call()
+        if category is not None:
+            self.category_id = category.id
+        if overwrites is not None:
+            self.overwrites = dict(overwrites)
+
+    def overwrites_for(self, obj) -> discord.PermissionOverwrite:
+        return self.overwrites.get(obj, discord.PermissionOverwrite())
+
+    async def set_permissions(self, target, *, overwrite: Optional[discord.PermissionOverwrite] = None, **kwargs):
+        await self._rest.call()
+        self.overwrites[target] = overwrite
+
+
+class FakeCategory:
+    def __init__(self, guild: "FakeGuild", id: int, name: str):
+        self.guild = guild
+        self.id = id
+        self.name = name
+
+    @property
+    def text_channels(self) -> List[FakeChannel]:
+        # Same shape as discord.py: a scan over every guild channel
+        return [c for c in self.guild.channels if isinstance(c, FakeChannel) and c.category_id == self.id]
+
+
+class FakeHTTPResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "Fake"
+
+
+class FakeGuild:
+    def __init__(self, rest: FakeREST, state, id: int, name: str = "Bench Guild"):
+        self._rest = rest
+        self._state = state
+        self.id = id
+        self.name = name
+        self._channels: Dict[int, Any] = {}
+        self._members: Dict[int, FakeMember] = {}
+        self._roles: Dict[int, FakeRole] = {}
+        self.default_role = self.add_role(id, "@everyone")
+        self.me: Optional[FakeMember] = None
+
+    @property
+    def channels(self) -> List[Any]:
+        return list(self._channels.values())
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    def add_role(self, id: int, name: str) -> FakeRole:
+        role = FakeRole(id, name)
+        self._roles[id] = role
+        return role
+
+    def add_member(self, id: int, name: str, roles: Optional[List[FakeRole]] = None, bot: bool = False) -> FakeMember:
+        member = FakeMember(self._rest, self, id, name, roles=roles, bot=bot)
+        self._members[id] = member
+        return member
+
+    def add_category(self, id: int, name: str) -> FakeCategory:
+        cat = FakeCategory(self, id, name)
+        self._channels[id] = cat
+        return cat
+
+    def add_text_channel(self, id: int, name: str, category_id: Optional[int] = None) -> FakeChannel:
+        chan = FakeChannel(self._rest, self, id, name, category_id=category_id)
+        self._channels[id] = chan
+        return chan
+
+    def get_channel(self, id: int):
+        return self._channels.get(id)
+
+    def _resolve_channel(self, id: int):
+        return self._channels.get(id)
+
+    def get_member(self, id: int) -> Optional[FakeMember]:
+        return self._members.get(id)
+
+    def get_role(self, id: int) -> Optional[FakeRole]:
+        return self._roles.get(id)
+
+    async def fetch_member(self, id: int) -> FakeMember:
+        await self._rest.call()
+        member = self._members.get(id)
+        if member is None:
+            raise discord.NotFound(FakeHTTPResponse(404), "Unknown Member")
+        return member
+
+    async def query_members(self, query: Optional[str] = None, *, limit: int = 5, user_ids: Optional[List[int]] = None, cache: bool = True, **kwargs) -> List[FakeMember]:
+        # A gateway request rather than REST on real Discord, but it costs a round trip all the same
+        await self._rest.call()
+        if user_ids is not None:
+            return [self._members[uid] for uid in user_ids if uid in self._members]
+        query = (query or "").lower()
+        return [m for m in self._members.values() if m.name.lower().startswith(query)][:limit]
+
+    async def create_text_channel(self, name: str, *, overwrites=None, category: Optional[FakeCategory] = None, topic: Optional[str] = None, **kwargs) -> FakeChannel:
+        await self._rest.call()
+        chan = self.add_text_channel(next_id(), name, category_id=category.id if category else None)
+        chan.topic = topic
+        chan.overwrites = dict(overwrites or {})
+        return chan
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+        self.sent: List[Dict[str, Any]] = []
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content: Optional[str] = None, **kwargs):
+        await self._interaction._rest.call()
+        self._done = True
+        self.sent.append({"content": content, **kwargs})
+
+    async def defer(self, **kwargs):
+        await self._interaction._rest.call()
+        self._done = True
+
+    async def send_modal(self, modal):
+        await self._interaction._rest.call()
+        self._done = True
+        self.sent.append({"modal": modal})
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self.sent: List[Dict[str, Any]] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        await self._interaction._rest.call()
+        self.sent.append({"content": content, **kwargs})
+
+
+class FakeInteraction:
+    def __init__(self, rest: FakeREST, user: FakeMember, channel: Optional[FakeChannel] = None):
+        self._rest = rest
+        self.id = next_id()
+        self.user = user
+        self.guild = user.guild
+        self.guild_id = user.guild.id
+        self.channel = channel
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+
+class FakeWorld:
+    """A single fake guild wired into a real commands.Bot, so bot.get_channel / bot.guilds / bot.user resolve to fakes."""
+    def __init__(self, bot, guild_id: int, latency: float = 0.0):
+        self.bot = bot
+        self.rest = FakeREST(latency)
+        state = bot._connection
+        self.guild = FakeGuild(self.rest, state, guild_id)
+        self.bot_member = self.guild.add_member(next_id(), "bench-bot", bot=True)
+        self.guild.me = self.bot_member
+        self.users: Dict[int, FakeUser] = {}
+
+        state._guilds.clear()
+        state._guilds[guild_id] = self.guild
+        state.user = self.bot_member
+        # REST lookups that would otherwise hit Discord
+        bot.fetch_user = self.fetch_user
+        bot.fetch_channel = self.fetch_channel
+
+    def add_bot_layout(self, main) -> FakeRole:
+        """Create the categories, log channel and roles main.py's config for this guild refers to. Returns the support role."""
+        guild = self.guild
+        config = main.guild_config(guild.id)
+        for key, raw in config.category_ids.items():
+            for cid in (raw if isinstance(raw, (list, tuple)) else [raw]):
+                if not guild.get_channel(cid):
+                    guild.add_category(cid, key)
+        for cid in config.needs_category_ids.values():
+            if not guild.get_channel(cid):
+                guild.add_category(cid, f"needs-{cid}")
+        guild.add_text_channel(config.log_channel_id, "ticket-logs")
+        for _, role_id in config.role_thresholds:
+            guild.add_role(role_id, f"spender-{role_id}")
+        return guild.add_role(config.support_role_id, "Support")
+
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        await self.rest.call()
+        user = self.guild.get_member(user_id) or self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = FakeUser(self.rest, user_id, f"user{user_id % 100000}")
+        return user
+
+    async def fetch_channel(self, channel_id: int):
+        await self.rest.call()
+        chan = self.guild.get_channel(channel_id)
+        if chan is None:
+            raise discord.NotFound(FakeHTTPResponse(404), "Unknown Channel")
+        return chan
@@ -1,4 +1,11 @@
 # main.py
+if __name__ == "__main__":
+    # Started as a script: run the bot from the module "main" instead, so this file executes once and the
+    # extensions' "import main" gets the module that holds the running state rather than a second copy
+    import main
+    main.run()
+    raise SystemExit
+
 from dotenv import load_dotenv
 import os
 
@@ -9,20 +16,154 @@ except:
     load_dotenv()  # Local .env
 
 TOKEN = os.getenv("TOKEN")
-print("Loaded TOKEN:", TOKEN)  # temporary debug line
 
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
-from discord.ui import View, Select, Button, Modal, TextInput
+from discord.ui import View, Modal, TextInput
 import json
 import asyncio
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from typing import Optional, Dict, Any, List
 import aiohttp
+import yarl
 import sys
 import io
-import subprocess
+import array
+import csv
+import stat
+import tempfile
+import dataclasses
+import weakref
+from dataclasses import dataclass
+import cProfile
+import pstats
+import marshal
+import threading
+import tracemalloc
+import gc
+import atexit
+import gzip
+import hashlib
+import re
+import time
+import socket
+import sqlite3
+import contextlib
+import concurrent.futures
+import contextvars
+import bisect
+import heapq
+import logging
+import logging.handlers
+import queue
+from collections import Counter, deque
+
+# ---------------------------
+# Logging: structured JSON lines, written off the event loop
+# ---------------------------
+# Loggers only put records on a bounded queue; a listener thread formats them and does the file and
+# console I/O, so log volume never stalls a handler (if the listener falls LOG_QUEUE_SIZE records behind,
+# new records are dropped and counted). The file gets one JSON object per line, carrying LOG_FIELDS when
+# a call passes them: log.warning("...", extra={"channel": channel.id, "user": user.id}).
+# LOG_LEVELS sets per-logger levels ("xts.git=WARNING,discord.gateway=ERROR"). The file rotates at
+# LOG_MAX_BYTES, or on a schedule when LOG_ROTATE_WHEN is set (midnight, h, ...; see TimedRotatingFileHandler).
+LOG_FILE = os.getenv("LOG_FILE", "bot.log.jsonl")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "xts=INFO,discord=INFO")
+LOG_CONSOLE_LEVEL = os.getenv("LOG_CONSOLE_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# a ticket is identified by its channel id
+LOG_FIELDS = ("guild", "channel", "user", "shard", "job", "path")
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in LOG_FIELDS:
+            value = record.__dict__.get(field)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the args now, while the objects they refer to are current; the listener does the formatting
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # the stock put_nowait fails on a full queue at shutdown; wait for the listener to make room
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    handlers: List[logging.Handler] = []
+    if LOG_FILE:
+        if LOG_ROTATE_WHEN:
+            file_handler = logging.handlers.TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding="utf-8", delay=True, utc=True)
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8", delay=True)
+        file_handler.setFormatter(JsonLogFormatter())
+        handlers.append(file_handler)
+    # stdout still gets a readable line per record (systemd and update.log capture it)
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(LOG_CONSOLE_LEVEL)
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handlers.append(console)
+
+    listener = LogListener(queue.Queue(LOG_QUEUE_SIZE), *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(listener.queue)]
+    root.setLevel(logging.WARNING)
+    for item in LOG_LEVELS.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            logging.getLogger(name).setLevel(level.strip().upper())
+    listener.start()
+    # registered before the state writer's close, so it runs after it and still catches its errors
+    atexit.register(listener.stop)
+    return listener
+
+
+log_listener = setup_logging()
+log = logging.getLogger("xts")
+state_log = logging.getLogger("xts.state")
+git_log = logging.getLogger("xts.git")
+ticket_log = logging.getLogger("xts.tickets")
+sticky_log = logging.getLogger("xts.sticky")
+shard_log = logging.getLogger("xts.shards")
+job_log = logging.getLogger("xts.jobs")
+dm_log = logging.getLogger("xts.dm")
+
+log.info("TOKEN loaded" if TOKEN else "No TOKEN set")
 
 # ---------------------------
 # Config (from user)
@@ -43,6 +184,316 @@ CATEGORY_IDS = {
 TICKET_PANEL_CHANNEL_ID = 1241428048260366438
 BOOT_TIME = None
 
+# Set GIT_SYNC=0 to stop state files being committed and pushed on every write (local testing / benchmarks)
+GIT_SYNC = os.getenv("GIT_SYNC", "1") != "0"
+
+# ---------------------------
+# Storage codec: compact encoding + atomic writes for state files
+# ---------------------------
+# STATE_CODEC=json (default) writes compact JSON, through orjson when it's installed.
+# STATE_CODEC=msgpack writes msgpack (needs the msgpack package). Reads detect the format of each file,
+# so switching codecs needs no migration; /export-state gives a pretty-printed copy for humans.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+STATE_CODEC = os.getenv("STATE_CODEC", "json").lower()
+if STATE_CODEC == "msgpack" and msgpack is None:
+    state_log.warning("STATE_CODEC=msgpack but msgpack isn't installed, using json")
+    STATE_CODEC = "json"
+# Set STATE_FSYNC=0 to skip fsync on writes (benchmarks, throwaway test dirs)
+STATE_FSYNC = os.getenv("STATE_FSYNC", "1") != "0"
+
+
+def encode_state(data: Any) -> bytes:
+    if STATE_CODEC == "msgpack":
+        return msgpack.packb(data, default=str)
+    if orjson is not None:
+        # passthrough keeps datetimes going through default=str, so output matches the stdlib path
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, separators=(",", ":"), default=str, ensure_ascii=False).encode("utf-8")
+
+
+def decode_state(raw: bytes) -> Any:
+    stripped = raw.lstrip()
+    if not stripped:
+        return {}
+    if stripped[:1] in (b"{", b"["):
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    if msgpack is None:
+        raise ValueError("file isn't JSON and msgpack isn't installed to read it")
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+def write_atomic(path: str, payload: bytes):
+    """Write to a temp file in the same directory, fsync, then rename over the target."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            if STATE_FSYNC:
+                os.fsync(f.fileno())
+        # mkstemp creates 0600 files; keep the target's mode
+        os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if STATE_FSYNC and os.name == "posix":
+        # persist the rename itself
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# ---------------------------
+# State writer: disk I/O off the event loop
+# ---------------------------
+# State files are encoded on the caller's thread (a snapshot of the data at that moment) and written by one
+# background thread. Writes to the same file are coalesced and always land in submission order; every
+# submit returns a future that resolves once the file (or a later version of it) is on disk. The last
+# content submitted or read for each file is kept in memory, so reads never wait on the disk either.
+# Other blocking work that must stay ordered with those writes (analytics and history files) goes
+# through call() and runs on the same thread.
+class StateWriter:
+    def __init__(self):
+        self._cond = threading.Condition()
+        # paths waiting to be written, and callables, in submission order
+        self._queue: deque = deque()
+        self._pending: Dict[str, tuple] = {}
+        self._cache: Dict[str, bytes] = {}
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def on_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, path: str, payload: bytes) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        with self._cond:
+            self._cache[path] = payload
+            queued = self._pending.get(path)
+            if queued is None:
+                self._pending[path] = (payload, [future])
+                self._queue.append(path)
+            else:
+                # not written yet: only the newest version needs to reach the disk
+                self._pending[path] = (payload, queued[1] + [future])
+            self._cond.notify()
+        return future
+
+    def write(self, path: str, payload: bytes) -> concurrent.futures.Future:
+        if not self.on_writer_thread():
+            return self.submit(path, payload)
+        # already on the writer thread (inside call()): write now, unless an older version is still
+        # queued, in which case replacing it keeps the order
+        future = concurrent.futures.Future()
+        with self._cond:
+            self._cache[path] = payload
+            queued = self._pending.get(path)
+            if queued is not None:
+                self._pending[path] = (payload, queued[1] + [future])
+                return future
+        write_atomic(path, payload)
+        future.set_result(None)
+        return future
+
+    def call(self, fn) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        if self.on_writer_thread():
+            future.set_result(fn())
+            return future
+        with self._cond:
+            self._queue.append((fn, future))
+            self._cond.notify()
+        return future
+
+    async def run(self, fn) -> Any:
+        """Run fn on the writer thread after everything queued before it, and return its result."""
+        return await asyncio.wrap_future(self.call(fn))
+
+    def cached(self, path: str) -> Optional[bytes]:
+        with self._cond:
+            return self._cache.get(path)
+
+    def remember(self, path: str, raw: bytes):
+        with self._cond:
+            self._cache.setdefault(path, raw)
+
+    def invalidate(self, path: Optional[str] = None):
+        """Forget cached content (all of it by default) after something outside the bot changed the files."""
+        with self._cond:
+            if path is None:
+                self._cache = {p: self._pending[p][0] for p in self._pending}
+            elif path not in self._pending:
+                self._cache.pop(path, None)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything submitted so far is written. Not for use on the event loop; await drain()."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    async def drain(self):
+        await self.run(lambda: None)
+
+    def close(self):
+        self.flush(timeout=30)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                if isinstance(item, str):
+                    payload, futures = self._pending.pop(item)
+                self._busy = True
+            try:
+                if isinstance(item, str):
+                    try:
+                        write_atomic(item, payload)
+                    except Exception as e:
+                        state_log.error("Failed to write %s: %s", item, e, extra={"path": item})
+                        for future in futures:
+                            future.set_exception(e)
+                    else:
+                        for future in futures:
+                            future.set_result(None)
+                else:
+                    fn, future = item
+                    try:
+                        future.set_result(fn())
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+state_writer = StateWriter()
+atexit.register(state_writer.close)
+
+
+def read_json(path: str) -> Any:
+    raw = state_writer.cached(path)
+    if raw is None:
+        if not os.path.exists(path):
+            return {}
+        with open(path, "rb") as f:
+            raw = f.read()
+    try:
+        data = decode_state(raw)
+    except Exception as e:
+        # Keep the unreadable file for recovery instead of letting the next write replace it
+        corrupt_path = f"{path}.corrupt-{int(time.time())}"
+        state_log.error("Failed to read %s (%s); moved it to %s", path, e, corrupt_path, extra={"path": path})
+        try:
+            os.replace(path, corrupt_path)
+        except OSError:
+            pass
+        return {}
+    state_writer.remember(path, raw)
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def state_exists(path: str) -> bool:
+    return state_writer.cached(path) is not None or os.path.exists(path)
+
+
+def write_state(path: str, data: Any) -> concurrent.futures.Future:
+    """Atomically write a state file with the configured codec (no git sync; see write_json).
+    Returns once the data is encoded; the future resolves when it's on disk."""
+    return state_writer.write(path, encode_state(data))
+
+
+# ---------------------------
+# Per-guild configuration and state paths
+# ---------------------------
+# The config constants (plus NEEDS_*_ID and ROLE_THRESHOLDS further down) describe the primary storefront
+# guild. Any other guild reads guilds/<guild_id>/config.json the first time it's needed, and keys it
+# leaves out fall back to the primary guild's values. Per-guild state lives next to it
+# (guilds/<guild_id>/accounting.json, analytics/, history/); the primary guild keeps the top-level files.
+PRIMARY_GUILD_ID = int(os.getenv("PRIMARY_GUILD_ID", "945694600377552916"))
+GUILD_DATA_DIR = "guilds"
+
+
+@dataclass(slots=True, frozen=True)
+class GuildConfig:
+    admin_role_ids: tuple
+    support_role_id: int
+    log_channel_id: int
+    category_ids: Dict[str, Any]        # CATEGORY_IDS layout
+    ticket_panel_channel_id: int
+    needs_category_ids: Dict[str, int]  # subtype -> category a confirmed ticket moves to
+    role_thresholds: tuple              # ((min spent, role id), ...), highest first
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], base: "GuildConfig") -> "GuildConfig":
+        return cls(
+            admin_role_ids=tuple(int(r) for r in data.get("admin_role_ids", base.admin_role_ids)),
+            support_role_id=int(data.get("support_role_id", base.support_role_id)),
+            log_channel_id=int(data.get("log_channel_id", base.log_channel_id)),
+            category_ids=data.get("category_ids", base.category_ids),
+            ticket_panel_channel_id=int(data.get("ticket_panel_channel_id", base.ticket_panel_channel_id)),
+            needs_category_ids={k: int(v) for k, v in data.get("needs_category_ids", base.needs_category_ids).items()},
+            role_thresholds=tuple((float(t), int(r)) for t, r in data.get("role_thresholds", base.role_thresholds)),
+        )
+
+
+_guild_configs: Dict[int, GuildConfig] = {}
+
+
+def guild_path(guild_id: Optional[int], name: str) -> str:
+    """Where a guild keeps a state file or directory; the primary guild (or None) uses the top level."""
+    if not guild_id or guild_id == PRIMARY_GUILD_ID:
+        return name
+    return os.path.join(GUILD_DATA_DIR, str(guild_id), name)
+
+
+def guild_config(guild_id: Optional[int]) -> GuildConfig:
+    guild_id = guild_id or PRIMARY_GUILD_ID
+    config = _guild_configs.get(guild_id)
+    if config is None:
+        primary = GuildConfig(
+            admin_role_ids=tuple(ADMIN_ROLE_IDS),
+            support_role_id=SUPPORT_ROLE_ID,
+            log_channel_id=LOG_CHANNEL_ID,
+            category_ids=CATEGORY_IDS,
+            ticket_panel_channel_id=TICKET_PANEL_CHANNEL_ID,
+            needs_category_ids={"ingame": NEEDS_IGG_ID, "groupfunds": NEEDS_GF_ID, "gamepass": NEEDS_GP_ID},
+            role_thresholds=tuple(ROLE_THRESHOLDS),
+        )
+        overrides = read_json(os.path.join(GUILD_DATA_DIR, str(guild_id), "config.json"))
+        config = _guild_configs[guild_id] = GuildConfig.from_dict(overrides, primary)
+    return config
+
+
+def member_guild_config(member: Any) -> GuildConfig:
+    guild = getattr(member, "guild", None)
+    return guild_config(guild.id if guild is not None else None)
+
+
 PRICES = {"gamepass": 4.75, "groupfunds": 6.25, "ingame": 4.8}
 
 # persistable prices file
@@ -60,7 +511,7 @@ def write_prices():
     try:
         write_json(PRICES_PATH, PRICES)
     except Exception as e:
-        print("Failed to write prices:", e)
+        state_log.error("Failed to write prices: %s", e)
 
 PAYMENT_FEES = {
     "binance": 0,
@@ -90,7 +541,7 @@ def write_payment_fees():
     try:
         write_json(PAYMENT_FEES_PATH, PAYMENT_FEES)
     except Exception as e:
-        print("Failed to write payment fees:", e)
+        state_log.error("Failed to write payment fees: %s", e)
 
 
 PAYMENT_JSON = "payment_info.json"
@@ -104,28 +555,17 @@ ACCOUNTING_JSON = "accounting.json"
 # ---------------------------
 # Helper functions for JSON
 # ---------------------------
-def read_json(path: str) -> Any:
-    if not os.path.exists(path):
-        return {}
-    with open(path, "r", encoding="utf-8") as f:
-        try:
-            data = json.load(f)
-            if not isinstance(data, dict):
-                return {}
-            return data
-        except json.JSONDecodeError:
-            return {}
-
 def write_json(path: str, data: Any):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, default=str)
+    written = write_state(path, data)
     # Commit immediately after writing important JSON files
-    if path in [TICKET_JSON, ACCOUNTING_JSON, PRICES_PATH, PAYMENT_FEES_PATH, PAYMENT_JSON, STICKY_JSON, STICKY_IDS_JSON, PENDING_CLOSES_JSON]:
-        asyncio.create_task(push_file_to_git(path))
+    if GIT_SYNC and path in [TICKET_JSON, ACCOUNTING_JSON, PRICES_PATH, PAYMENT_FEES_PATH, PAYMENT_JSON, STICKY_JSON, STICKY_IDS_JSON, PENDING_CLOSES_JSON]:
+        asyncio.create_task(push_file_to_git(path, written))
 
-async def push_file_to_git(filename: str):
+async def push_file_to_git(filename: str, written: Optional[concurrent.futures.Future] = None):
     try:
-        print(f"Attempting to push {filename} to git")
+        if written is not None:
+            await asyncio.wrap_future(written)
+        git_log.debug("Attempting to push %s to git", filename, extra={"path": filename})
         # Run git commands asynchronously
         process = await asyncio.create_subprocess_shell(
             f"git add {filename}",
@@ -135,7 +575,7 @@ async def push_file_to_git(filename: str):
         )
         await process.wait()
         if process.returncode != 0:
-            print(f"Git add failed for {filename}: {process.returncode}")
+            git_log.warning("Git add failed for %s: %s", filename, process.returncode, extra={"path": filename})
             return
 
         process = await asyncio.create_subprocess_shell(
@@ -155,35 +595,32 @@ async def push_file_to_git(filename: str):
             )
             await process.wait()
             if process.returncode == 0:
-                print(f"Successfully pushed {filename} to git")
+                git_log.info("Pushed %s to git", filename, extra={"path": filename})
             else:
-                print(f"Git push failed for {filename}: {process.returncode}")
+                git_log.warning("Git push failed for %s: %s", filename, process.returncode, extra={"path": filename})
         elif "nothing to commit" in (await process.stdout.read()).decode():
-            print(f"No changes to commit for {filename}")
+            git_log.debug("No changes to commit for %s", filename, extra={"path": filename})
         else:
-            print(f"Git commit failed for {filename}: {process.returncode}")
-    except Exception as e:
-        print(f"Error pushing {filename} to git: {e}")
+            git_log.warning("Git commit failed for %s: %s", filename, process.returncode, extra={"path": filename})
+    except Exception:
+        git_log.exception("Error pushing %s to git", filename, extra={"path": filename})
 
 async def pull_tickets_from_git():
+    if shared_state is not None or not GIT_SYNC:
+        return  # sharded processes keep tickets in the shared store, not in git
     try:
-        subprocess.run(["git", "pull"], check=True, cwd=os.getcwd())
-        # Reload tickets_data after pull
-        global tickets_data
-        tickets_data = read_json(TICKET_JSON) or {}
-        # Clean invalid entries
-        for uid, user_tickets in list(tickets_data.items()):
-            if not isinstance(user_tickets, list):
-                del tickets_data[uid]
-                continue
-            tickets_data[uid] = [t for t in user_tickets if isinstance(t, dict)]
-            if not tickets_data[uid]:
-                del tickets_data[uid]
-        write_json(TICKET_JSON, tickets_data)
-    except subprocess.CalledProcessError as e:
-        print(f"Git pull failed: {e}")
-    except Exception as e:
-        print(f"Error pulling from git: {e}")
+        # let queued writes land first so git sees (and merges) the current files
+        await state_writer.drain()
+        process = await asyncio.create_subprocess_exec("git", "pull", cwd=os.getcwd())
+        if await process.wait() != 0:
+            git_log.warning("Git pull failed: %s", process.returncode)
+            return
+        state_writer.invalidate()
+        # Reload tickets after pull (load_tickets migrates and drops invalid entries)
+        ticket_store.replace_all(await state_writer.run(load_tickets))
+        save_tickets()
+    except Exception:
+        git_log.exception("Error pulling from git")
 
 # Helper for pending closes
 def read_pending_closes():
@@ -216,401 +653,886 @@ if not os.path.exists(STICKY_JSON):
 sticky_messages: Dict[str, str] = read_json(STICKY_JSON) or {}
 sticky_tasks: Dict[str, asyncio.Task] = {}
 sticky_message_ids: Dict[str, int] = read_json(STICKY_IDS_JSON) or {}
+# guild id -> {"channel_id", "message_id"} of the ticket panel the bot posted (see ensure_ticket_panel)
+PANEL_MESSAGES_JSON = "panel_messages.json"
+panel_messages: Dict[str, Dict[str, int]] = read_json(PANEL_MESSAGES_JSON)
 
 # ---------------------------
 # Intents & Bot Setup
 # ---------------------------
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-intents.guilds = True
-
-bot = commands.Bot(command_prefix="!", intents=discord.Intents.all())
-tree = bot.tree
-
-# We'll use a simple in-memory cache for tickets synchronized to tickets.json
-tickets_data: Dict[str, List[Dict[str, Any]]] = read_json(TICKET_JSON) or {}
-
-# Load pending closes
-pending_auto_closes: Dict[int, datetime] = read_pending_closes()
+# MEMORY_PROFILE=full (default) keeps every intent and chunks every guild at startup, as the bot always has.
+# MEMORY_PROFILE=lean is opt-in: it subscribes only to what the ticket flow uses (guilds, roles and channels,
+# guild messages with content, member updates) and doesn't chunk or cache the member list: members are
+# loaded on demand with batched gateway member queries (see MemberResolver). Interaction and message payloads
+# carry the author's roles, so permission checks don't need the cache. It drops every other intent, so in
+# lean mode the bot never sees DM messages (prefix commands sent in DMs go unanswered), presences, voice
+# states, reactions, typing, invites or emoji/sticker, integration, webhook and scheduled-event updates.
+MEMORY_PROFILE = os.getenv("MEMORY_PROFILE", "full").lower()
+# Messages kept in discord.py's message cache (lean profile only; full keeps the library default)
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "100"))
+
+if MEMORY_PROFILE == "lean":
+    intents = discord.Intents.none()
+    intents.guilds = True            # channels, categories, roles
+    intents.guild_messages = True    # ticket activity, sticky messages, prefix commands
+    intents.message_content = True
+    intents.members = True           # needed for member queries and role updates on cached members
+    bot_cache_options = {
+        "chunk_guilds_at_startup": False,
+        # only members we ask for (MemberResolver) are cached, not everyone who joins or talks
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "max_messages": MESSAGE_CACHE_SIZE or None,
+    }
+else:
+    if MEMORY_PROFILE != "full":
+        log.warning("Unknown MEMORY_PROFILE %r, using full", MEMORY_PROFILE)
+        MEMORY_PROFILE = "full"
+    intents = discord.Intents.all()
+    bot_cache_options = {}
+
+# Optional: point the bot at a local mock Discord (see mock_discord.py) instead of discord.com
+DISCORD_API_BASE = os.getenv("DISCORD_API_BASE")
+DISCORD_GATEWAY_URL = os.getenv("DISCORD_GATEWAY_URL")
+if DISCORD_API_BASE:
+    discord.http.Route.BASE = DISCORD_API_BASE.rstrip("/")
+if DISCORD_GATEWAY_URL:
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(DISCORD_GATEWAY_URL)
 
 # ---------------------------
-# Utility: Permissions + Checks
+# Sharding & shared state
 # ---------------------------
-def is_admin_member(member: discord.Member) -> bool:
-    if member is None:
-        return False
-    return any(role.id in ADMIN_ROLE_IDS for role in member.roles)
+# SHARD_COUNT=N runs the bot as an AutoShardedBot with N shards; SHARD_IDS=0,2 makes this process own
+# only those shards, so one process per core can split the guilds between them. Sharded processes keep
+# accounting and open tickets in one SQLite database (SHARED_STATE_DB) instead of the JSON files, and
+# hold a lease per shard: the inactivity and spender-role passes for a shard only run in the process
+# holding its lease, so two processes started on the same shards (e.g. during a deploy) never both act.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()] or None
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", "shared_state.db")
+SHARD_LEASE_TTL = 30  # seconds; renewed every SHARD_LEASE_TTL / 3
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+def shard_for_guild(guild_id: Optional[int]) -> int:
+    # Discord's own shard formula; tickets saved before guild ids were recorded count as shard 0
+    return (guild_id >> 22) % SHARD_COUNT if SHARD_COUNT and guild_id else 0
+
+
+class SharedState:
+    """SQLite store shared by the shard processes: JSON documents, open ticket rows and leases."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        # autocommit mode; transaction() issues BEGIN IMMEDIATE so read-modify-writes are atomic across processes
+        self._db = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS tickets (channel_id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, shard INTEGER NOT NULL, record BLOB NOT NULL);
+            CREATE INDEX IF NOT EXISTS tickets_by_shard ON tickets (shard);
+            CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL);
+        """)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def get_document(self, name: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+        return decode_state(row[0]) if row else None
+
+    def put_document(self, name: str, data: Any):
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)", (name, encode_state(data)))
+
+    def update_document(self, name: str, apply, default=dict) -> Any:
+        """Run apply(data) on the stored document and save the result, all in one transaction."""
+        with self.transaction() as db:
+            row = db.execute("SELECT data FROM documents WHERE name = ?", (name,)).fetchone()
+            data = decode_state(row[0]) if row else default()
+            apply(data)
+            db.execute("INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)", (name, encode_state(data)))
+        return data
+
+    def seed_document(self, name: str, load):
+        """Store load() under name unless the document already exists (first sharded start)."""
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM documents WHERE name = ?", (name,)).fetchone() is None:
+                db.execute("INSERT INTO documents (name, data) VALUES (?, ?)", (name, encode_state(load())))
+
+    def try_lease(self, name: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute("SELECT holder, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != holder and row[1] > now:
+                return False
+            db.execute("INSERT OR REPLACE INTO leases (name, holder, expires) VALUES (?, ?, ?)", (name, holder, now + ttl))
+            return True
+
+    def release_leases(self, holder: str):
+        with self.transaction() as db:
+            db.execute("DELETE FROM leases WHERE holder = ?", (holder,))
+
+    def load_tickets(self, shards: List[int]) -> Dict[str, List["Ticket"]]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT user_id, record FROM tickets WHERE shard IN ({','.join('?' * len(shards))})", shards
+            ).fetchall()
+        tickets: Dict[str, List[Ticket]] = {}
+        for uid, record in rows:
+            tickets.setdefault(uid, []).append(Ticket.from_record(decode_state(record)))
+        return tickets
+
+    def seed_tickets(self, load):
+        """Import tickets.json once, the first time any shard process starts."""
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM documents WHERE name = 'tickets_imported'").fetchone():
+                return
+            rows = [(t.channel_id, uid, shard_for_guild(t.guild_id), encode_state(t.to_record())) for uid, ts in load().items() for t in ts]
+            db.executemany("INSERT OR REPLACE INTO tickets (channel_id, user_id, shard, record) VALUES (?, ?, ?, ?)", rows)
+            db.execute("INSERT INTO documents (name, data) VALUES ('tickets_imported', ?)", (encode_state(time.time()),))
+
+    def sync_tickets(self, previous: Dict[str, tuple], current: Dict[str, tuple]):
+        """Write the difference between two TicketStore snapshots. Unchanged owners are skipped by identity."""
+        upserts, deletes = [], []
+        for uid, tickets in current.items():
+            before = previous.get(uid, ())
+            if before is tickets:
+                continue
+            upserts.extend((t.channel_id, uid, shard_for_guild(t.guild_id), encode_state(t.to_record())) for t in tickets)
+            kept = {t.channel_id for t in tickets}
+            deletes.extend((t.channel_id,) for t in before if t.channel_id not in kept)
+        for uid, tickets in previous.items():
+            if uid not in current:
+                deletes.extend((t.channel_id,) for t in tickets)
+        if not upserts and not deletes:
+            return
+        with self.transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO tickets (channel_id, user_id, shard, record) VALUES (?, ?, ?, ?)", upserts)
+            db.executemany("DELETE FROM tickets WHERE channel_id = ?", deletes)
 
-def payment_fee_for(method: str) -> float:
-    return PAYMENT_FEES.get(method.lower(), 0)
 
-def price_for(subtype: str) -> Optional[float]:
-    return PRICES.get(subtype)
+shared_state = SharedState(SHARED_STATE_DB) if SHARD_COUNT else None
+OWNED_SHARDS = (SHARD_IDS or list(range(SHARD_COUNT))) if SHARD_COUNT else [0]
+# Shards whose lease this process currently holds (always just shard 0 when not sharded)
+led_shards = set() if shared_state is not None else {0}
 
-# ---------------------------
-# Embeds
-# ---------------------------
-def ticket_info_embed(user: discord.User, delivery_type: str, subtype: Optional[str],
-                      payment_method: str, amount: float, total_cost: float,
-                      notes: Optional[str]) -> discord.Embed:
-    embed = discord.Embed(title="Ticket Created", color=discord.Color.blurple(), timestamp=datetime.now(timezone.utc))
-    embed.add_field(name="User", value=f"{user.mention} ({user})", inline=False)
-    embed.add_field(name="Delivery Type", value=delivery_type, inline=True)
-    if subtype:
-        embed.add_field(name="Subtype", value=subtype, inline=True)
-    embed.add_field(name="Payment Method", value=payment_method, inline=True)
-    embed.add_field(name="Amount (Robux)", value=f"{amount:,}", inline=True)
-    embed.add_field(name="Total Cost", value=f"${total_cost:,.2f}", inline=True)
-    if notes:
-        embed.add_field(name="Payment Instructions", value=notes, inline=False)
-    embed.set_footer(text="Support will be with you shortly.")
-    return embed
-
-
-# Helper: choose a category that isn't full (Discord limit ~50 channels per category)
-def select_ticket_category(guild: discord.Guild, key: str) -> Optional[discord.CategoryChannel]:
-    """Given a CATEGORY_IDS key, return the first CategoryChannel in the guild which has
-    fewer than 50 text channels. CATEGORY_IDS value may be a single int or a list of ints.
-    Returns None if no suitable category is found.
-    """
-    raw = CATEGORY_IDS.get(key)
-    if raw is None:
-        return None
 
-    ids = raw if isinstance(raw, (list, tuple)) else [raw]
-    for cid in ids:
-        try:
-            cat = guild.get_channel(cid)
-        except Exception:
-            cat = None
-        if not cat:
-            continue
-        # CategoryChannel has .text_channels; if not present, fall back to counting by category_id
-        try:
-            count = len(cat.text_channels)
-        except Exception:
-            count = len([c for c in guild.channels if getattr(c, "category_id", None) == cid and isinstance(c, discord.TextChannel)])
-        # If fewer than 50 text channels, use this category
-        if count < 50:
-            return cat
+def leads_shard(shard_id: Optional[int]) -> bool:
+    return (shard_id or 0) in led_shards
+
 
-    # None available (all full or invalid) -> return None
-    return None
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **bot_cache_options)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, **bot_cache_options)
+tree = bot.tree
 
 # ---------------------------
-# Classes
+# Outbound REST scheduler: customer traffic first
 # ---------------------------
-
-# Main panel view - first select delivery type
-class TicketPanelView(View):
-    def __init__(self, timeout: Optional[float] = None):
-        super().__init__(timeout=timeout)
-        # Add selects/buttons dynamically in __init__
-        self.add_item(DeliverySelect())
-
-class DeliverySelect(Select):
+# Every REST call the bot makes goes through bot.http.request, which is wrapped below. Calls are classed
+# by the rest_priority context variable: critical (the default; anything a user is waiting on), normal
+# (deferred customer work such as the DM outbox) and background (loops, sticky reposts, startup
+# housekeeping). Each class may use a share of REST_RATE requests per second; critical is never held.
+# Normal and background calls wait while a higher class is queued, and background calls also wait
+# while customer calls are in flight, while REST_BACKGROUND_CONCURRENCY of them are already running,
+# or while the route's rate-limit bucket is nearly spent, for at most REST_MAX_DEFER seconds. Held calls
+# sleep on an event that is set when a call finishes or a held call starts, with a timeout for the
+# limits that lift by themselves: the oldest call leaving the one-second window, the bucket refilling and
+# the defer limit running out.
+# Interaction responses and follow-ups use discord.py's webhook adapter and never queue here.
+REST_CRITICAL, REST_NORMAL, REST_BACKGROUND = 0, 1, 2
+REST_RATE = float(os.getenv("REST_RATE", "45"))  # under Discord's global 50/s
+REST_BUDGETS = {REST_CRITICAL: 1.0, REST_NORMAL: 0.7, REST_BACKGROUND: 0.4}
+REST_BACKGROUND_CONCURRENCY = 2
+REST_LOW_HEADROOM = 1
+REST_MAX_DEFER = 30.0
+
+rest_priority: contextvars.ContextVar = contextvars.ContextVar("rest_priority", default=REST_CRITICAL)
+bucket_internals_missing = False  # set (and logged) the first time discord.py's rate-limit internals aren't there
+
+
+def bucket_headroom(route: discord.http.Route) -> tuple[Optional[int], Optional[float]]:
+    """Requests left in the route's current rate-limit bucket and seconds until it refills, if discord.py
+    has seen it yet. Reads discord.py internals (HTTPClient._bucket_hashes/_buckets, Ratelimit), which is
+    why requirements.txt pins discord.py."""
+    global bucket_internals_missing
+    http = bot.http
+    try:
+        key = f"{http._bucket_hashes.get(route.key, route.key)}:{route.major_parameters}"
+        ratelimit = http._buckets.get(key)
+        # an expired bucket is refilled by discord.py on its next request
+        if ratelimit is None or ratelimit.is_expired():
+            return None, None
+        resets_in = ratelimit.expires - asyncio.get_running_loop().time() if ratelimit.expires is not None else None
+        return ratelimit.remaining - len(ratelimit._pending_requests), resets_in
+    except AttributeError as e:
+        # the class budgets still apply; only the bucket check is off
+        if not bucket_internals_missing:
+            bucket_internals_missing = True
+            log.warning("discord.py %s rate-limit internals changed (%s); background REST calls no longer wait for bucket headroom", discord.__version__, e)
+        return None, None
+
+
+class RestScheduler:
     def __init__(self):
-        options = [
-            discord.SelectOption(label="Robux", description="Buy Robux (Gamepass / Group Funds / In-Game)", value="robux"),
-            discord.SelectOption(label="Other", description="Other support request", value="other")
-        ]
-        super().__init__(placeholder="Select ticket type...", min_values=1, max_values=1, options=options)
+        self._recent: deque = deque()  # start times of calls in the last second
+        self._waiting: Counter = Counter()
+        self._in_flight: Counter = Counter()
+        self._changed = asyncio.Event()  # set, then replaced, when a call finishes or a held call starts
+        self.deferred: Counter = Counter()  # calls per class that had to wait
+
+    def _may_start(self, priority: int, route: discord.http.Route, now: float, waited: float) -> bool:
+        # trim first: critical calls are recorded too (they use up the lower classes' budgets), so
+        # only-critical traffic would otherwise grow the window without bound
+        while self._recent and self._recent[0] <= now - 1.0:
+            self._recent.popleft()
+        if priority == REST_CRITICAL:
+            return True
+        if len(self._recent) >= REST_RATE * REST_BUDGETS[priority]:
+            return False
+        if any(self._waiting[p] for p in range(priority)):
+            return False
+        if priority == REST_BACKGROUND and waited < REST_MAX_DEFER:
+            if self._in_flight[REST_CRITICAL] or self._in_flight[REST_BACKGROUND] >= REST_BACKGROUND_CONCURRENCY:
+                return False
+            headroom, _ = bucket_headroom(route)
+            if headroom is not None and headroom <= REST_LOW_HEADROOM:
+                return False
+        return True
+
+    def _recheck_in(self, priority: int, route: discord.http.Route, now: float, waited: float) -> Optional[float]:
+        """Seconds until a held call may start without any call finishing: enough starts leave the one-second
+        window to get under its budget, or (background) the route's bucket refills or the defer limit runs out.
+        None when only a finishing call or a held call starting can let it through."""
+        times = []
+        over = len(self._recent) - REST_RATE * REST_BUDGETS[priority]
+        if over >= 0:
+            times.append(self._recent[int(over)] + 1.0 - now)
+        if priority == REST_BACKGROUND:
+            times.append(REST_MAX_DEFER - waited)
+            headroom, resets_in = bucket_headroom(route)
+            if headroom is not None and headroom <= REST_LOW_HEADROOM and resets_in is not None:
+                times.append(resets_in)
+        return max(min(times), 0.0) if times else None
+
+    def _notify(self):
+        # synchronous on purpose: a held call must be counted as started before anything it woke re-checks
+        if any(self._waiting.values()):
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    async def request(self, send, route: discord.http.Route, **kwargs) -> Any:
+        priority = rest_priority.get()
+        started = time.monotonic()
+        if not self._may_start(priority, route, started, 0.0):
+            self.deferred[priority] += 1
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._may_start(priority, route, now, now - started):
+                        break
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), self._recheck_in(priority, route, now, now - started))
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiting[priority] -= 1
+                # lower classes hold while this one waits, whether it now starts or was cancelled
+                self._notify()
+        self._recent.append(time.monotonic())
+        self._in_flight[priority] += 1
+        try:
+            return await send(route, **kwargs)
+        finally:
+            self._in_flight[priority] -= 1
+            self._notify()
 
-    async def callback(self, interaction: discord.Interaction):
-        selected = self.values[0]
-        if selected == "robux":
-            # Show robux subtype select view
-            await interaction.response.send_message(embed=discord.Embed(title="Select Robux Delivery Type", description="Choose the delivery subtype."), view=RobuxSubtypeView(), ephemeral=True)
-        else:
-            # For "Other" open a modal to gather details (amount not needed)
-            await interaction.response.send_modal(OtherTicketModal())
 
-class RobuxSubtypeView(View):
-    def __init__(self):
-        super().__init__(timeout=180)
-        self.add_item(RobuxSubtypeSelect())
-        self.add_item(PaymentMethodSelect())  # allow selecting method before modal
-        self.add_item(StartRobuxModalButton())
+rest_scheduler = RestScheduler()
+_send_request = bot.http.request
 
-class RobuxSubtypeSelect(Select):
-    def __init__(self):
-        options = [
-            discord.SelectOption(label="Gamepass", value="gamepass", description="Gamepass delivery"),
-            discord.SelectOption(label="Group Funds", value="groupfunds", description="Group funds delivery"),
-            discord.SelectOption(label="In-Game Gifting", value="ingame", description="In-game gifting")
-        ]
-        super().__init__(placeholder="Select delivery subtype...", min_values=1, max_values=1, options=options)
 
-    async def callback(self, interaction: discord.Interaction):
-        # store selection in view state
-        view: RobuxSubtypeView = self.view  # type: ignore
-        view.delivery_subtype = self.values[0]
-        await interaction.response.send_message(f"Selected subtype: **{self.values[0]}**", ephemeral=True)
+async def scheduled_request(route: discord.http.Route, **kwargs) -> Any:
+    return await rest_scheduler.request(_send_request, route, **kwargs)
 
-class PaymentMethodSelect(Select):
-    def __init__(self):
-        options = [discord.SelectOption(label=method.title(), value=method) for method in PAYMENT_FEES.keys()]
-        super().__init__(placeholder="Select payment method...", min_values=1, max_values=1, options=options)
 
-    async def callback(self, interaction: discord.Interaction):
-        view: RobuxSubtypeView = self.view  # type: ignore
-        view.payment_method = self.values[0]
-        await interaction.response.send_message(f"Selected payment method: **{self.values[0]}**", ephemeral=True)
+bot.http.request = scheduled_request
 
-class StartRobuxModalButton(Button):
-    def __init__(self):
-        super().__init__(style=discord.ButtonStyle.success, label="Proceed", custom_id="start_robux_modal")
-
-    async def callback(self, interaction: discord.Interaction):
-        view: RobuxSubtypeView = self.view  # type: ignore
-        delivery_subtype = getattr(view, "delivery_subtype", None)
-        payment_method = getattr(view, "payment_method", None)
-        if not delivery_subtype or not payment_method:
-            await interaction.response.send_message("Please choose a delivery subtype and a payment method before proceeding.", ephemeral=True)
-            return
-        # show modal for amount input
-        modal = RobuxAmountModal(delivery_subtype, payment_method)
-        await interaction.response.send_modal(modal)
-
-class RobuxAmountModal(Modal):
-    def __init__(self, subtype: str, payment_method: str):
-        super().__init__(title="Enter Robux Amount")
-        self.subtype = subtype
-        self.payment_method = payment_method
-        self.amount = TextInput(label="Amount of Robux (only numbers)", placeholder="e.g. 1000", style=discord.TextStyle.short, required=True, max_length=20)
-        self.add_item(self.amount)
+# ---------------------------
+# Member resolver: batched gateway lookups instead of a full member cache
+# ---------------------------
+# Role and inactivity passes hand over every user id they need at once. Cached members are returned
+# directly; the rest are requested over the gateway 100 ids per query (cached by discord.py afterwards),
+# concurrent requests for the same id share one lookup, and ids that aren't in the guild are remembered
+# for MEMBER_ABSENT_TTL so they aren't re-queried on every pass.
+MEMBER_QUERY_BATCH = 100  # Discord's limit on user_ids per request
+MEMBER_ABSENT_TTL = 15 * 60
+
+
+class MemberResolver:
+    def __init__(self, absent_ttl: float = MEMBER_ABSENT_TTL):
+        self.absent_ttl = absent_ttl
+        self._absent: Dict[tuple, float] = {}  # (guild_id, user_id) -> expiry
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        self.queries = 0
+
+    def forget(self, guild_id: int, user_id: int):
+        self._absent.pop((guild_id, user_id), None)
+
+    async def resolve(self, guild: discord.Guild, user_ids: List[int]) -> Dict[int, Optional[discord.Member]]:
+        """Map each user id to its member, or None if they're not in the guild (or couldn't be looked up)."""
+        now = time.time()
+        result: Dict[int, Optional[discord.Member]] = {}
+        waiting: Dict[int, asyncio.Future] = {}
+        to_query: List[int] = []
+        for uid in dict.fromkeys(user_ids):
+            key = (guild.id, uid)
+            member = guild.get_member(uid)
+            if member is not None:
+                result[uid] = member
+            elif self._absent.get(key, 0) > now:
+                result[uid] = None
+            elif key in self._pending:
+                waiting[uid] = self._pending[key]
+            else:
+                self._pending[key] = asyncio.get_running_loop().create_future()
+                to_query.append(uid)
 
-    async def on_submit(self, interaction: discord.Interaction):
         try:
-            # validate amount
-            raw = self.amount.value.strip().replace(",", "")
-            if not raw.isdigit():
-                await interaction.response.send_message("Amount must be an integer number of Robux.", ephemeral=True)
-                return
-            amount = int(raw)
-            # call ticket creation
-            await create_ticket_for_user(interaction, delivery_type="Robux", subtype=self.subtype, payment_method=self.payment_method, amount=amount)
-        except Exception as e:
-            print(f"Error in RobuxAmountModal.on_submit: {e}")
-            await interaction.response.send_message("An error occurred while creating the ticket. Please try again or contact support.", ephemeral=True)
+            for i in range(0, len(to_query), MEMBER_QUERY_BATCH):
+                batch = to_query[i:i + MEMBER_QUERY_BATCH]
+                try:
+                    self.queries += 1
+                    found = {m.id: m for m in await guild.query_members(user_ids=batch, limit=MEMBER_QUERY_BATCH, cache=True)}
+                    failed = False
+                except Exception as e:
+                    log.warning("Member lookup failed for %d users in %s: %s", len(batch), guild, e, extra={"guild": guild.id})
+                    found, failed = {}, True
+                for uid in batch:
+                    member = found.get(uid)
+                    if member is None and not failed:
+                        self._absent[(guild.id, uid)] = now + self.absent_ttl
+                    result[uid] = member
+                    self._pending.pop((guild.id, uid)).set_result(member)
+        finally:
+            # cancelled mid-way: don't leave other callers waiting on lookups that will never run
+            for uid in to_query:
+                future = self._pending.pop((guild.id, uid), None)
+                if future is not None:
+                    future.set_result(None)
+
+        for uid, future in waiting.items():
+            result[uid] = await future
+        if len(self._absent) > 10000:
+            self._absent = {k: v for k, v in self._absent.items() if v > now}
+        return result
+
+
+member_resolver = MemberResolver()
+
+
+@bot.listen("on_member_join")
+async def forget_absent_member(member: discord.Member):
+    member_resolver.forget(member.guild.id, member.id)
 
-class OtherTicketModal(Modal):
-    def __init__(self):
-        super().__init__(title="Create Other Ticket")
-        self.details = TextInput(label="Describe your request", style=discord.TextStyle.paragraph, placeholder="Explain the issue or request...", required=True, max_length=2000)
-        self.add_item(self.details)
 
-    async def on_submit(self, interaction: discord.Interaction):
+# ---------------------------
+# Shard leases (sharded mode only)
+# ---------------------------
+@tasks.loop(seconds=SHARD_LEASE_TTL / 3)
+async def renew_shard_leases():
+    for shard_id in OWNED_SHARDS:
         try:
-            content = self.details.value.strip()
-            await create_ticket_for_user(interaction, delivery_type="Other", subtype=None, payment_method="N/A", amount=0, extra_notes=content)
-        except Exception as e:
-            print(f"Error in OtherTicketModal.on_submit: {e}")
-            await interaction.response.send_message("An error occurred while creating the ticket. Please try again or contact support.", ephemeral=True)
+            held = shared_state.try_lease(f"shard-{shard_id}", INSTANCE_ID, SHARD_LEASE_TTL)
+        except sqlite3.Error as e:
+            shard_log.error("Lease renewal for shard %s failed: %s", shard_id, e, extra={"shard": shard_id})
+            held = False
+        if held and shard_id not in led_shards:
+            shard_log.info("Now leading shard %s", shard_id, extra={"shard": shard_id})
+            led_shards.add(shard_id)
+        elif not held and shard_id in led_shards:
+            shard_log.warning("Lost the lease for shard %s", shard_id, extra={"shard": shard_id})
+            led_shards.discard(shard_id)
+
+
+@bot.listen("on_ready")
+async def start_shard_leases():
+    if shared_state is not None and not renew_shard_leases.is_running():
+        renew_shard_leases.start()
+
+
+if shared_state is not None:
+    atexit.register(shared_state.release_leases, INSTANCE_ID)
+
 
 # ---------------------------
-# Ticket Management
+# Ticket model
 # ---------------------------
-def validate_ticket_creation(user: discord.User, guild: discord.Guild, interaction: discord.Interaction) -> Optional[List[Dict[str, Any]]]:
-    """Validate guild and check existing tickets. Returns user_tickets if valid, None if error sent."""
-    if guild is None:
-        asyncio.create_task(interaction.response.send_message("This command must be used in a server (guild).", ephemeral=True))
-        return None
+# tickets.json schema versions:
+#   (none) legacy: {user_id: ticket dict} or {user_id: [ticket dicts]} with ISO timestamps, plus odd
+#          hand-made entries like "STCN" (keyed by name, "robux_type" instead of "subtype", naive time)
+#   2      {"schema_version": 2, "tickets": {user_id: [ticket dicts]}} with epoch-second timestamps
+# Older files are migrated once at load and rewritten as version 2; a copy of the original is kept.
+TICKET_SCHEMA_VERSION = 2
 
-    global tickets_data
-    user_key = str(user.id)
-    user_tickets = tickets_data.get(user_key, [])
-    active_tickets = [t for t in user_tickets if isinstance(t, dict) and guild.get_channel(int(t.get("channel_id", 0))) is not None]
-    if len(active_tickets) >= 3:
-        asyncio.create_task(interaction.response.send_message("You can have up to 3 active tickets.", ephemeral=True))
-        return None
-    # Clean up stale tickets
-    user_tickets = active_tickets
-    tickets_data[user_key] = user_tickets
-    write_json(TICKET_JSON, tickets_data)
-    return user_tickets
-
-def determine_category_and_subtype(delivery_type: str, subtype: Optional[str]) -> tuple[str, Optional[str]]:
-    """Determine category_key and subtype_key."""
-    category_key = "other"
-    subtype_key = None
-    if delivery_type.lower() == "robux":
-        if subtype == "gamepass":
-            category_key = "robux_gamepass"
-            subtype_key = "gamepass"
-        elif subtype == "groupfunds":
-            category_key = "robux_groupfunds"
-            subtype_key = "groupfunds"
-        elif subtype == "ingame":
-            category_key = "robux_ingame"
-            subtype_key = "ingame"
-    return category_key, subtype_key
-
-def build_channel_overwrites(guild: discord.Guild, user: discord.User) -> Dict[discord.abc.Snowflake, discord.PermissionOverwrite]:
-    """Build permission overwrites for the ticket channel."""
-    overwrites = {
-        guild.default_role: discord.PermissionOverwrite(view_channel=False),
-        user: discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True, attach_files=True),
-    }
-    support_role = guild.get_role(SUPPORT_ROLE_ID)
-    if support_role:
-        overwrites[support_role] = discord.PermissionOverwrite(view_channel=True, send_messages=True, read_message_history=True)
-    overwrites[guild.me] = discord.PermissionOverwrite(view_channel=True, send_messages=True, manage_channels=True, read_message_history=True)
-    return overwrites
-
-def calculate_total_cost(delivery_type: str, subtype_key: Optional[str], amount: int, payment_method: str) -> tuple[float, Optional[str]]:
-    """Calculate total cost and get notes."""
-    total_cost = 0.0
-    notes = None
-    if delivery_type.lower() == "robux" and subtype_key:
-        price_per_thousand = price_for(subtype_key)
-        if price_per_thousand is None:
-            price_per_thousand = 0.0
-        thousands = amount / 1000.0
-        base = thousands * price_per_thousand
-        fee_pct = payment_fee_for(payment_method)
-        total_cost = base + (base * (fee_pct / 100.0))
-        pay_info = read_json(PAYMENT_JSON)
-        notes = pay_info.get(payment_method.lower(), None)
-    return total_cost, notes
-
-def save_ticket_info(user_key: str, channel: discord.TextChannel, delivery_type: str, subtype_key: Optional[str], payment_method: str, amount: int, total_cost: float, user_tickets: List[Dict[str, Any]]):
-    """Save ticket metadata."""
-    ticket_info = {
-        "channel_id": channel.id,
-        "user_id": int(user_key),
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "last_activity": datetime.now(timezone.utc).isoformat(),
-        "delivery_type": delivery_type,
-        "subtype": subtype_key,
-        "payment_method": payment_method,
-        "amount": amount,
-        "total_cost": total_cost,
-        "warned": False,
-        "warn_time": None
-    }
-    user_tickets.append(ticket_info)
-    tickets_data[user_key] = user_tickets
-    write_json(TICKET_JSON, tickets_data)
-
-async def post_ticket_embed_and_confirm(channel: discord.TextChannel, user: discord.User, delivery_type: str, subtype_key: Optional[str], payment_method: str, amount: int, total_cost: float, notes: Optional[str], extra_notes: Optional[str], interaction: discord.Interaction):
-    """Post embed in channel and confirm to user."""
-    if notes is None:
-        notes = extra_notes
-    embed = ticket_info_embed(user=user, delivery_type=delivery_type, subtype=subtype_key, payment_method=payment_method, amount=amount, total_cost=total_cost, notes=notes)
-    close_view = TicketChannelView(channel_owner_id=user.id)
-    support_role = channel.guild.get_role(SUPPORT_ROLE_ID)
-    await channel.send(content=f"{support_role.mention if support_role else ''} • Ticket created by {user.mention}", embed=embed, view=close_view)
-    await interaction.response.send_message(f"Ticket created: {channel.mention}", ephemeral=True)
-
-    # Post to getting_info
-    getting_info_cat = channel.guild.get_channel(CATEGORY_IDS.get("getting_info"))
-    if getting_info_cat:
-        try:
-            await getting_info_cat.send(f"New ticket {channel.mention} created by {user.mention} • Type: {delivery_type} {('(' + (subtype_key or '') + ')') if subtype_key else ''}")
-        except Exception:
-            pass
 
-async def create_ticket_for_user(interaction: discord.Interaction, delivery_type: str, subtype: Optional[str], payment_method: str, amount: int = 0, extra_notes: Optional[str] = None):
-    """Create a ticket channel for the interaction user, enforce one-ticket-per-user, post embed & instructions."""
-    user = interaction.user
-    user_tickets = validate_ticket_creation(user, interaction.guild, interaction)
-    if user_tickets is None:
-        return
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds from an epoch number or an ISO string (naive ISO times are taken as UTC)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    dt = datetime.fromisoformat(str(value))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def format_timestamp(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else None
+
+
+# Work-queue stages, in the order /next drains them when no stage is given: paid work first.
+# A ticket starts "new", moves to "payment" once staff pick it up (first staff reply or /next), and to
+# needs_<subtype> when /confirm-payment moves it to that subtype's NEEDS_*_ID category.
+TICKET_STAGES = {
+    "needs_gamepass": "Needs gamepass",
+    "needs_groupfunds": "Needs group funds",
+    "needs_ingame": "Needs in-game",
+    "payment": "Awaiting payment confirmation",
+    "new": "New",
+}
+STAGE_ON_CLAIM = {"new": "payment"}
+# Each $ of order value counts as this many seconds of waiting in the work queue
+QUEUE_VALUE_SECONDS = int(os.getenv("QUEUE_VALUE_SECONDS", "60"))
+
+
+@dataclass(slots=True, frozen=True)
+class Ticket:
+    channel_id: int
+    user_id: int
+    created_at: float  # epoch seconds, UTC
+    last_activity: float
+    delivery_type: str = "Robux"
+    subtype: Optional[str] = None
+    payment_method: Optional[str] = None
+    amount: int = 0
+    total_cost: float = 0.0
+    warned: bool = False
+    warn_time: Optional[float] = None
+    guild_id: Optional[int] = None  # missing on tickets saved before sharding
+    stage: str = "new"  # work-queue stage, a TICKET_STAGES key
+    stage_since: Optional[float] = None  # when it entered the stage; None means created_at
+    claimed_by: Optional[int] = None  # staff member working it; only unclaimed tickets are queued
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Ticket":
+        """Build from a stored dict of any schema version. Raises KeyError/ValueError/TypeError if unusable."""
+        last_activity = parse_timestamp(record.get("last_activity"))
+        created_at = parse_timestamp(record.get("created_at"))
+        if last_activity is None:
+            last_activity = created_at if created_at is not None else time.time()
+        return cls(
+            channel_id=int(record["channel_id"]),
+            user_id=int(record["user_id"]),
+            created_at=created_at if created_at is not None else last_activity,
+            last_activity=last_activity,
+            delivery_type=record.get("delivery_type") or "Robux",
+            subtype=record.get("subtype") or record.get("robux_type"),
+            payment_method=record.get("payment_method"),
+            amount=int(record.get("amount") or 0),
+            total_cost=float(record.get("total_cost") or 0.0),
+            warned=bool(record.get("warned", False)),
+            warn_time=parse_timestamp(record.get("warn_time")),
+            guild_id=int(record["guild_id"]) if record.get("guild_id") else None,
+            stage=record.get("stage") if record.get("stage") in TICKET_STAGES else "new",
+            stage_since=parse_timestamp(record.get("stage_since")),
+            claimed_by=int(record["claimed_by"]) if record.get("claimed_by") else None,
+        )
 
-    category_key, subtype_key = determine_category_and_subtype(delivery_type, subtype)
+    def to_record(self) -> Dict[str, Any]:
+        return {
+            "channel_id": self.channel_id,
+            "user_id": self.user_id,
+            "created_at": self.created_at,
+            "last_activity": self.last_activity,
+            "delivery_type": self.delivery_type,
+            "subtype": self.subtype,
+            "payment_method": self.payment_method,
+            "amount": self.amount,
+            "total_cost": self.total_cost,
+            "warned": self.warned,
+            "warn_time": self.warn_time,
+            "guild_id": self.guild_id,
+            "stage": self.stage,
+            "stage_since": self.stage_since,
+            "claimed_by": self.claimed_by,
+        }
+
+
+def load_tickets(path: str = TICKET_JSON) -> Dict[str, List[Ticket]]:
+    """Load tickets.json into Ticket objects, migrating older schemas and dropping unusable entries."""
+    raw = read_json(path)
+    version = raw.get("schema_version")
+    entries = raw.get("tickets", {}) if version is not None else raw
+    tickets: Dict[str, List[Ticket]] = {}
+    dirty = version != TICKET_SCHEMA_VERSION
+    for key, value in entries.items():
+        records = value if isinstance(value, list) else [value]
+        for record in records:
+            try:
+                ticket = Ticket.from_record(record)
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                state_log.warning("Dropping unreadable ticket entry %r: %s", key, e, extra={"path": path})
+                dirty = True
+                continue
+            # legacy entries may be keyed by something other than the owner's id
+            tickets.setdefault(str(ticket.user_id), []).append(ticket)
+    # an empty file (a fresh install's {}) has nothing to migrate: no backup, no log; the next save writes v2
+    if dirty and entries and state_exists(path):
+        backup = f"{path}.v{version or 1}.bak"
+        if not state_exists(backup):
+            # the original bytes, as read above (the file itself may still be queued for writing)
+            state_writer.write(backup, state_writer.cached(path))
+        write_state(path, dump_tickets(tickets))
+        state_log.info("Migrated %s to ticket schema v%s (original kept as %s)", path, TICKET_SCHEMA_VERSION, backup, extra={"path": path})
+    return tickets
+
+
+def dump_tickets(tickets: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "schema_version": TICKET_SCHEMA_VERSION,
+        "tickets": {uid: [t.to_record() for t in user_tickets] for uid, user_tickets in tickets.items()},
+    }
 
-    # Unique channel name: ticket-username-XXXX
-    safe_name = user.name.lower().replace(" ", "-")[:20]
-    unique_suffix = str(user.id)[-4:]
-    channel_name = f"ticket-{safe_name}-{unique_suffix}"
 
-    overwrites = build_channel_overwrites(interaction.guild, user)
-    category = select_ticket_category(interaction.guild, category_key)
+# Index name -> key for TicketStore's secondary indexes; string keys are lower-cased so lookups ignore case
+TICKET_INDEXES = {
+    "guild": lambda t: t.guild_id or PRIMARY_GUILD_ID,
+    "subtype": lambda t: (t.subtype or t.delivery_type or "").lower(),
+    "payment_method": lambda t: (t.payment_method or "").lower(),
+    "stage": lambda t: t.stage,
+}
+# Timestamps kept in sorted (timestamp, channel id) lists, for age filters and ordering
+TICKET_TIME_INDEXES = ("last_activity", "created_at")
 
-    try:
-        channel = await interaction.guild.create_text_channel(name=channel_name, overwrites=overwrites, category=category, topic=f"Ticket for {user} ({user.id})")
-    except Exception as e:
-        await interaction.response.send_message(f"Failed to create ticket channel: {e}", ephemeral=True)
-        return
 
-    total_cost, notes = calculate_total_cost(delivery_type, subtype_key, amount, payment_method)
-    save_ticket_info(str(user.id), channel, delivery_type, subtype_key, payment_method, amount, total_cost, user_tickets)
-    await post_ticket_embed_and_confirm(channel, user, delivery_type, subtype_key, payment_method, amount, total_cost, notes, extra_notes, interaction)
+def queue_priority(ticket: Ticket) -> float:
+    """Work-queue order, lowest first: time in the stage, with each $ of order value worth QUEUE_VALUE_SECONDS of waiting."""
+    return (ticket.stage_since or ticket.created_at) - ticket.total_cost * QUEUE_VALUE_SECONDS
 
-# ---------------------------
-# Ticket channel View (Close button)
-# ---------------------------
-class TicketChannelView(View):
-    def __init__(self, channel_owner_id: int):
-        super().__init__(timeout=None)
-        self.channel_owner_id = channel_owner_id
-        self.add_item(CloseTicketButton())
 
-class CloseTicketButton(Button):
-    def __init__(self):
-        super().__init__(style=discord.ButtonStyle.danger, label="Close Ticket", custom_id="close_ticket_btn")
+class TicketStore:
+    """Open tickets keyed by owner id, with atomic mutations and copy-on-write snapshots.
 
-    async def callback(self, interaction: discord.Interaction):
-        # Confirm: show modal or confirm view
-        confirm_view = ConfirmCloseView()
-        await interaction.response.send_message("Are you sure you want to close this ticket? This will delete the channel.", view=confirm_view, ephemeral=True)
+    Ticket records are frozen and every change replaces the record, so a snapshot (an O(1) reference to
+    the current mapping) stays consistent while scans await Discord calls. The first mutation after a
+    snapshot copies the outer mapping. Critical sections never await; the thread lock only matters for
+    callers off the event loop.
+    """
 
-class ConfirmCloseView(View):
-    def __init__(self):
-        super().__init__(timeout=60)
-        self.add_item(ConfirmCloseButton())
-        self.add_item(CancelCloseButton())
+    def __init__(self, tickets: Dict[str, List[Ticket]]):
+        self._lock = threading.Lock()
+        self._user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._load(tickets)
+
+    def _load(self, tickets: Dict[str, List[Ticket]]):
+        self._tickets: Dict[str, tuple] = {uid: tuple(ts) for uid, ts in tickets.items() if ts}
+        self._owner_by_channel: Dict[int, str] = {t.channel_id: uid for uid, ts in self._tickets.items() for t in ts}
+        self._shared = False
+        # Secondary indexes for search(): {index: {key: {channel id}}} and [(timestamp, channel id)] kept sorted
+        self._by_channel: Dict[int, Ticket] = {}
+        self._by_key: Dict[str, Dict[Any, set]] = {name: {} for name in TICKET_INDEXES}
+        self._by_time: Dict[str, List[tuple]] = {name: [] for name in TICKET_TIME_INDEXES}
+        # Live (unclaimed) tickets per work queue key, so a heap knows how much of it is stale
+        self._queued: Dict[tuple, int] = {}
+        for ts in self._tickets.values():
+            for ticket in ts:
+                self._index(ticket, keep_sorted=False)
+        for keys in self._by_time.values():
+            keys.sort()
+        # Work queues: (guild id, stage) -> heap of (queue_priority, channel id) for unclaimed tickets.
+        # Entries go stale instead of being removed; claim_next skips the ones that no longer match.
+        self._queues: Dict[tuple, list] = {}
+        for ticket in self._by_channel.values():
+            self._enqueue(ticket, keep_heap=False)
+        for heap in self._queues.values():
+            heapq.heapify(heap)
+
+    def _index(self, ticket: Ticket, keep_sorted: bool = True):
+        self._by_channel[ticket.channel_id] = ticket
+        for name, key_for in TICKET_INDEXES.items():
+            self._by_key[name].setdefault(key_for(ticket), set()).add(ticket.channel_id)
+        for name in TICKET_TIME_INDEXES:
+            entry = (getattr(ticket, name), ticket.channel_id)
+            if keep_sorted:
+                bisect.insort(self._by_time[name], entry)
+            else:
+                self._by_time[name].append(entry)
+        if ticket.claimed_by is None:
+            key = self._queue_key(ticket)
+            self._queued[key] = self._queued.get(key, 0) + 1
 
-class ConfirmCloseButton(Button):
-    def __init__(self):
-        super().__init__(style=discord.ButtonStyle.danger, label="Yes, close", custom_id="confirm_close_btn")
+    def _queue_key(self, ticket: Ticket) -> tuple:
+        return TICKET_INDEXES["guild"](ticket), ticket.stage
 
-    async def callback(self, interaction: discord.Interaction):
-        # Only allow staff or the ticket owner to close
-        channel = interaction.channel
-        if channel is None:
-            await interaction.response.send_message("Couldn't determine channel.", ephemeral=True)
+    def _enqueue(self, ticket: Ticket, keep_heap: bool = True):
+        if ticket.claimed_by is not None:
             return
-        # fetch user ticket owner from tickets_data
-        owner_id = None
-        for uid, user_tickets in tickets_data.items():
-            if not isinstance(user_tickets, list):
-                continue
-            for ticket in user_tickets:
-                if not isinstance(ticket, dict):
-                    continue
-                if int(ticket.get("channel_id", 0)) == channel.id:
-                    owner_id = int(uid)
-                    break
-            else:
-                continue
-            break
-        # permission check: either support role or owner or admin
-        member = interaction.user
-        allowed = False
-        if is_admin_member(member) or SUPPORT_ROLE_ID in [r.id for r in member.roles]:
-            allowed = True
-        if owner_id and member.id == owner_id:
-            allowed = True
-        if not allowed:
-            await interaction.response.send_message("You don't have permission to close this ticket.", ephemeral=True)
+        key = self._queue_key(ticket)
+        heap = self._queues.setdefault(key, [])
+        entry = (queue_priority(ticket), ticket.channel_id)
+        if not keep_heap:
+            heap.append(entry)
             return
-        await interaction.response.defer(ephemeral=True)
-        await close_ticket(channel, closer=interaction.user, reason="Manual close (button)")
+        heapq.heappush(heap, entry)
+        if len(heap) > 2 * self._queued.get(key, 0) + 64:
+            # mostly stale entries: rebuild from the live tickets in this queue
+            ids = self._by_key["guild"].get(key[0], set()) & self._by_key["stage"].get(key[1], set())
+            heap[:] = [(queue_priority(t), t.channel_id) for t in (self._by_channel[cid] for cid in ids) if t.claimed_by is None]
+            heapq.heapify(heap)
+
+    def _replace(self, uid: str, current: tuple, i: int, **changes) -> Ticket:
+        ticket = current[i]
+        updated = dataclasses.replace(ticket, **changes)
+        self._writable()[uid] = current[:i] + (updated,) + current[i + 1:]
+        self._unindex(ticket)
+        self._index(updated)
+        if (self._queue_key(updated), updated.claimed_by, queue_priority(updated)) != (self._queue_key(ticket), ticket.claimed_by, queue_priority(ticket)):
+            self._enqueue(updated)
+        return updated
+
+    def _unindex(self, ticket: Ticket):
+        self._by_channel.pop(ticket.channel_id, None)
+        for name, key_for in TICKET_INDEXES.items():
+            key = key_for(ticket)
+            ids = self._by_key[name].get(key)
+            if ids is not None:
+                ids.discard(ticket.channel_id)
+                if not ids:
+                    del self._by_key[name][key]
+        for name in TICKET_TIME_INDEXES:
+            keys = self._by_time[name]
+            entry = (getattr(ticket, name), ticket.channel_id)
+            i = bisect.bisect_left(keys, entry)
+            if i < len(keys) and keys[i] == entry:
+                del keys[i]
+        if ticket.claimed_by is None:
+            key = self._queue_key(ticket)
+            if self._queued.get(key, 0) > 1:
+                self._queued[key] -= 1
+            else:
+                self._queued.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._owner_by_channel)
+
+    def snapshot(self) -> Dict[str, tuple]:
+        """Read-only view of {owner id: (Ticket, ...)}; never changes after it's handed out."""
+        with self._lock:
+            self._shared = True
+            return self._tickets
+
+    def _writable(self) -> Dict[str, tuple]:
+        if self._shared:
+            self._tickets = dict(self._tickets)
+            self._shared = False
+        return self._tickets
+
+    def find(self, channel_id: int) -> Optional[tuple[str, Ticket]]:
+        """(owner id key, ticket) for a ticket channel, or None."""
+        with self._lock:
+            uid = self._owner_by_channel.get(channel_id)
+            if uid is None:
+                return None
+            for ticket in self._tickets.get(uid, ()):
+                if ticket.channel_id == channel_id:
+                    return uid, ticket
+            return None
+
+    def tickets_for(self, uid: str) -> tuple:
+        return self._tickets.get(uid, ())
+
+    def add(self, ticket: Ticket):
+        uid = str(ticket.user_id)
+        with self._lock:
+            tickets = self._writable()
+            tickets[uid] = tickets.get(uid, ()) + (ticket,)
+            self._owner_by_channel[ticket.channel_id] = uid
+            self._index(ticket)
+            self._enqueue(ticket)
+
+    def update(self, channel_id: int, expected: Optional[Ticket] = None, **changes) -> Optional[Ticket]:
+        """Replace a ticket's fields. With `expected`, only applies if nobody changed the ticket since it was read."""
+        with self._lock:
+            uid = self._owner_by_channel.get(channel_id)
+            if uid is None:
+                return None
+            current = self._tickets[uid]
+            for i, ticket in enumerate(current):
+                if ticket.channel_id == channel_id:
+                    if expected is not None and ticket is not expected:
+                        return None
+                    return self._replace(uid, current, i, **changes)
+            return None
+
+    def remove(self, channel_id: int) -> Optional[Ticket]:
+        with self._lock:
+            uid = self._owner_by_channel.pop(channel_id, None)
+            if uid is None:
+                return None
+            current = self._tickets[uid]
+            removed = next((t for t in current if t.channel_id == channel_id), None)
+            remaining = tuple(t for t in current if t.channel_id != channel_id)
+            tickets = self._writable()
+            if remaining:
+                tickets[uid] = remaining
+            else:
+                tickets.pop(uid, None)
+            if removed is not None:
+                self._unindex(removed)
+            return removed
+
+    def search(self, *, guild_id: Optional[int] = None, user_id: Optional[int] = None, subtype: Optional[str] = None,
+               payment_method: Optional[str] = None, min_amount: Optional[int] = None, max_amount: Optional[int] = None,
+               created_before: Optional[float] = None, active_before: Optional[float] = None,
+               order: str = "last_activity", descending: bool = False) -> List[Ticket]:
+        """Open tickets matching every given filter, sorted by `order` ("last_activity" or "created_at").
+
+        Equality filters intersect the index sets, smallest first. If what's left is smaller than the
+        time window on `order`, those tickets are filtered and sorted directly; otherwise the window is
+        walked in order. Either way no full scan of the open tickets.
+        """
+        with self._lock:
+            sets = []
+            if user_id is not None:
+                sets.append({t.channel_id for t in self._tickets.get(str(user_id), ())})
+            for name, value in (("guild", guild_id), ("subtype", subtype), ("payment_method", payment_method)):
+                if value is not None:
+                    sets.append(self._by_key[name].get(value.lower() if isinstance(value, str) else value, set()))
+            candidates = None
+            if sets:
+                sets.sort(key=len)
+                candidates = sets[0].intersection(*sets[1:])
+
+            keys = self._by_time[order]
+            bound = created_before if order == "created_at" else active_before
+            hi = bisect.bisect_left(keys, (bound,)) if bound is not None else len(keys)
+
+            def matches(t: Ticket) -> bool:
+                return ((min_amount is None or t.amount >= min_amount)
+                        and (max_amount is None or t.amount <= max_amount)
+                        and (created_before is None or t.created_at < created_before)
+                        and (active_before is None or t.last_activity < active_before))
+
+            if candidates is not None and len(candidates) < hi:
+                found = [t for t in (self._by_channel[cid] for cid in candidates) if matches(t)]
+                found.sort(key=lambda t: (getattr(t, order), t.channel_id))
+            else:
+                found = [t for t in (self._by_channel[cid] for _, cid in keys[:hi]) if (candidates is None or t.channel_id in candidates) and matches(t)]
+            if descending:
+                found.reverse()
+            return found
+
+    def claim_next(self, guild_id: int, stages: List[str], staff_id: int) -> Optional[Ticket]:
+        """Claim the highest-priority unclaimed ticket in the first non-empty stage, moving it along
+        (STAGE_ON_CLAIM). O(log n) per pop; stale heap entries are dropped on the way."""
+        with self._lock:
+            for stage in stages:
+                key = (guild_id, stage)
+                heap = self._queues.get(key)
+                while heap:
+                    priority, channel_id = heapq.heappop(heap)
+                    ticket = self._by_channel.get(channel_id)
+                    if ticket is None or ticket.claimed_by is not None or self._queue_key(ticket) != key or queue_priority(ticket) != priority:
+                        continue
+                    uid = self._owner_by_channel[channel_id]
+                    current = self._tickets[uid]
+                    i = next(n for n, t in enumerate(current) if t.channel_id == channel_id)
+                    changes: Dict[str, Any] = {"claimed_by": staff_id}
+                    if stage in STAGE_ON_CLAIM:
+                        changes.update(stage=STAGE_ON_CLAIM[stage], stage_since=time.time())
+                    return self._replace(uid, current, i, **changes)
+            return None
+
+    def queue_depths(self, guild_id: int) -> Dict[str, int]:
+        """Unclaimed tickets per stage, for one guild."""
+        with self._lock:
+            in_guild = self._by_key["guild"].get(guild_id, set())
+            return {stage: sum(1 for cid in self._by_key["stage"].get(stage, set()) & in_guild if self._by_channel[cid].claimed_by is None)
+                    for stage in TICKET_STAGES}
+
+    def replace_all(self, tickets: Dict[str, List[Ticket]]):
+        with self._lock:
+            self._load(tickets)
+
+    def user_lock(self, uid: str) -> asyncio.Lock:
+        """Serializes check-then-create for one user (e.g. a double-clicked submit) without blocking anyone else."""
+        lock = self._user_locks.get(uid)
+        if lock is None:
+            lock = self._user_locks[uid] = asyncio.Lock()
+        return lock
+
+
+def save_tickets():
+    global _saved_tickets
+    current = ticket_store.snapshot()
+    if shared_state is not None:
+        shared_state.sync_tickets(_saved_tickets, current)
+        _saved_tickets = current
+        return
+    write_json(TICKET_JSON, dump_tickets(current))
 
-class CancelCloseButton(Button):
-    def __init__(self):
-        super().__init__(style=discord.ButtonStyle.secondary, label="Cancel", custom_id="cancel_close_btn")
 
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.send_message("Close cancelled.", ephemeral=True)
+# We'll use a simple in-memory cache for tickets synchronized to tickets.json (or the shared store when sharded)
+if shared_state is not None:
+    shared_state.seed_tickets(load_tickets)
+    ticket_store = TicketStore(shared_state.load_tickets(OWNED_SHARDS))
+else:
+    ticket_store = TicketStore(load_tickets())
+# Last snapshot written to the shared store; save_tickets only sends what changed since
+_saved_tickets = ticket_store.snapshot()
+
+# Load pending closes
+pending_auto_closes: Dict[int, datetime] = read_pending_closes()
+
+# ---------------------------
+# Utility: Permissions + Checks
+# ---------------------------
+def is_admin_member(member: discord.Member) -> bool:
+    if member is None:
+        return False
+    admin_role_ids = member_guild_config(member).admin_role_ids
+    return any(role.id in admin_role_ids for role in member.roles)
+
+def has_support_role(member: discord.Member) -> bool:
+    if member is None:
+        return False
+    support_role_id = member_guild_config(member).support_role_id
+    return any(r.id == support_role_id for r in member.roles)
+
+def payment_fee_for(method: str) -> float:
+    return PAYMENT_FEES.get(method.lower(), 0)
+
+def price_for(subtype: str) -> Optional[float]:
+    return PRICES.get(subtype)
 
 # ---------------------------
 # Close ticket function (creates transcript, logs, deletes channel)
 # ---------------------------
-async def close_ticket(channel: discord.TextChannel, closer: discord.User, reason: Optional[str] = None, system_action: bool = False):
+async def close_ticket(channel: discord.TextChannel, closer: discord.User, reason: Optional[str] = None, system_action: bool = False, paid: bool = False):
     guild = channel.guild
     # Build transcript
     transcript_lines: List[str] = []
@@ -637,7 +1559,8 @@ async def close_ticket(channel: discord.TextChannel, closer: discord.User, reaso
 
     # Send to log channel as file (in memory)
     try:
-        log_chan = guild.get_channel(LOG_CHANNEL_ID) or await bot.fetch_channel(LOG_CHANNEL_ID)
+        log_channel_id = guild_config(guild.id).log_channel_id
+        log_chan = guild.get_channel(log_channel_id) or await bot.fetch_channel(log_channel_id)
     except Exception:
         log_chan = None
     if log_chan:
@@ -649,22 +1572,20 @@ async def close_ticket(channel: discord.TextChannel, closer: discord.User, reaso
             # fallback to posting a message
             await log_chan.send(f"Ticket closed: {channel.name} • Closed by: {closer} ({closer.id})\nTranscript:\n{content[:1900]}...")  # truncate if too long
 
-    # Remove ticket from tickets_data
-    for uid, user_tickets in list(tickets_data.items()):
-        if not isinstance(user_tickets, list):
-            continue
-        for i, ticket in enumerate(user_tickets):
-            if not isinstance(ticket, dict):
-                continue
-            if int(ticket.get("channel_id", 0)) == channel.id:
-                user_tickets.pop(i)
-                if not user_tickets:
-                    tickets_data.pop(uid, None)
-                write_json(TICKET_JSON, tickets_data)
-                break
-        else:
-            continue
-        break
+    # Remove ticket from the ticket store and keep it as a sales fact
+    closed = ticket_store.remove(channel.id)
+    if closed is not None:
+        save_tickets()
+        closed_at = time.time()
+        # both stores are only touched from the state writer thread; their queries queue up behind these
+        try:
+            await state_writer.run(lambda: sales_facts_for(closed.guild_id).append(closed, closed_at, paid))
+        except Exception as e:
+            ticket_log.error("Failed to record sales fact: %s", e, extra={"channel": channel.id, "user": closed.user_id})
+        try:
+            await state_writer.run(lambda: ticket_history_for(closed.guild_id).append(closed, closed_at, closer.id, reason, paid, channel_name=channel.name))
+        except Exception as e:
+            ticket_log.error("Failed to record ticket history: %s", e, extra={"channel": channel.id, "user": closed.user_id})
 
     # delete the channel
     try:
@@ -680,41 +1601,242 @@ async def close_ticket(channel: discord.TextChannel, closer: discord.User, reaso
 # Close fail ticket function
 # ---------------------------
 async def closefail_ticket(channel: discord.TextChannel, closer: Optional[discord.User] = None, reason: Optional[str] = None):
-    # DM the user politely
-    user = None
-    for uid, user_tickets in tickets_data.items():
-        if not isinstance(user_tickets, list):
-            continue
-        for ticket in user_tickets:
-            if not isinstance(ticket, dict):
-                continue
-            if int(ticket.get("channel_id", 0)) == channel.id:
+    # DM the user politely (delivered by the outbox)
+    found = ticket_store.find(channel.id)
+    if found:
+        embed = discord.Embed(
+            title="Transaction Failed ❌",
+            description=(
+                "Unfortunately, this transaction could not be completed.\n\n"
+                "If you have any questions, please contact support.\n\n"
+                "Thank you for your patience!"
+            ),
+            color=discord.Color.red()
+        )
+        dm_outbox.enqueue(int(found[0]), "failed", channel.id, embed=embed)
+
+    # Close the ticket without updating accounting
+    await close_ticket(channel, closer or bot.user, reason or "Failed transaction close")
+
+# ---------------------------
+# DM outbox: paced, retried customer notifications
+# ---------------------------
+# Customer DMs are queued here instead of being sent inline, so closes never wait on DM delivery.
+# One worker sends them DM_INTERVAL seconds apart (DM channel creation has its own tight limits),
+# retries failures with exponential backoff, and moves DMs that can't be delivered (DMs closed, user
+# gone, or DM_MAX_ATTEMPTS failures) to a dead-letter list staff can see with /dm-outbox.
+# The queue is saved on every change, so pending DMs survive a restart. Each process of a sharded
+# deployment keeps its own outbox file.
+DM_OUTBOX_JSON = "dm_outbox.json" if not SHARD_COUNT else f"dm_outbox.shards-{'-'.join(map(str, OWNED_SHARDS))}.json"
+DM_INTERVAL = float(os.getenv("DM_INTERVAL", "1.0"))
+DM_MAX_ATTEMPTS = 6
+DM_RETRY_BASE = 30  # seconds before the first retry, doubling after each failure
+DM_DEAD_KEEP = 200
+
+
+class DMOutbox:
+    def __init__(self, path: str):
+        self.path = path
+        data = read_json(path)
+        self.queue: List[Dict[str, Any]] = data.get("queue", [])
+        self.dead: List[Dict[str, Any]] = data.get("dead", [])
+        self.sent = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def save(self):
+        write_state(self.path, {"queue": self.queue, "dead": self.dead})
+
+    def enqueue(self, user_id: int, kind: str, ref: Any, content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> bool:
+        """Queue a DM; a second one of the same kind to the same user about the same ref is dropped."""
+        key = f"{kind}:{user_id}:{ref}"
+        if any(entry["key"] == key for entry in self.queue):
+            return False
+        now = time.time()
+        self.queue.append({
+            "key": key, "user_id": user_id, "kind": kind,
+            "content": content, "embed": embed.to_dict() if embed else None,
+            "attempts": 0, "created_at": now, "next_at": now, "error": None,
+        })
+        self.save()
+        self.start()
+        return True
+
+    def retry_dead(self) -> int:
+        queued = {entry["key"] for entry in self.queue}
+        revived = [entry for entry in self.dead if entry["key"] not in queued]
+        for entry in revived:
+            entry.update(attempts=0, next_at=time.time(), error=None)
+            entry.pop("failed_at", None)
+        self.queue.extend(revived)
+        self.dead = []
+        self.save()
+        self.start()
+        return len(revived)
+
+    def clear_dead(self) -> int:
+        count = len(self.dead)
+        self.dead = []
+        self.save()
+        return count
+
+    def start(self):
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        rest_priority.set(REST_NORMAL)
+        while True:
+            now = time.time()
+            due = [entry for entry in self.queue if entry["next_at"] <= now]
+            if not due:
+                self._wake.clear()
+                next_at = min((entry["next_at"] for entry in self.queue), default=None)
                 try:
-                    user = await bot.fetch_user(int(uid))
-                except Exception:
-                    user = None
-                break
+                    await asyncio.wait_for(self._wake.wait(), None if next_at is None else next_at - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._deliver(min(due, key=lambda entry: entry["next_at"]))
+            self.save()
+            await asyncio.sleep(DM_INTERVAL)
+
+    async def _deliver(self, entry: Dict[str, Any]):
+        try:
+            user = bot.get_user(entry["user_id"]) or await bot.fetch_user(entry["user_id"])
+            embed = discord.Embed.from_dict(entry["embed"]) if entry["embed"] else None
+            await user.send(content=entry["content"], embed=embed)
+        except (discord.Forbidden, discord.NotFound) as e:
+            # DMs closed or the account is gone: retrying won't help
+            self._bury(entry, e)
+        except Exception as e:
+            entry["attempts"] += 1
+            entry["error"] = str(e)[:200]
+            if entry["attempts"] >= DM_MAX_ATTEMPTS:
+                self._bury(entry, e)
+            else:
+                entry["next_at"] = time.time() + DM_RETRY_BASE * 2 ** (entry["attempts"] - 1)
         else:
-            continue
-        break
+            self.queue.remove(entry)
+            self.sent += 1
 
-    if user:
+    def _bury(self, entry: Dict[str, Any], error: Exception):
+        dm_log.warning("Giving up on DM %s: %s", entry["key"], error, extra={"user": entry["user_id"]})
+        self.queue.remove(entry)
+        entry.update(error=str(error)[:200], failed_at=time.time())
+        self.dead.append(entry)
+        del self.dead[:-DM_DEAD_KEEP]
+
+
+dm_outbox = DMOutbox(DM_OUTBOX_JSON)
+
+
+# ---------------------------
+# Long-running jobs: defer first, finish in the background
+# ---------------------------
+# Closes and payment confirmations can take longer than Discord's 3-second interaction deadline
+# (transcripts of long tickets, channel moves behind rate limits). Handlers check permissions, defer,
+# and queue the slow part here; the job reports back through follow-ups. At most one job runs per
+# channel at a time, so a double-clicked close can't archive or bill a ticket twice.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+
+class JobQueue:
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # channel id -> kind of the job queued or running for it
+        self._active: Dict[int, str] = {}
+
+    def active(self, key: int) -> Optional[str]:
+        return self._active.get(key)
+
+    def submit(self, key: int, kind: str, run, report=None) -> bool:
+        """Queue run(report) unless a job for key is already pending; returns whether it was queued."""
+        if key in self._active:
+            return False
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._active[key] = kind
+        self._queue.put_nowait((key, kind, run, report))
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._work()))
+        return True
+
+    async def join(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _work(self):
+        # the first submit may come from a background loop (auto-closes); jobs are customer traffic
+        rest_priority.set(REST_CRITICAL)
+        while True:
+            key, kind, run, report = await self._queue.get()
+            try:
+                await run(report)
+            except Exception as e:
+                job_log.exception("Job %s for %s failed", kind, key, extra={"job": kind, "channel": key})
+                if report:
+                    await report(f"❌ {kind} failed: {e}")
+            finally:
+                self._active.pop(key, None)
+                self._queue.task_done()
+
+
+job_queue = JobQueue(JOB_WORKERS)
+
+
+def job_reporter(interaction: Optional[discord.Interaction] = None, channel: Optional[discord.abc.Messageable] = None):
+    """An async report(text) that answers the interaction (following up once it's deferred) or posts in channel."""
+    async def report(text: str):
         try:
-            embed = discord.Embed(
-                title="Transaction Failed ❌",
-                description=(
-                    "Unfortunately, this transaction could not be completed.\n\n"
-                    "If you have any questions, please contact support.\n\n"
-                    "Thank you for your patience!"
-                ),
-                color=discord.Color.red()
-            )
-            await user.send(embed=embed)
+            if interaction is not None:
+                if interaction.response.is_done():
+                    await interaction.followup.send(text, ephemeral=True)
+                else:
+                    await interaction.response.send_message(text, ephemeral=True)
+            elif channel is not None:
+                await channel.send(text)
         except Exception as e:
-            print(f"Could not DM user: {e}")
+            job_log.warning("Could not report job status: %s", e)
+    return report
+
+
+async def lock_ticket_channel(channel: discord.TextChannel):
+    """Phase one of a close: nobody but the bot can post while the transcript is built."""
+    overwrites = dict(channel.overwrites)
+    for target, overwrite in overwrites.items():
+        if overwrite is not None and target != channel.guild.me:
+            overwrite.update(send_messages=False)
+    await channel.edit(overwrites=overwrites, reason="Ticket closing")
+
+
+async def queue_close(channel: discord.TextChannel, kind: str, run, report) -> bool:
+    """Lock the channel now and queue run(report) (the transcript, upload and delete) behind it.
+    Returns False if the ticket already has a job."""
+    locked = asyncio.Event()
+
+    async def job(report):
+        await locked.wait()
+        await run(report)
+
+    if not job_queue.submit(channel.id, kind, job, report):
+        await report("This ticket is already being closed or moved.")
+        return False
+    try:
+        await lock_ticket_channel(channel)
+        await report("🔒 Ticket locked, archiving and closing…")
+    except Exception as e:
+        ticket_log.warning("Could not lock the channel before closing: %s", e, extra={"channel": channel.id})
+    finally:
+        locked.set()
+    return True
 
-    # Close the ticket without updating accounting
-    await close_ticket(channel, closer or bot.user, reason or "Failed transaction close")
 
 # ---------------------------
 # Inactivity Auto-Close System
@@ -729,26 +1851,127 @@ INACTIVITY_CATEGORIES = [
 # Track pending auto-closes: channel_id -> warning_timestamp
 pending_auto_closes: Dict[int, datetime] = {}
 
-class KeepTicketOpenButton(Button):
-    def __init__(self):
-        super().__init__(style=discord.ButtonStyle.success, label="🛑 Keep Ticket Open", custom_id="keep_ticket_open")
+INACTIVITY_WARN_AFTER = 3 * 24 * 3600  # seconds without activity before the owner is pinged
+INACTIVITY_CLOSE_AFTER = 24 * 3600  # seconds after the ping before the ticket auto-closes
 
-    async def callback(self, interaction: discord.Interaction):
-        channel = interaction.channel
-        if not isinstance(channel, discord.TextChannel):
-            return
+@bot.event
+async def setup_hook():
+    # the ticket extension registers the persistent views in its setup
+    await load_extensions()
 
-        # Remove from pending closes
-        pending_auto_closes.pop(channel.id, None)
-        write_pending_closes(pending_auto_closes)
 
-        # Confirm the ticket is staying open
-        embed = discord.Embed(
-            title="Ticket Kept Open",
-            description="This ticket will remain open. Inactivity tracking has been reset.",
-            color=discord.Color.green()
-        )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+# ---------------------------
+# Extensions: code that can be reloaded in place
+# ---------------------------
+# The ticket flow (panel, views, creation, close/confirm/next commands and their prefix versions, the
+# on_message listener), the background loops and the staff lookups live in extensions/ as discord.py
+# extensions. Their state (tickets, accounting, queues) stays in this module, so /reload-extension swaps
+# only the code: no gateway reconnect, no on_ready, no sticky or panel reposts. Commands are re-synced
+# to Discord only when a reload changed their names or options.
+# Still restart-only: everything defined in this module, i.e. the state and storage code, close_ticket
+# and the job queue, the DM outbox, and the config, accounting and diagnostics commands.
+EXTENSIONS = ["extensions.tickets", "extensions.background", "extensions.reports"]
+
+
+async def load_extensions():
+    for name in EXTENSIONS:
+        if name not in bot.extensions:
+            await bot.load_extension(name)
+
+
+@bot.tree.command(name="reload-extension", description="Reload bot code in place, without a restart (admins only)")
+@app_commands.describe(name="Extension to reload")
+@app_commands.choices(name=[app_commands.Choice(name=n.split(".")[-1], value=n) for n in EXTENSIONS] + [app_commands.Choice(name="all", value="all")])
+async def reload_extension_cmd(interaction: discord.Interaction, name: str):
+    member = interaction.user
+    if not isinstance(member, discord.Member) or not is_admin_member(member):
+        await interaction.response.send_message("No permission.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    started = time.perf_counter()
+    try:
+        for ext in (EXTENSIONS if name == "all" else [name]):
+            # a failed import or setup leaves the previous version loaded
+            if ext in bot.extensions:
+                await bot.reload_extension(ext)
+            else:
+                await bot.load_extension(ext)
+    except commands.ExtensionError as e:
+        await interaction.followup.send(f"Reload failed, the running code is unchanged: {e.__cause__ or e}", ephemeral=True)
+        return
+    took = (time.perf_counter() - started) * 1000
+    synced = ""
+    try:
+        if await sync_command_tree() is not None:
+            synced = " Command definitions changed and were synced."
+    except discord.HTTPException as e:
+        synced = f" Command sync failed ({e}); try /sync-commands."
+    await interaction.followup.send(f"Reloaded {name} in {took:.0f} ms.{synced}", ephemeral=True)
+
+
+# ---------------------------
+# Command tree sync: only when the commands changed
+# ---------------------------
+# Syncing is a tightly rate-limited call, so the serialized command tree is hashed and the hash of the
+# last successful sync is kept per application (in the shared store when sharded). Restarts and
+# reconnects with unchanged commands skip the sync; /sync-commands forces one. SYNC_GUILD_ID=<id>
+# syncs the commands to that one guild instead of globally, which applies instantly (development).
+COMMAND_SYNC_JSON = "command_sync.json"
+SYNC_GUILD_ID = int(os.getenv("SYNC_GUILD_ID", "0")) or None
+
+
+def command_payloads(guild: Optional[discord.abc.Snowflake] = None) -> List[Dict[str, Any]]:
+    return sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)), key=lambda c: c["name"])
+
+
+def command_tree_hash(guild: Optional[discord.abc.Snowflake] = None) -> str:
+    raw = json.dumps(command_payloads(guild), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def read_command_hashes() -> Dict[str, str]:
+    if shared_state is not None:
+        return shared_state.get_document("command_sync") or {}
+    return read_json(COMMAND_SYNC_JSON)
+
+
+def record_command_hash(key: str, digest: str):
+    if shared_state is not None:
+        shared_state.update_document("command_sync", lambda data: data.__setitem__(key, digest))
+        return
+    data = read_json(COMMAND_SYNC_JSON)
+    data[key] = digest
+    write_state(COMMAND_SYNC_JSON, data)
+
+
+async def sync_command_tree(force: bool = False) -> Optional[int]:
+    """Sync the command tree if it changed since the last sync (or force); returns the number of
+    commands synced, or None if the sync was skipped."""
+    guild = discord.Object(id=SYNC_GUILD_ID) if SYNC_GUILD_ID else None
+    if guild is not None:
+        bot.tree.copy_global_to(guild=guild)
+    key = f"{bot.application_id}:{f'guild:{guild.id}' if guild else 'global'}"
+    digest = command_tree_hash(guild)
+    if not force and read_command_hashes().get(key) == digest:
+        return None
+    synced = await bot.tree.sync(guild=guild)
+    record_command_hash(key, digest)
+    return len(synced)
+
+
+@bot.tree.command(name="sync-commands", description="Push the slash command definitions to Discord now (admins only)")
+async def sync_commands_cmd(interaction: discord.Interaction):
+    member = interaction.user
+    if not isinstance(member, discord.Member) or not is_admin_member(member):
+        await interaction.response.send_message("No permission.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        count = await sync_command_tree(force=True)
+    except discord.HTTPException as e:
+        await interaction.followup.send(f"Sync failed: {e}", ephemeral=True)
+        return
+    await interaction.followup.send(f"Synced {count} commands{f' to guild {SYNC_GUILD_ID}' if SYNC_GUILD_ID else ''}.", ephemeral=True)
 
 # ---------------------------
 # Commands
@@ -846,6 +2069,7 @@ async def help_cmd(interaction: discord.Interaction):
             "• `/close` - Close a ticket (staff only)\n"
             "• `/close-without-payment` - Close without adding to balance (staff only)\n"
             "• `/confirm-payment` - Confirm payment and move ticket (staff only)\n"
+            "• `/next [stage]` - Claim the most overdue ticket in the work queue (staff only)\n"
             "• `/add-user-to-ticket` - Add a user to the ticket (staff only)\n"
             "• Automatic inactivity closing after 3 days\n"
             "• Transcripts saved to files"
@@ -874,12 +2098,18 @@ async def help_cmd(interaction: discord.Interaction):
         value=(
             "**User Info:**\n"
             "• `/user-spending @user` - View total spent by user (staff only)\n"
-            "• `/leaderboard` - Top 10 spenders (public)\n\n"
+            "• `/leaderboard` - Top 10 spenders (public)\n"
+            "• `/stats` - Revenue by window, subtype and payment method (staff only)\n"
+            "• `/sales-report [group] [days] [format]` - Closed-ticket sales as a table or CSV (staff only)\n"
+            "• `/ticket-history @user` / `/ticket-history-range <start> [end]` - Look up closed tickets (staff only)\n"
+            "• `/tickets find [filters] [sort] [page]` - Search open tickets by owner, type, payment, amount or age (staff only)\n\n"
             "**Currency Conversion:**\n"
             "• `/convert-currency <amount> <from> <to>` - Convert currencies\n\n"
             "**Accounting:**\n"
             "• `!add-spending @user <amount>` - Add to user balance (staff only)\n"
-            "• `!subtract-spending @user <amount>` - Subtract from user balance (staff only)"
+            "• `!subtract-spending @user <amount>` - Subtract from user balance (staff only)\n"
+            "• `/import-balances <csv> [dry_run]` - Bulk adjustments from a CSV (admins only)\n"
+            "• `/dm-outbox [action]` - Queued and failed customer DMs (staff only)"
         ),
         inline=False
     )
@@ -898,7 +2128,23 @@ async def help_cmd(interaction: discord.Interaction):
             "• `accounting.json` - User spending data\n"
             "• `prices.json` - Robux prices\n"
             "• `payment_fees.json` - Payment fees\n"
-            "• `transcripts/` - Ticket transcripts"
+            "• `transcripts/` - Ticket transcripts\n"
+            "• `history/` - Closed tickets, one file per month\n"
+            "• `analytics/` - Columnar sales facts for `/sales-report`\n"
+            "• `guilds/<id>/` - Config overrides and data for other guilds\n"
+            "• `/export-state <name>` - Download a readable copy of a data file (admins only)"
+        ),
+        inline=False
+    )
+
+    embed.add_field(
+        name="🩺 Diagnostics",
+        value=(
+            "• `/profile-start [seconds] [mode]` - Profile the bot, results go to the log channel (admins only)\n"
+            "• `/profile-stop` - Stop profiling early (admins only)\n"
+            "• `/memory-snapshot [action]` - tracemalloc allocation diff (admins only)\n"
+            "• `/reload-extension <name>` - Reload commands and loops without a restart (admins only)\n"
+            "• `/sync-commands` - Push slash command definitions to Discord now (admins only)"
         ),
         inline=False
     )
@@ -914,19 +2160,26 @@ async def help_cmd(interaction: discord.Interaction):
 # ---------------------------
 # Events
 # ---------------------------
+@bot.event
 async def on_ready():
     global BOOT_TIME
     BOOT_TIME = datetime.now(timezone.utc)
-    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+    # sticky reposts, panel checks and the command sync can wait behind customers
+    rest_priority.set(REST_BACKGROUND)
+    log.info("Logged in as %s (ID: %s)", bot.user, bot.user.id)
     await pull_tickets_from_git()
-    print("Syncing commands...")
     try:
-        await bot.tree.sync()
-        print("Commands synced.")
+        count = await sync_command_tree()
+        if count is None:
+            log.info("Commands unchanged, skipped sync.")
+        else:
+            log.info("Synced %d commands.", count)
     except Exception as e:
-        print("Failed to sync commands:", e)
-    check_inactivity.start()
-    update_all_spender_roles.start()
+        log.error("Failed to sync commands: %s", e)
+    # deliver DMs left over from the last run
+    dm_outbox.start()
+    # tickets saved before work-queue stages existed
+    sync_ticket_stages()
 
     # Clean up old sticky messages and resend new ones on restart
     for ch_id, msg_id in list(sticky_message_ids.items()):
@@ -943,43 +2196,13 @@ async def on_ready():
                 new_msg = await channel.send(sticky_messages[ch_id])
                 sticky_message_ids[ch_id] = new_msg.id
             except Exception as e:
-                print(f"Failed to send sticky to {ch_id}: {e}")
+                sticky_log.warning("Failed to send sticky: %s", e, extra={"channel": ch_id})
     # Save updated IDs
     write_json(STICKY_IDS_JSON, sticky_message_ids)
 
-    # Auto-manage ticket panel
-    channel = bot.get_channel(TICKET_PANEL_CHANNEL_ID)
-    if channel and isinstance(channel, discord.TextChannel):
-        try:
-            # Fetch recent messages from bot
-            messages = []
-            async for msg in channel.history(limit=50):
-                if msg.author == bot.user:
-                    messages.append(msg)
-            panel_messages = [msg for msg in messages if msg.embeds and any(embed.title == "Create a Ticket" for embed in msg.embeds)]
-            
-            if panel_messages:
-                # Check for panels from current boot
-                current_boot_panels = [msg for msg in panel_messages if msg.created_at >= BOOT_TIME]
-                if not current_boot_panels:
-                    # Delete old panels
-                    for msg in panel_messages:
-                        await msg.delete()
-                    # Send new panel
-                    await send_ticket_panel(channel)
-                    print("Replaced old ticket panel with new one.")
-                else:
-                    print("Ticket panel from current boot found, keeping it.")
-            else:
-                # No panel found, send new one
-                await send_ticket_panel(channel)
-                print("Sent new ticket panel.")
-        except Exception as e:
-            print(f"Error managing ticket panel: {e}")
-    
-    print(f"Bot ready as {bot.user}. Spender role updater and inactivity check tasks started.")
+    log.info("Bot ready as %s. Spender role updater and inactivity check tasks started.", bot.user)
 
-# /ticket-panel - admin only to send the panel
+# Admin-only check for app commands
 class AdminOnly(app_commands.CheckFailure):
     pass
 
@@ -989,281 +2212,541 @@ def admin_check(interaction: discord.Interaction) -> bool:
         return is_admin_member(member)
     return False
 
-async def send_ticket_panel(channel: discord.TextChannel):
-    """Send the ticket creation panel to a channel."""
-    view = TicketPanelView()
-    embed = discord.Embed(title="Create a Ticket", description="Select the ticket type below to start.", color=discord.Color.green())
-    embed.add_field(name="Robux", value="Buy Robux (Gamepass / Group Funds / In-Game).", inline=False)
-    embed.add_field(name="Other", value="Other support requests.", inline=False)
-    await channel.send(embed=embed, view=view)
-
-@bot.tree.command(name="ticket-panel", description="Send the ticket creation panel")
-async def ticket_panel(interaction: discord.Interaction):
-    view = TicketPanelView()
-    embed = discord.Embed(title="Create a Ticket", description="Select the ticket type below to start.", color=discord.Color.green())
-    embed.add_field(name="Robux", value="Buy Robux (Gamepass / Group Funds / In-Game).", inline=False)
-    embed.add_field(name="Other", value="Other support requests.", inline=False)
-    await interaction.response.send_message(embed=embed, view=view)
-
 # Use '/edit-payment' (defined below) to update payment instructions.
 
 # ---------------------------
 # Accounting helper functions
 # ---------------------------
 
-def read_accounting():
-    if not os.path.exists(ACCOUNTING_JSON):
-        return {"users": {}}
-    with open(ACCOUNTING_JSON, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Every accounting helper takes the guild whose books to use; None means the primary guild
+def accounting_document(guild_id: Optional[int]) -> str:
+    return "accounting" if not guild_id or guild_id == PRIMARY_GUILD_ID else f"accounting:{guild_id}"
+
+def read_accounting(guild_id: Optional[int] = None):
+    if shared_state is not None:
+        data = shared_state.get_document(accounting_document(guild_id))
+    else:
+        data = read_json(guild_path(guild_id, ACCOUNTING_JSON))
+    data = data or {}
+    data.setdefault("users", {})
+    return data
+
+def write_accounting(data, guild_id: Optional[int] = None):
+    if shared_state is not None:
+        shared_state.put_document(accounting_document(guild_id), data)
+        return
+    path = guild_path(guild_id, ACCOUNTING_JSON)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_state(path, data)
+
+_accounting_lock = threading.Lock()
+
+def update_accounting(apply, guild_id: Optional[int] = None) -> Dict[str, Any]:
+    """Read accounting, apply(data), write it back, with no other writer in between (across shard processes too)."""
+    if shared_state is not None:
+        def locked_apply(data):
+            data.setdefault("users", {})
+            apply(data)
+        return shared_state.update_document(accounting_document(guild_id), locked_apply)
+    with _accounting_lock:
+        data = read_accounting(guild_id)
+        apply(data)
+        write_accounting(data, guild_id)
+        return data
+
+def change_user_spent(user_id: int, amount: float, subtract: bool = False, guild_id: Optional[int] = None) -> float:
+    """Add (or subtract, never below zero) to a user's total; returns the new total."""
+    def apply(data):
+        user = data["users"].setdefault(str(user_id), {"spent": 0.0})
+        user["spent"] = max(0, user["spent"] - amount) if subtract else user["spent"] + amount
+    return update_accounting(apply, guild_id)["users"][str(user_id)]["spent"]
+
+if shared_state is not None:
+    shared_state.seed_document("accounting", lambda: read_json(ACCOUNTING_JSON))
+
+def add_to_user_spent(user_id: int, amount: float, data: Optional[Dict[str, Any]] = None, guild_id: Optional[int] = None):
+    """Add to a user's total. Pass `data` to update an accounting dict you're about to write yourself."""
+    if data is None:
+        change_user_spent(user_id, amount, guild_id=guild_id)
+        return
+    uid = str(user_id)
+    if uid not in data["users"]:
+        data["users"][uid] = {"spent": 0.0}
+    data["users"][uid]["spent"] += amount
+
+# ---------------------------
+# Revenue aggregates (accounting.json "totals", "methods", "rolling")
+# ---------------------------
+# totals/methods hold lifetime counters per subtype / payment method, updated on every paid close.
+# Rolling windows are fixed-size rings of time buckets: a sale bumps one bucket, a query sums at most
+# `slots` buckets, so both stay constant-time no matter how many sales there have been.
+ROLLING_WINDOWS = {
+    # name: (bucket width in seconds, number of buckets)
+    "1h": (60, 60),
+    "24h": (900, 96),
+    "7d": (3600, 168),
+    "30d": (86400, 30),
+}
+
+
+def empty_counter() -> Dict[str, float]:
+    return {"revenue": 0.0, "robux": 0, "orders": 0}
+
+
+def bump_counter(counter: Dict[str, float], revenue: float, robux: int):
+    counter["revenue"] = counter.get("revenue", 0.0) + revenue
+    counter["robux"] = counter.get("robux", 0) + robux
+    counter["orders"] = counter.get("orders", 0) + 1
+
+
+class RollingRevenue:
+    """Ring buffer of [bucket index, revenue, robux, orders] slots for one window."""
+    __slots__ = ("width", "slots")
+
+    def __init__(self, width: int, size: int, slots: Optional[List[List[float]]] = None):
+        self.width = width
+        self.slots = slots if slots and len(slots) == size else [[-1, 0.0, 0, 0] for _ in range(size)]
+
+    def add(self, ts: float, revenue: float, robux: int):
+        index = int(ts // self.width)
+        slot = self.slots[index % len(self.slots)]
+        if slot[0] > index:
+            return  # a backdated sale that has already fallen out of this window
+        if slot[0] != index:
+            # the slot still holds a bucket from a previous lap around the ring
+            slot[:] = [index, 0.0, 0, 0]
+        slot[1] += revenue
+        slot[2] += robux
+        slot[3] += 1
+
+    def totals(self, now: float) -> Dict[str, float]:
+        newest = int(now // self.width)
+        oldest = newest - len(self.slots)
+        result = empty_counter()
+        for index, revenue, robux, orders in self.slots:
+            if oldest < index <= newest:
+                result["revenue"] += revenue
+                result["robux"] += robux
+                result["orders"] += orders
+        return result
+
+
+def load_rolling_revenue(data: Dict[str, Any]) -> Dict[str, RollingRevenue]:
+    stored = data.get("rolling") or {}
+    return {name: RollingRevenue(width, size, stored.get(name)) for name, (width, size) in ROLLING_WINDOWS.items()}
+
+
+def migrate_revenue_sections(data: Dict[str, Any]):
+    """Older files hold bare zeros per subtype in "totals"; counters are dicts now."""
+    totals = data.setdefault("totals", {})
+    for key, value in list(totals.items()):
+        if not isinstance(value, dict):
+            totals[key] = {**empty_counter(), "revenue": float(value or 0)}
+    data.setdefault("methods", {})
+
+
+def load_revenue_counters(data: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    migrate_revenue_sections(data)
+    return {"totals": data["totals"], "methods": data["methods"]}
+
+
+# In-memory copies per guild, loaded on first use, so /stats never has to touch the disk;
+# record_sale keeps them and the file in step
+_guild_revenue: Dict[int, tuple] = {}
+
+
+def guild_revenue(guild_id: Optional[int]) -> tuple:
+    """(counters, rolling windows) for a guild."""
+    guild_id = guild_id or PRIMARY_GUILD_ID
+    revenue = _guild_revenue.get(guild_id)
+    if revenue is None:
+        data = read_accounting(guild_id)
+        revenue = _guild_revenue[guild_id] = (load_revenue_counters(data), load_rolling_revenue(data))
+    return revenue
+
+
+def refresh_revenue(data: Dict[str, Any], guild_id: Optional[int] = None):
+    _guild_revenue[guild_id or PRIMARY_GUILD_ID] = (load_revenue_counters(data), load_rolling_revenue(data))
+
+
+def record_sale(ticket: Ticket, closed_at: Optional[float] = None):
+    """Credit the buyer and update every revenue aggregate for one paid ticket, in a single write."""
+    closed_at = closed_at or time.time()
+    revenue = ticket.total_cost
+    robux = ticket.amount if ticket.delivery_type.lower() == "robux" else 0
+
+    # Bump the stored aggregates rather than the in-memory ones: other shard processes record sales too
+    def apply(data):
+        add_to_user_spent(ticket.user_id, revenue, data)
+        counters = load_revenue_counters(data)
+        bump_counter(counters["totals"].setdefault(ticket.subtype or "other", empty_counter()), revenue, robux)
+        bump_counter(counters["methods"].setdefault((ticket.payment_method or "unknown").lower(), empty_counter()), revenue, robux)
+        windows = load_rolling_revenue(data)
+        for window in windows.values():
+            window.add(closed_at, revenue, robux)
+        data["rolling"] = {name: window.slots for name, window in windows.items()}
+
+    refresh_revenue(update_accounting(apply, ticket.guild_id), ticket.guild_id)
+
+# ---------------------------
+# Sales analytics: closed-ticket facts stored column by column
+# ---------------------------
+# One append-only binary file per column under analytics/ plus meta.json (row count and the string
+# dictionaries for categorical columns). Queries run as NumPy array operations when NumPy is installed,
+# and fall back to plain loops over the same arrays otherwise.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ANALYTICS_DIR = "analytics"
+# column: array typecode (also a valid NumPy dtype); categorical columns hold codes into meta["dicts"]
+FACT_COLUMNS = {
+    "closed_at": "d",
+    "created_at": "d",
+    "amount": "q",
+    "total_cost": "d",
+    "subtype": "H",
+    "payment_method": "H",
+    "delivery_type": "H",
+    "paid": "B",
+}
+CATEGORICAL_COLUMNS = ("subtype", "payment_method", "delivery_type")
+REPORT_GROUPS = ("subtype", "payment-method", "day", "month", "day-and-method")
+
+
+class SalesFacts:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        meta = read_json(self.meta_path)
+        self.rows = int(meta.get("rows", 0))
+        self.dicts: Dict[str, List[str]] = {col: list(meta.get("dicts", {}).get(col, [])) for col in CATEGORICAL_COLUMNS}
+        self.columns: Dict[str, array.array] = {}
+        for col, typecode in FACT_COLUMNS.items():
+            values = array.array(typecode)
+            path = self.column_path(col)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    raw = f.read(self.rows * values.itemsize)
+                values.frombytes(raw[: len(raw) - len(raw) % values.itemsize])
+            if len(values) != self.rows:
+                state_log.warning("Analytics column %s has %d rows, meta says %d; truncating to the shorter", col, len(values), self.rows, extra={"path": path})
+                self.rows = min(self.rows, len(values))
+            self.columns[col] = values
+        for col in self.columns:
+            del self.columns[col][self.rows:]
+
+    def column_path(self, col: str) -> str:
+        return os.path.join(self.directory, f"{col}.col")
+
+    def encode(self, col: str, value: Optional[str]) -> int:
+        value = (value or "unknown").lower()
+        values = self.dicts[col]
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    def append(self, ticket: Ticket, closed_at: float, paid: bool):
+        row = {
+            "closed_at": closed_at,
+            "created_at": ticket.created_at,
+            "amount": ticket.amount,
+            "total_cost": ticket.total_cost,
+            "subtype": self.encode("subtype", ticket.subtype or "other"),
+            "payment_method": self.encode("payment_method", ticket.payment_method),
+            "delivery_type": self.encode("delivery_type", ticket.delivery_type),
+            "paid": 1 if paid else 0,
+        }
+        # Columns first, then meta: a crash in between leaves extra bytes that load() ignores
+        for col, typecode in FACT_COLUMNS.items():
+            self.columns[col].append(row[col])
+            with open(self.column_path(col), "r+b" if os.path.exists(self.column_path(col)) else "wb") as f:
+                f.seek(self.rows * self.columns[col].itemsize)
+                f.write(array.array(typecode, [row[col]]).tobytes())
+                f.truncate()
+        self.rows += 1
+        write_state(self.meta_path, {"rows": self.rows, "dicts": self.dicts})
+
+    def report(self, group: str, since: float, until: float, paid_only: bool = True) -> List[Dict[str, Any]]:
+        """Orders, revenue and Robux per group for closes in [since, until), largest revenue first."""
+        if np is not None:
+            rows = self._report_numpy(group, since, until, paid_only)
+        else:
+            rows = self._report_python(group, since, until, paid_only)
+        for row in rows:
+            row["avg_order"] = row["revenue"] / row["orders"] if row["orders"] else 0.0
+        if group in ("day", "month", "day-and-method"):
+            rows.sort(key=lambda r: r["key"])
+        else:
+            rows.sort(key=lambda r: r["revenue"], reverse=True)
+        return rows
+
+    def label(self, group: str, key: int) -> str:
+        method_count = max(len(self.dicts["payment_method"]), 1)
+        if group == "subtype":
+            return self.dicts["subtype"][key]
+        if group == "payment-method":
+            return self.dicts["payment_method"][key]
+        if group == "day":
+            return datetime.fromtimestamp(key * 86400, timezone.utc).strftime("%Y-%m-%d")
+        if group == "month":
+            return f"{1970 + key // 12:04d}-{key % 12 + 1:02d}"
+        day, method = divmod(key, method_count)
+        return f"{datetime.fromtimestamp(day * 86400, timezone.utc).strftime('%Y-%m-%d')} {self.dicts['payment_method'][method]}"
+
+    def _report_numpy(self, group: str, since: float, until: float, paid_only: bool) -> List[Dict[str, Any]]:
+        col = {name: np.frombuffer(values, dtype=FACT_COLUMNS[name]) for name, values in self.columns.items()}
+        mask = (col["closed_at"] >= since) & (col["closed_at"] < until)
+        if paid_only:
+            mask &= col["paid"] == 1
+        closed = col["closed_at"][mask]
+        if group == "subtype":
+            keys = col["subtype"][mask].astype(np.int64)
+        elif group == "payment-method":
+            keys = col["payment_method"][mask].astype(np.int64)
+        elif group == "day":
+            keys = (closed // 86400).astype(np.int64)
+        elif group == "month":
+            keys = closed.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+        else:
+            keys = (closed // 86400).astype(np.int64) * max(len(self.dicts["payment_method"]), 1) + col["payment_method"][mask]
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        orders = np.bincount(inverse, minlength=len(uniq))
+        revenue = np.bincount(inverse, weights=col["total_cost"][mask], minlength=len(uniq))
+        robux = np.bincount(inverse, weights=col["amount"][mask].astype(np.float64), minlength=len(uniq))
+        return [
+            {"key": int(k), "group": self.label(group, int(k)), "orders": int(o), "revenue": float(r), "robux": int(x)}
+            for k, o, r, x in zip(uniq, orders, revenue, robux)
+        ]
+
+    def _report_python(self, group: str, since: float, until: float, paid_only: bool) -> List[Dict[str, Any]]:
+        c = self.columns
+        method_count = max(len(self.dicts["payment_method"]), 1)
+        acc: Dict[int, List[float]] = {}
+        for closed, cost, amount, subtype, method, paid in zip(c["closed_at"], c["total_cost"], c["amount"], c["subtype"], c["payment_method"], c["paid"]):
+            if closed < since or closed >= until or (paid_only and not paid):
+                continue
+            if group == "subtype":
+                key = subtype
+            elif group == "payment-method":
+                key = method
+            elif group == "day":
+                key = int(closed // 86400)
+            elif group == "month":
+                dt = datetime.fromtimestamp(closed, timezone.utc)
+                key = (dt.year - 1970) * 12 + dt.month - 1
+            else:
+                key = int(closed // 86400) * method_count + method
+            bucket = acc.setdefault(key, [0, 0.0, 0])
+            bucket[0] += 1
+            bucket[1] += cost
+            bucket[2] += amount
+        return [
+            {"key": key, "group": self.label(group, key), "orders": o, "revenue": r, "robux": int(x)}
+            for key, (o, r, x) in acc.items()
+        ]
+
+
+_sales_facts: Dict[int, SalesFacts] = {}
+
+
+def sales_facts_for(guild_id: Optional[int]) -> SalesFacts:
+    guild_id = guild_id or PRIMARY_GUILD_ID
+    facts = _sales_facts.get(guild_id)
+    if facts is None:
+        facts = _sales_facts[guild_id] = SalesFacts(guild_path(guild_id, ANALYTICS_DIR))
+    return facts
+
+
+def sales_report_table(rows: List[Dict[str, Any]]) -> str:
+    header = f"{'group':<24}{'orders':>8}{'revenue':>12}{'robux':>12}{'avg order':>11}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(f"{r['group'][:24]:<24}{r['orders']:>8}{r['revenue']:>12,.2f}{r['robux']:>12,}{r['avg_order']:>11,.2f}")
+    return "\n".join(lines)
+
 
-def write_accounting(data):
-    with open(ACCOUNTING_JSON, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def sales_report_csv(rows: List[Dict[str, Any]]) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["group", "orders", "revenue", "robux", "avg_order"])
+    for r in rows:
+        writer.writerow([r["group"], r["orders"], f"{r['revenue']:.2f}", r["robux"], f"{r['avg_order']:.2f}"])
+    return out.getvalue()
 
-def add_to_user_spent(user_id: int, amount: float):
-    data = read_accounting()
-    uid = str(user_id)
-    if uid not in data["users"]:
-        data["users"][uid] = {"spent": 0.0}
-    data["users"][uid]["spent"] += amount
-    write_accounting(data)
 
 # ---------------------------
-# Slash /close command
+# Closed-ticket history: monthly partitions with a per-partition index
 # ---------------------------
-async def handle_close(closer: discord.User, target: discord.TextChannel, is_prefix: bool = False, interaction: Optional[discord.Interaction] = None, ctx: Optional[commands.Context] = None):
-    """Shared logic for closing tickets."""
-    # Find user and ticket amount
-    user = None
-    ticket_amount = 0.0
-    uid_found = None
-    for uid, user_tickets in tickets_data.items():
-        if not isinstance(user_tickets, list):
-            continue
-        for ticket in user_tickets:
-            if isinstance(ticket, dict) and int(ticket.get("channel_id", 0)) == target.id:
-                ticket_amount = ticket.get("total_cost", 0.0)
-                uid_found = uid
+# history/YYYY-MM.jsonl holds one JSON line per closed ticket (by UTC close month). Next to it,
+# YYYY-MM.idx.json records the row count, byte length, first/last close time and each user's line
+# offsets, so lookups open only the partitions a user or date range can be in. The index is kept current
+# in memory but only written every HISTORY_INDEX_EVERY closes, so a close costs one appended line rather
+# than a rewrite of every user's offsets; on load, whatever the data file holds past the index's recorded
+# byte length (those closes, or anything left by a crash) is indexed from the file.
+HISTORY_DIR = "history"
+HISTORY_PAGE = 15
+HISTORY_INDEX_EVERY = 200
+
+
+class TicketHistory:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._indexes: Dict[str, Dict[str, Any]] = {}
+        self._saved_rows: Dict[str, int] = {}  # rows covered by each partition's index file
+
+    def partitions(self) -> List[str]:
+        """Partition names (YYYY-MM), oldest first."""
+        return sorted(name[:-6] for name in os.listdir(self.directory) if name.endswith(".jsonl"))
+
+    def data_path(self, partition: str) -> str:
+        return os.path.join(self.directory, f"{partition}.jsonl")
+
+    def index_path(self, partition: str) -> str:
+        return os.path.join(self.directory, f"{partition}.idx.json")
+
+    def index(self, partition: str) -> Dict[str, Any]:
+        idx = self._indexes.get(partition)
+        if idx is not None:
+            return idx
+        idx = read_json(self.index_path(partition))
+        idx.setdefault("rows", 0)
+        idx.setdefault("bytes", 0)
+        idx.setdefault("first", None)
+        idx.setdefault("last", None)
+        idx.setdefault("users", {})
+        size = os.path.getsize(self.data_path(partition)) if os.path.exists(self.data_path(partition)) else 0
+        if size != idx["bytes"]:
+            if size < idx["bytes"]:
+                idx.update(rows=0, bytes=0, first=None, last=None, users={})
+            self._index_tail(partition, idx)
+            write_state(self.index_path(partition), idx)
+        self._indexes[partition] = idx
+        self._saved_rows[partition] = idx["rows"]
+        return idx
+
+    def _index_tail(self, partition: str, idx: Dict[str, Any]):
+        with open(self.data_path(partition), "rb") as f:
+            f.seek(idx["bytes"])
+            offset = idx["bytes"]
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn final line; the next append starts after it
                 try:
-                    user = await bot.fetch_user(int(uid))
+                    self._index_record(idx, decode_state(line), offset)
                 except Exception:
-                    user = None
+                    state_log.warning("Skipping unreadable history line in %s at byte %d", partition, offset, extra={"path": partition})
+                offset += len(line)
+            idx["bytes"] = offset
+
+    @staticmethod
+    def _index_record(idx: Dict[str, Any], record: Dict[str, Any], offset: int):
+        idx["rows"] += 1
+        closed_at = record.get("closed_at") or 0.0
+        idx["first"] = closed_at if idx["first"] is None else min(idx["first"], closed_at)
+        idx["last"] = closed_at if idx["last"] is None else max(idx["last"], closed_at)
+        idx["users"].setdefault(str(record.get("user_id")), []).append(offset)
+
+    def append(self, ticket: Ticket, closed_at: float, closer_id: int, reason: Optional[str], paid: bool, channel_name: Optional[str] = None):
+        record = ticket.to_record()
+        record.update(channel_name=channel_name, closed_at=closed_at, closer_id=closer_id, close_reason=reason, paid=bool(paid))
+        partition = datetime.fromtimestamp(closed_at, timezone.utc).strftime("%Y-%m")
+        idx = self.index(partition)
+        line = (orjson.dumps(record) if orjson is not None else json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")) + b"\n"
+        path = self.data_path(partition)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            # overwrite any torn line left past the indexed length
+            f.seek(idx["bytes"])
+            f.write(line)
+            f.truncate()
+        self._index_record(idx, record, idx["bytes"])
+        idx["bytes"] += len(line)
+        if idx["rows"] - self._saved_rows.get(partition, 0) >= HISTORY_INDEX_EVERY:
+            write_state(self.index_path(partition), idx)
+            self._saved_rows[partition] = idx["rows"]
+
+    def _read_at(self, partition: str, offsets: List[int]) -> List[Dict[str, Any]]:
+        records = []
+        with open(self.data_path(partition), "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(decode_state(f.readline()))
+        return records
+
+    def for_user(self, user_id: int, limit: int = HISTORY_PAGE) -> List[Dict[str, Any]]:
+        """Most recent closes for a user, newest first. Reads only the lines the indexes point at."""
+        results: List[Dict[str, Any]] = []
+        for partition in reversed(self.partitions()):
+            offsets = self.index(partition)["users"].get(str(user_id))
+            if not offsets:
+                continue
+            records = self._read_at(partition, offsets)
+            results.extend(sorted(records, key=lambda r: r.get("closed_at") or 0.0, reverse=True)[:limit - len(results)])
+            if len(results) >= limit:
                 break
-        else:
-            continue
-        break
-
-    # DM user
-    if user:
-        dm_message = (
-            "✅ **This transaction has been completed!**\n\n"
-            "It has been a pleasure doing business with you! "
-            "Feel free to vouch 💖\n\n"
-            "**HOW TO VOUCH:**\n"
-            "➡️ [Go to the vouch channel](https://discord.com/channels/945694600377552916/965514182986452992)\n\n"
-            "**Be very detailed on your vouches to Shiba!**\n\n"
-            "__Example:__\n"
-            "+Vouch <@1183784957232029742> (items) (price) (your feedback) (photo/proof)\n\n"
-            "+Vouch <@1183784957232029742> 20,000 Robux via Group Payout, 110$! Very Fast. "
-            "(Attached an image/photo)\n\n"
-            "📌 **Please follow the exact format including the '+' as it registers to a bot.**"
-        )
-        embed = discord.Embed(
-            title="Transaction Completed 🎉",
-            description=dm_message,
-            color=discord.Color.green()
-        )
-        try:
-            await user.send(embed=embed)
-        except Exception as e:
-            print(f"Could not DM user: {e}")
-
-    # Update accounting
-    if ticket_amount > 0 and uid_found:
-        add_to_user_spent(int(uid_found), ticket_amount)
-
-    # Close ticket
-    await close_ticket(target, closer, reason="Manual close")
-
-    # Respond
-    if is_prefix and ctx:
-        await ctx.send("Ticket closed successfully.")
-    elif interaction:
-        await interaction.response.send_message("Ticket closed successfully.", ephemeral=True)
-
-@bot.tree.command(name="close", description="Close a ticket (staff only). If no channel provided, will attempt to close current channel.")
-@app_commands.describe(channel="The ticket channel to close (optional)")
-async def slash_close(interaction: discord.Interaction, channel: Optional[discord.TextChannel] = None):
-    member = interaction.user
-    if not isinstance(member, discord.Member):
-        await interaction.response.send_message("This command must be run in a server.", ephemeral=True)
-        return
-
-    has_support = any(r.id == SUPPORT_ROLE_ID for r in member.roles)
-    if not (is_admin_member(member) or has_support):
-        await interaction.response.send_message("You don't have permission to close tickets.", ephemeral=True)
-        return
+        return results[:limit]
+
+    def between(self, since: float, until: float, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Closes with since <= closed_at < until, oldest first. Partitions outside the range aren't opened."""
+        first_month = datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m")
+        last_month = datetime.fromtimestamp(until, timezone.utc).strftime("%Y-%m")
+        results: List[Dict[str, Any]] = []
+        for partition in self.partitions():
+            if partition < first_month or partition > last_month:
+                continue
+            idx = self.index(partition)
+            if not idx["rows"] or idx["last"] < since or idx["first"] >= until:
+                continue
+            if user_id is not None:
+                offsets = idx["users"].get(str(user_id))
+                records = self._read_at(partition, offsets) if offsets else []
+            else:
+                with open(self.data_path(partition), "rb") as f:
+                    records = [decode_state(line) for line in f.read(idx["bytes"]).splitlines() if line.strip()]
+            results.extend(r for r in records if since <= (r.get("closed_at") or 0.0) < until)
+        results.sort(key=lambda r: r.get("closed_at") or 0.0)
+        return results
 
-    target = channel or interaction.channel
-    if not isinstance(target, discord.TextChannel):
-        await interaction.response.send_message("Please provide a valid channel or run this command inside the ticket channel.", ephemeral=True)
-        return
 
-    await handle_close(member, target, is_prefix=False, interaction=interaction)
+_ticket_histories: Dict[int, TicketHistory] = {}
 
-# ---------------------------
-# Prefix ?close command
-# ---------------------------
-@bot.command(name="close")
-async def prefix_close(ctx: commands.Context, channel: Optional[discord.TextChannel] = None):
-    member = ctx.author
-    if not isinstance(member, discord.Member):
-        await ctx.send("This command must be run in a server.")
-        return
 
-    has_support = any(r.id == SUPPORT_ROLE_ID for r in member.roles)
-    if not (is_admin_member(member) or has_support):
-        await ctx.send("You don't have permission to close tickets.")
-        return
+def ticket_history_for(guild_id: Optional[int]) -> TicketHistory:
+    guild_id = guild_id or PRIMARY_GUILD_ID
+    history = _ticket_histories.get(guild_id)
+    if history is None:
+        history = _ticket_histories[guild_id] = TicketHistory(guild_path(guild_id, HISTORY_DIR))
+    return history
 
-    target = channel or ctx.channel
-    if not isinstance(target, discord.TextChannel):
-        await ctx.send("Please provide a valid channel or run this command inside the ticket channel.")
-        return
+HISTORY_CSV_FIELDS = ["closed_at", "created_at", "user_id", "channel_id", "channel_name", "delivery_type", "subtype", "payment_method", "amount", "total_cost", "paid", "closer_id", "close_reason"]
 
-    await handle_close(member, target, is_prefix=True, ctx=ctx)
 
+def format_history_line(record: Dict[str, Any]) -> str:
+    closed = int(record.get("closed_at") or 0)
+    kind = (record.get("subtype") or record.get("delivery_type") or "other").lower()
+    amount = int(record.get("amount") or 0)
+    cost = float(record.get("total_cost") or 0.0)
+    paid = "✅" if record.get("paid") else "❌"
+    reason = record.get("close_reason") or "no reason"
+    return f"{paid} <t:{closed}:d> <@{record.get('user_id')}> • {kind} {amount:,} R$ • ${cost:,.2f} {record.get('payment_method') or ''} • by <@{record.get('closer_id')}> ({reason})"
 
-# ---------------------------
-# Events
-# ---------------------------
-@bot.event
-async def on_message(message: discord.Message):
-    # update ticket last_activity if owner posts in their ticket channel
-    if message.author.bot:
-        return
-    chan = message.channel
-    # Remove from pending auto-closes if someone sends a message
-    pending_auto_closes.pop(chan.id, None)
-    # check if this channel is a ticket channel in tickets_data
-    for uid, user_tickets in tickets_data.items():
-        if not isinstance(user_tickets, list):
-            continue
-        for ticket in user_tickets:
-            if isinstance(ticket, dict) and int(ticket.get("channel_id", 0)) == chan.id:
-                # if author is the ticket owner, update last_activity
-                if int(uid) == message.author.id:
-                    ticket["last_activity"] = datetime.now(timezone.utc).isoformat()
-                    ticket["warned"] = False
-                    ticket["warn_time"] = None
-                    write_json(TICKET_JSON, tickets_data)
-                # also update if support replies? spec said track messages by ticket owner; but let's update last_activity on any new messages in ticket channel
-                else:
-                    ticket["last_activity"] = datetime.now(timezone.utc).isoformat()
-                    write_json(TICKET_JSON, tickets_data)
-                break
-        else:
-            continue
-        break
-
-    # Sticky messages
-    ch_id = str(chan.id)
-    if ch_id in sticky_messages:
-        # Cancel existing task
-        if ch_id in sticky_tasks:
-            sticky_tasks[ch_id].cancel()
-        # Create new task
-        async def send_sticky():
-            await asyncio.sleep(3)  # Delay before sending sticky message
-            try:
-                # Delete old sticky message if exists
-                if ch_id in sticky_message_ids:
-                    try:
-                        old_msg = await chan.fetch_message(sticky_message_ids[ch_id])
-                        await old_msg.delete()
-                    except Exception:
-                        pass
-                # Send new sticky message
-                msg = await chan.send(sticky_messages[ch_id])
-                sticky_message_ids[ch_id] = msg.id
-                write_json(STICKY_IDS_JSON, sticky_message_ids)
-            except Exception as e:
-                print(f"Failed to send sticky to {chan.id}: {e}")
-            sticky_tasks.pop(ch_id, None)
-        task = asyncio.create_task(send_sticky())
-        sticky_tasks[ch_id] = task
 
-    await bot.process_commands(message)
+def history_csv(records: List[Dict[str, Any]]) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HISTORY_CSV_FIELDS)
+    for r in records:
+        row = dict(r)
+        for key in ("closed_at", "created_at"):
+            if row.get(key):
+                row[key] = format_timestamp(row[key])
+        writer.writerow([row.get(k) for k in HISTORY_CSV_FIELDS])
+    return out.getvalue()
 
-# ---------------------------
-# Background Task: Inactivity checks
-# ---------------------------
-@tasks.loop(minutes=60)
-async def check_inactivity():
-    # runs every hour
-    now = datetime.now(timezone.utc)
-    tickets = read_json(TICKET_JSON)
-    changed = False
-    for uid, user_tickets in list(tickets.items()):
-        for i, data in enumerate(user_tickets):
-            if not isinstance(data, dict):
-                continue
-            try:
-                last_str = data.get("last_activity")
-                if not last_str:
-                    continue
-                last = datetime.fromisoformat(last_str)
-                warned = data.get("warned", False)
-                warn_time_str = data.get("warn_time")
-                channel_id = data.get("channel_id")
-                user_id = int(uid)
-                # if > 3 days and not warned -> send warning
-                if not warned:
-                    if now - last >= timedelta(days=3):
-                        # send warning ping to user in channel
-                        try:
-                            chan = bot.get_channel(int(channel_id)) or await bot.fetch_channel(int(channel_id))
-                            if chan:
-                                user = chan.guild.get_member(user_id) or await chan.guild.fetch_member(user_id)
-                                if user:
-                                    await chan.send(content=f"{user.mention} • Your ticket is inactive. It will automatically close in 24 hours unless you reply.")
-                                    # mark warned
-                                    data["warned"] = True
-                                    data["warn_time"] = now.isoformat()
-                                    changed = True
-                        except Exception:
-                            pass
-                else:
-                    # if warned, check if warn_time >=24h ago -> auto close
-                    if warn_time_str:
-                        warn_time = datetime.fromisoformat(warn_time_str)
-                        if now - warn_time >= timedelta(hours=24):
-                            # auto-close
-                            try:
-                                chan = bot.get_channel(channel_id)
-                                if chan:
-                                    # fetch a "system" user for closer? use bot.user
-                                    await close_ticket(chan, closer=bot.user, reason="Auto-closed due to inactivity")
-                                else:
-                                    # channel missing; just remove ticket entry
-                                    user_tickets.pop(i)
-                                    if not user_tickets:
-                                        tickets.pop(uid, None)
-                                    changed = True
-                            except Exception:
-                                # attempt removal
-                                user_tickets.pop(i)
-                                if not user_tickets:
-                                    tickets.pop(uid, None)
-                                changed = True
-            except Exception as e:
-                print("Inactivity check error for ticket", uid, e)
-    if changed:
-        write_json(TICKET_JSON, tickets)
-        # also update in-memory
-        global tickets_data
-        tickets_data = tickets
 
 # ---------------------------
 # Helper: slash command parameter handling fix
@@ -1372,140 +2855,31 @@ async def stick_cmd(interaction: discord.Interaction, channel: discord.TextChann
     await interaction.response.send_modal(modal)
 
 
-TICKET_JSON = "tickets.json"  # make sure this matches your existing filename
-
-def load_tickets():
-    if not os.path.exists(TICKET_JSON):
-        return {}
-    with open(TICKET_JSON, "r") as f:
-        return json.load(f)
-
-def save_tickets(data):
-    with open(TICKET_JSON, "w") as f:
-        json.dump(data, f, indent=4)
-
 
     # ----- CONFIRM COMMANDS -----
 NEEDS_IGG_ID = 1430037751696330872
 NEEDS_GF_ID = 1430037817249239145
 NEEDS_GP_ID = 1430037995678990356
 
-@bot.tree.command(name="confirm-payment", description="Confirm the payment and move ticket to proper category")
-async def slash_conf(interaction: discord.Interaction):
-    await handle_confirmation(interaction.user, interaction.channel, is_prefix=False, interaction=interaction)
-
-@bot.command(name="confirm-payment")
-async def prefix_conf(ctx: commands.Context):
-    await handle_confirmation(ctx.author, ctx.channel, is_prefix=True)
-
-
-async def handle_confirmation(user, channel, is_prefix=False, interaction=None):
-    """Handles moving the ticket and sending the right embed"""
-    tickets = load_tickets()
-    ticket_id = None
-    ticket = None
-    for uid, user_tickets in tickets.items():
-        if not isinstance(user_tickets, list):
-            continue
-        for t in user_tickets:
-            if not isinstance(t, dict):
+# ---------------------------
+# Staff work queue: /next claims the most overdue ticket
+# ---------------------------
+def sync_ticket_stages():
+    """Tickets saved before stages existed all read as "new"; place the ones already sitting in a needs
+    category from the cached channel list (no REST calls)."""
+    changed = 0
+    for ts in ticket_store.snapshot().values():
+        for t in ts:
+            if t.stage != "new":
                 continue
-            if int(t.get("channel_id", 0)) == channel.id:
-                ticket_id = uid
-                ticket = t
-                break
-        if ticket:
-            break
-
-    if not ticket:
-        msg = "This is not a valid ticket channel."
-        if is_prefix:
-            await channel.send(msg)
-        elif interaction:
-            await interaction.response.send_message(msg, ephemeral=True)
-        return
-
-    robux_type = ticket.get("subtype")
-
-    # Check staff permission
-    if isinstance(user, discord.Member):
-        user_roles = [r.id for r in user.roles]
-        if not any(rid in ADMIN_ROLE_IDS + [SUPPORT_ROLE_ID] for rid in user_roles):
-            msg = "You do not have permission to confirm tickets."
-            if is_prefix:
-                await channel.send(msg)
-            elif interaction:
-                await interaction.response.send_message(msg, ephemeral=True)
-            return
-
-    # Determine new category and embed content
-    category_id = None
-    embed = None
-    if robux_type == "ingame":
-        category_id = NEEDS_IGG_ID
-        # Move channel and send a plain message ".igg", then return to avoid the later embed send.
-        new_category = bot.get_channel(category_id)
-        if new_category:
-            await channel.edit(category=new_category)
-            await channel.send(".igg")
-            if not is_prefix and interaction:
-                await interaction.response.send_message("Ticket confirmed and moved.", ephemeral=True)
-        else:
-            msg = "Error: target category not found."
-            if is_prefix:
-                await channel.send(msg)
-            elif interaction:
-                await interaction.response.send_message(msg, ephemeral=True)
-        return
-    elif robux_type == "groupfunds":
-        category_id = NEEDS_GF_ID
-        embed = discord.Embed(
-            title="Group Funds Details Required",
-            description=(
-                "Please provide us with the following:\n\n"
-                "(Username) - (Amount) - Group Funds\n\n"
-                "**Example:**\n`xAriefyk - 1000 - Group Funds`\n"
-                "FOLLOW THE EXAMPLE CLOSELY"
-            ),
-            color=discord.Color.blue()
-        )
-    elif robux_type == "gamepass":
-        category_id = NEEDS_GP_ID
-        embed = discord.Embed(
-            title="Gamepass Purchase Details Required",
-            description=(
-                "Please send the following:\n\n"
-                "• Gamepass link(s)\n"
-                "• Price of each gamepass\n"
-                "• Example:\n"
-                "https://www.roblox.com/game-pass/1016516725/unnamed\n"
-                "44286"
-            ),
-            color=discord.Color.green()
-        )
-    else:
-        msg = "Robux type not found in this ticket."
-        if is_prefix:
-            await channel.send(msg)
-        elif interaction:
-            await interaction.response.send_message(msg, ephemeral=True)
-        return
-
-    # Move the channel
-    new_category = bot.get_channel(category_id)
-    if new_category:
-        await channel.edit(category=new_category)
-        await channel.send(embed=embed)
-        if not is_prefix and interaction:
-            await interaction.response.send_message("Ticket confirmed and moved.", ephemeral=True)
-    else:
-        msg = "Error: target category not found."
-        if is_prefix:
-            await channel.send(msg)
-        elif interaction:
-            await interaction.response.send_message(msg, ephemeral=True)
-
-
+            channel = bot.get_channel(t.channel_id)
+            needs = {cid: sub for sub, cid in guild_config(t.guild_id).needs_category_ids.items()}
+            subtype = needs.get(getattr(channel, "category_id", None))
+            if subtype and ticket_store.update(t.channel_id, expected=t, stage=f"needs_{subtype}"):
+                changed += 1
+    if changed:
+        save_tickets()
+        ticket_log.info("Placed %d tickets in their work-queue stage from their category.", changed)
 
 
 #---exchange api
@@ -1564,6 +2938,34 @@ async def convert_currency(amount: float, from_currency: str, to_currency: str):
 
 
 
+# ---------------------------
+# /stats (staff only): revenue aggregates
+# ---------------------------
+def format_counter(counter: Dict[str, float]) -> str:
+    return f"${counter.get('revenue', 0.0):,.2f} • {int(counter.get('robux', 0)):,} R$ • {int(counter.get('orders', 0))} orders"
+
+
+@bot.tree.command(name="stats", description="Revenue and Robux volume by window, subtype and payment method (staff only)")
+async def stats_cmd(interaction: discord.Interaction):
+    member = interaction.user
+    if not (is_admin_member(member) or has_support_role(member)):
+        await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
+        return
+
+    now = time.time()
+    if shared_state is not None:
+        refresh_revenue(read_accounting(interaction.guild_id), interaction.guild_id)  # pick up sales recorded by the other shard processes
+    revenue_counters, revenue_windows = guild_revenue(interaction.guild_id)
+    embed = discord.Embed(title="📈 Sales Stats", color=discord.Color.blue())
+    embed.add_field(name="Rolling", value="\n".join(f"**{name}:** {format_counter(window.totals(now))}" for name, window in revenue_windows.items()), inline=False)
+    for title, counters in (("By subtype", revenue_counters["totals"]), ("By payment method", revenue_counters["methods"])):
+        ranked = sorted(counters.items(), key=lambda kv: kv[1].get("revenue", 0.0), reverse=True)
+        lines = [f"**{key}:** {format_counter(counter)}" for key, counter in ranked if counter.get("orders")]
+        embed.add_field(name=title, value="\n".join(lines)[:1024] or "No sales recorded yet.", inline=False)
+    embed.set_footer(text="Counts paid closes since revenue tracking was added; manual balance changes aren't included.")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 # ---------------------------
 # /info or ?info @user (staff only)
 # ---------------------------
@@ -1571,11 +2973,11 @@ async def convert_currency(amount: float, from_currency: str, to_currency: str):
 @app_commands.describe(user="The user to check")
 async def slash_info(interaction: discord.Interaction, user: discord.User):
     member = interaction.user
-    if not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
+    if not (is_admin_member(member) or has_support_role(member)):
         await interaction.response.send_message("You don't have permission to view this info.", ephemeral=True)
         return
 
-    data = read_accounting()
+    data = read_accounting(interaction.guild_id)
     spent = data["users"].get(str(user.id), {}).get("spent", 0.0)
 
     embed = discord.Embed(
@@ -1586,9 +2988,10 @@ async def slash_info(interaction: discord.Interaction, user: discord.User):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 @bot.command(name="user-spending")
-@commands.has_any_role(*[SUPPORT_ROLE_ID])  # staff-only prefix version
+@commands.guild_only()
+@commands.check(lambda ctx: isinstance(ctx.author, discord.Member) and has_support_role(ctx.author))  # staff-only prefix version
 async def prefix_info(ctx: commands.Context, user: discord.User):
-    data = read_accounting()
+    data = read_accounting(ctx.guild.id if ctx.guild else None)
     spent = data["users"].get(str(user.id), {}).get("spent", 0.0)
 
     embed = discord.Embed(
@@ -1603,7 +3006,7 @@ async def prefix_info(ctx: commands.Context, user: discord.User):
 # ---------------------------
 @bot.tree.command(name="leaderboard", description="Top 10 users by total spent")
 async def slash_leaderboard(interaction: discord.Interaction):
-    data = read_accounting()
+    data = read_accounting(interaction.guild_id)
     users_spent = [(uid, info["spent"]) for uid, info in data["users"].items()]
     users_spent.sort(key=lambda x: x[1], reverse=True)
     top10 = users_spent[:10]
@@ -1622,7 +3025,7 @@ async def slash_leaderboard(interaction: discord.Interaction):
 
 @bot.command(name="leaderboard")
 async def prefix_leaderboard(ctx: commands.Context):
-    data = read_accounting()
+    data = read_accounting(ctx.guild.id if ctx.guild else None)
     users_spent = [(uid, info["spent"]) for uid, info in data["users"].items()]
     users_spent.sort(key=lambda x: x[1], reverse=True)
     top10 = users_spent[:10]
@@ -1638,51 +3041,6 @@ async def prefix_leaderboard(ctx: commands.Context):
         embed.description = desc
     await ctx.send(embed=embed)
 
-# ---------------------------
-# /closefail or ?closefail <channel?> staff only
-# ---------------------------
-
-# Slash version
-@bot.tree.command(name="close-without-payment", description="Close a ticket without adding money to balance (staff only)")
-@app_commands.describe(channel="The ticket channel to close (optional)")
-async def slash_closefail(interaction: discord.Interaction, channel: Optional[discord.TextChannel] = None):
-    member = interaction.user
-    if not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
-        await interaction.response.send_message("You don't have permission to close tickets.", ephemeral=True)
-        return
-
-    target = channel or interaction.channel
-    if not isinstance(target, discord.TextChannel):
-        await interaction.response.send_message("Please provide a valid channel or run this command inside the ticket channel.", ephemeral=True)
-        return
-
-    await interaction.response.defer(ephemeral=True)
-
-    # Close the ticket with failure logic
-    await closefail_ticket(target, closer=member, reason="Manual closefail")
-
-# Prefix version
-@bot.command(name="close-without-payment")
-async def prefix_closefail(ctx: commands.Context, channel: Optional[discord.TextChannel] = None):
-    member = ctx.author
-    if not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
-        await ctx.send("You don't have permission to close tickets.")
-        return
-
-    target = channel or ctx.channel
-    if not isinstance(target, discord.TextChannel):
-        await ctx.send("Please provide a valid channel or run this command inside the ticket channel.")
-        return
-
-    # Close the ticket with failure logic
-    await closefail_ticket(target, closer=member, reason="Manual closefail")
-
-
-
-
-
-
-
 # ---------------------------
 # Slash commands
 # ---------------------------
@@ -1690,22 +3048,16 @@ async def prefix_closefail(ctx: commands.Context, channel: Optional[discord.Text
 @app_commands.describe(user="The user to add balance to", amount="Amount to add (in USD)")
 async def slash_addbal(interaction: discord.Interaction, user: discord.User, amount: float):
     member = interaction.user
-    if not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
+    if not (is_admin_member(member) or has_support_role(member)):
         await interaction.response.send_message("You don't have permission to modify balances.", ephemeral=True)
         return
 
     try:
-        data = read_accounting()
-        uid = str(user.id)
-        if uid not in data["users"]:
-            data["users"][uid] = {"spent": 0.0}
-        
-        data["users"][uid]["spent"] += amount
-        write_accounting(data)
+        new_total = change_user_spent(user.id, amount, guild_id=interaction.guild_id)
 
         embed = discord.Embed(
             title="Balance Updated ✅",
-            description=f"Added ${amount:,.2f} to {user.mention}'s balance\nNew total: ${data['users'][uid]['spent']:,.2f}",
+            description=f"Added ${amount:,.2f} to {user.mention}'s balance\nNew total: ${new_total:,.2f}",
             color=discord.Color.green()
         )
         await interaction.response.send_message(embed=embed)
@@ -1717,22 +3069,16 @@ async def slash_addbal(interaction: discord.Interaction, user: discord.User, amo
 @app_commands.describe(user="The user to subtract balance from", amount="Amount to subtract (in USD)")
 async def slash_subbal(interaction: discord.Interaction, user: discord.User, amount: float):
     member = interaction.user
-    if not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
+    if not (is_admin_member(member) or has_support_role(member)):
         await interaction.response.send_message("You don't have permission to modify balances.", ephemeral=True)
         return
 
     try:
-        data = read_accounting()
-        uid = str(user.id)
-        if uid not in data["users"]:
-            data["users"][uid] = {"spent": 0.0}
-        
-        data["users"][uid]["spent"] = max(0, data["users"][uid]["spent"] - amount)
-        write_accounting(data)
+        new_total = change_user_spent(user.id, amount, subtract=True, guild_id=interaction.guild_id)
 
         embed = discord.Embed(
             title="Balance Updated ✅",
-            description=f"Subtracted ${amount:,.2f} from {user.mention}'s balance\nNew total: ${data['users'][uid]['spent']:,.2f}",
+            description=f"Subtracted ${amount:,.2f} from {user.mention}'s balance\nNew total: ${new_total:,.2f}",
             color=discord.Color.green()
         )
         await interaction.response.send_message(embed=embed)
@@ -1740,28 +3086,160 @@ async def slash_subbal(interaction: discord.Interaction, user: discord.User, amo
         await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
 
 
+# ---------------------------
+# /import-balances (admins only): bulk balance adjustments from a CSV
+# ---------------------------
+# One row per adjustment: user id, delta (USD, negative to subtract), optional note; a header row is
+# allowed. Any invalid row rejects the whole file. Rows apply in file order with /subtract-spending's
+# rule (a total never drops below zero), inside one accounting update, so the file is written once.
+# Applied rows are appended to balance_imports.jsonl with the before/after totals.
+BALANCE_IMPORTS_LOG = "balance_imports.jsonl"
+IMPORT_MAX_BYTES = 25 * 1024 * 1024
+IMPORT_MAX_ROWS = 200_000
+IMPORT_MAX_ERRORS = 10
+
+
+def parse_balance_csv(raw: bytes) -> tuple[List[tuple[int, float, str]], List[str]]:
+    """Parse and validate an import file; returns (rows, errors) with errors as 'line N: ...' strings."""
+    rows: List[tuple[int, float, str]] = []
+    errors: List[str] = []
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(raw), encoding="utf-8-sig", newline=""))
+    for line, fields in enumerate(reader, start=1):
+        if not fields or not "".join(fields).strip():
+            continue
+        if line == 1 and not fields[0].strip().isdigit():
+            continue  # header
+        if len(rows) >= IMPORT_MAX_ROWS:
+            errors.append(f"more than {IMPORT_MAX_ROWS:,} rows")
+            break
+        if len(fields) < 2:
+            errors.append(f"line {line}: expected user id, delta[, note]")
+        else:
+            uid, delta, note = fields[0].strip(), fields[1].strip(), (fields[2].strip() if len(fields) > 2 else "")
+            try:
+                amount = float(delta)
+            except ValueError:
+                amount = float("nan")
+            if not (uid.isdigit() and 15 <= len(uid) <= 20):
+                errors.append(f"line {line}: {uid!r} isn't a user id")
+            elif amount != amount or amount in (float("inf"), float("-inf")):
+                errors.append(f"line {line}: {delta!r} isn't an amount")
+            else:
+                rows.append((int(uid), amount, note[:200]))
+        if len(errors) >= IMPORT_MAX_ERRORS:
+            break
+    return rows, errors
+
+
+def apply_balance_rows(users: Dict[str, Any], rows: List[tuple[int, float, str]]) -> Dict[str, Any]:
+    """Apply rows to an accounting "users" dict in place; returns a summary and the per-row audit entries."""
+    before: Dict[str, float] = {}
+    audit = []
+    added = removed = 0.0
+    clamped = created = 0
+    for user_id, delta, note in rows:
+        uid = str(user_id)
+        user = users.get(uid)
+        if user is None:
+            user = users[uid] = {"spent": 0.0}
+            created += 1
+        old = user["spent"]
+        before.setdefault(uid, old)
+        new = old + delta if delta >= 0 else max(0, old + delta)
+        if delta < 0 and old + delta < 0:
+            clamped += 1
+        user["spent"] = new
+        added += max(delta, 0.0)
+        removed += old - new if delta < 0 else 0.0
+        audit.append({"user_id": user_id, "delta": delta, "before": old, "after": new, "note": note})
+    net = sorted(((users[uid]["spent"] - old, uid) for uid, old in before.items()), key=lambda c: abs(c[0]), reverse=True)
+    return {
+        "rows": len(rows),
+        "users": len(before),
+        "new_users": created,
+        "added": added,
+        "removed": removed,
+        "clamped": clamped,
+        "largest": net[:5],
+        "audit": audit,
+    }
+
+
+@bot.tree.command(name="import-balances", description="Apply balance adjustments from a CSV of user id, delta, note (admins only)")
+@app_commands.describe(file="CSV with columns user id, delta (USD, negative subtracts), note", dry_run="Only preview the result (default)")
+async def import_balances_cmd(interaction: discord.Interaction, file: discord.Attachment, dry_run: bool = True):
+    member = interaction.user
+    if not isinstance(member, discord.Member) or not is_admin_member(member):
+        await interaction.response.send_message("No permission.", ephemeral=True)
+        return
+    if file.size > IMPORT_MAX_BYTES:
+        await interaction.response.send_message(f"That file is over {IMPORT_MAX_BYTES // (1024 * 1024)} MB.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    rows, errors = parse_balance_csv(await file.read())
+    if errors:
+        await interaction.followup.send("Nothing was applied, fix these rows first:\n" + "\n".join(f"• {e}" for e in errors), ephemeral=True)
+        return
+    if not rows:
+        await interaction.followup.send("The file has no rows.", ephemeral=True)
+        return
+
+    guild_id = interaction.guild_id
+    if dry_run:
+        # simulate on copies of just the affected users
+        current = read_accounting(guild_id)["users"]
+        preview = {uid: dict(current[uid]) for uid in {str(r[0]) for r in rows} if uid in current}
+        summary = apply_balance_rows(preview, rows)
+    else:
+        summary = {}
+
+        def apply(data):
+            summary.update(apply_balance_rows(data["users"], rows))
+        update_accounting(apply, guild_id)
+        stamp = datetime.now(timezone.utc).isoformat()
+
+        def append_audit():
+            with open(guild_path(guild_id, BALANCE_IMPORTS_LOG), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps({"at": stamp, "by": member.id, "file": file.filename, **entry}) + "\n" for entry in summary["audit"]))
+        try:
+            await state_writer.run(append_audit)
+        except Exception as e:
+            state_log.error("Failed to write the balance import log: %s", e, extra={"user": member.id})
+
+    largest = "\n".join(f"<@{uid}> {change:+,.2f}" for change, uid in summary["largest"])
+    embed = discord.Embed(
+        title="Balance Import Preview" if dry_run else "Balance Import Applied ✅",
+        description=(
+            f"{summary['rows']:,} rows • {summary['users']:,} users ({summary['new_users']:,} new)\n"
+            f"Added ${summary['added']:,.2f} • Removed ${summary['removed']:,.2f}"
+            + (f"\n{summary['clamped']:,} subtractions stopped at $0.00" if summary["clamped"] else "")
+        ),
+        color=discord.Color.blue() if dry_run else discord.Color.green(),
+    )
+    if largest:
+        embed.add_field(name="Largest net changes", value=largest, inline=False)
+    if dry_run:
+        embed.set_footer(text="Run again with dry_run: False to apply.")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+
 # ---------------------------
 # Prefix (!) versions for staff
 # ---------------------------
 @bot.command(name="add-spending")
 async def prefix_addbal(ctx: commands.Context, user: discord.User, amount: float):
     member = ctx.author
-    if not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
+    if not (is_admin_member(member) or has_support_role(member)):
         await ctx.send("You don't have permission to modify balances.")
         return
 
     try:
-        data = read_accounting()
-        uid = str(user.id)
-        if uid not in data["users"]:
-            data["users"][uid] = {"spent": 0.0}
-
-        data["users"][uid]["spent"] += amount
-        write_accounting(data)
+        new_total = change_user_spent(user.id, amount, guild_id=ctx.guild.id if ctx.guild else None)
 
         embed = discord.Embed(
             title="Balance Updated ✅",
-            description=f"Added ${amount:,.2f} to {user.mention}'s balance\nNew total: ${data['users'][uid]['spent']:,.2f}",
+            description=f"Added ${amount:,.2f} to {user.mention}'s balance\nNew total: ${new_total:,.2f}",
             color=discord.Color.green()
         )
         await ctx.send(embed=embed)
@@ -1772,22 +3250,16 @@ async def prefix_addbal(ctx: commands.Context, user: discord.User, amount: float
 @bot.command(name="subtract-spending")
 async def prefix_subbal(ctx: commands.Context, user: discord.User, amount: float):
     member = ctx.author
-    if not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
+    if not (is_admin_member(member) or has_support_role(member)):
         await ctx.send("You don't have permission to modify balances.")
         return
 
     try:
-        data = read_accounting()
-        uid = str(user.id)
-        if uid not in data["users"]:
-            data["users"][uid] = {"spent": 0.0}
-
-        data["users"][uid]["spent"] = max(0, data['users'][uid]['spent'] - amount)
-        write_accounting(data)
+        new_total = change_user_spent(user.id, amount, subtract=True, guild_id=ctx.guild.id if ctx.guild else None)
 
         embed = discord.Embed(
             title="Balance Updated ✅",
-            description=f"Subtracted ${amount:,.2f} from {user.mention}'s balance\nNew total: ${data['users'][uid]['spent']:,.2f}",
+            description=f"Subtracted ${amount:,.2f} from {user.mention}'s balance\nNew total: ${new_total:,.2f}",
             color=discord.Color.green()
         )
         await ctx.send(embed=embed)
@@ -1822,38 +3294,11 @@ ROLE_THRESHOLDS = [
     (100, 965514388759007282),     # $100
 ]
 
-@tasks.loop(minutes=1)  # adjust frequency as needed
-async def update_all_spender_roles():
-    for guild in bot.guilds:
-        data = read_accounting()
-        for uid, info in data.get("users", {}).items():
-            member = guild.get_member(int(uid))
-            if not member:
-                continue  # skip if user not in guild
 
-            amount_spent = info.get("spent", 0)
-            assigned_role = None
 
-            # Determine the highest tier role the user qualifies for
-            for threshold, role_id in ROLE_THRESHOLDS:
-                if amount_spent >= threshold:
-                    assigned_role = guild.get_role(role_id)
-                    break
 
-            if not assigned_role:
-                continue  # user doesn't qualify for any role
 
-            # Remove lower-tier roles
-            roles_to_remove = [guild.get_role(rid) for t, rid in ROLE_THRESHOLDS if rid != assigned_role.id]
-            roles_to_remove = [r for r in roles_to_remove if r in member.roles]
 
-            try:
-                if roles_to_remove:
-                    await member.remove_roles(*roles_to_remove, reason="Upgrading spender role")
-                if assigned_role not in member.roles:
-                    await member.add_roles(assigned_role, reason="Spender role based on balance")
-            except Exception as e:
-                print(f"Error updating roles for {member}: {e}")
 
 
 
@@ -1871,42 +3316,511 @@ async def update_all_spender_roles():
 
 
 
+
+# ---------------------------
+# State export: readable copy of a state file (admins only)
+# ---------------------------
+EXPORTABLE_STATE = {
+    "tickets": TICKET_JSON,
+    "accounting": ACCOUNTING_JSON,
+    "payment-info": PAYMENT_JSON,
+    "prices": PRICES_PATH,
+    "payment-fees": PAYMENT_FEES_PATH,
+    "sticky-messages": STICKY_JSON,
+    "sticky-message-ids": STICKY_IDS_JSON,
+    "pending-closes": PENDING_CLOSES_JSON,
+}
+
+
+@bot.tree.command(name="export-state", description="Download a pretty-printed JSON copy of a state file (admins only)")
+@app_commands.describe(name="Which state file to export")
+@app_commands.choices(name=[app_commands.Choice(name=key, value=key) for key in EXPORTABLE_STATE])
+async def export_state_cmd(interaction: discord.Interaction, name: str):
+    member = interaction.user
+    if not isinstance(member, discord.Member) or not is_admin_member(member):
+        await interaction.response.send_message("No permission.", ephemeral=True)
+        return
+    path = EXPORTABLE_STATE[name]
+    # wait for queued writes so the export shows exactly what's on disk
+    await state_writer.drain()
+    if not os.path.exists(path):
+        await interaction.response.send_message(f"`{path}` doesn't exist yet.", ephemeral=True)
+        return
+    readable = json.dumps(read_json(path), indent=2, default=str, ensure_ascii=False)
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    file = discord.File(io.BytesIO(readable.encode("utf-8")), filename=f"{name}_{ts}.json")
+    await interaction.response.send_message(f"`{path}` ({os.path.getsize(path)} bytes on disk, codec {STATE_CODEC})", file=file, ephemeral=True)
+
+
+# ---------------------------
+# Diagnostics: on-demand profiler + allocation snapshots (admins only)
+# ---------------------------
+PROFILE_MAX_SECONDS = 600
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+
+# Only one profiling session may run at a time
+profile_session: Optional[Dict[str, Any]] = None
+tracemalloc_baseline: Optional[tracemalloc.Snapshot] = None
+
+
+class StackSampler:
+    """Periodically samples the event loop thread's stack from a side thread.
+    Output is in collapsed-stack format (one "a;b;c count" line per stack) so it can be fed to flamegraph.pl.
+    """
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.leaves: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if not frames:
+                continue
+            self.leaves[frames[0]] += 1
+            self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+    def report(self) -> str:
+        lines = [f"# {self.samples} samples, every {self.interval * 1000:.1f}ms", "# Top functions by self samples:"]
+        for name, n in self.leaves.most_common(30):
+            lines.append(f"#   {n:6d} {n / max(self.samples, 1):6.1%}  {name}")
+        lines.append("")
+        lines.extend(f"{stack} {n}" for stack, n in self.stacks.most_common())
+        return "\n".join(lines)
+
+
+async def get_log_channel():
+    try:
+        log_channel_id = guild_config(PRIMARY_GUILD_ID).log_channel_id
+        return bot.get_channel(log_channel_id) or await bot.fetch_channel(log_channel_id)
+    except Exception:
+        return None
+
+
+async def upload_diagnostics(content: str, files: List[discord.File]) -> bool:
+    """Upload diagnostic report files to the log channel. Returns False if the log channel is unavailable."""
+    log_chan = await get_log_channel()
+    if not log_chan:
+        return False
+    try:
+        await log_chan.send(content=content, files=files)
+        return True
+    except Exception as e:
+        log.warning("Failed to upload diagnostics: %s", e)
+        return False
+
+
+def start_profile_session(mode: str, seconds: int, started_by: discord.abc.User) -> Dict[str, Any]:
+    session: Dict[str, Any] = {"mode": mode, "seconds": seconds, "started_by": started_by, "started_at": datetime.now(timezone.utc)}
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        # The bot runs on a single event loop thread, so enabling here profiles every handler and task
+        profiler.enable()
+        session["profiler"] = profiler
+    else:
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        session["sampler"] = sampler
+    return session
+
+
+async def finish_profile_session(reason: str):
+    """Stop the running profiling session (if any) and upload its results to the log channel."""
+    global profile_session
+    session = profile_session
+    if session is None:
+        return
+    profile_session = None
+    timer = session.get("timer")
+    if timer and timer is not asyncio.current_task():
+        timer.cancel()
+
+    ts = session["started_at"].strftime("%Y%m%d_%H%M%S")
+    elapsed = (datetime.now(timezone.utc) - session["started_at"]).total_seconds()
+    files: List[discord.File] = []
+    if session["mode"] == "cprofile":
+        profiler: cProfile.Profile = session["profiler"]
+        profiler.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(80)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(40)
+        files.append(discord.File(io.BytesIO(out.getvalue().encode("utf-8")), filename=f"profile_{ts}.txt"))
+        # Raw stats, loadable with pstats.Stats / snakeviz
+        files.append(discord.File(io.BytesIO(marshal.dumps(stats.stats)), filename=f"profile_{ts}.prof"))
+    else:
+        sampler: StackSampler = session["sampler"]
+        await asyncio.to_thread(sampler.stop)
+        files.append(discord.File(io.BytesIO(sampler.report().encode("utf-8")), filename=f"samples_{ts}.folded"))
+
+    starter = session["started_by"]
+    await upload_diagnostics(
+        f"Profile ({session['mode']}) finished after {elapsed:.1f}s • Started by: {starter.mention} ({starter.id}) • {reason}",
+        files,
+    )
+
+
+async def profile_timer(seconds: int):
+    await asyncio.sleep(seconds)
+    await finish_profile_session("Time limit reached")
 
 
+@bot.tree.command(name="profile-start", description="Profile the bot for N seconds and upload results to the log channel (admins only)")
+@app_commands.describe(seconds="How long to profile for (max 600)", mode="cprofile (exact, higher overhead) or sampling (low overhead)")
+@app_commands.choices(mode=[
+    app_commands.Choice(name="Sampling", value="sampling"),
+    app_commands.Choice(name="cProfile", value="cprofile"),
+])
+async def profile_start_cmd(interaction: discord.Interaction, seconds: int = 30, mode: str = "sampling"):
+    global profile_session
+    member = interaction.user
+    if not isinstance(member, discord.Member) or not is_admin_member(member):
+        await interaction.response.send_message("No permission.", ephemeral=True)
+        return
+    if profile_session is not None:
+        await interaction.response.send_message(f"A {profile_session['mode']} session is already running. Use `/profile-stop` first.", ephemeral=True)
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    profile_session = start_profile_session(mode, seconds, member)
+    profile_session["timer"] = asyncio.create_task(profile_timer(seconds))
+    await interaction.response.send_message(f"Started **{mode}** profiling for {seconds}s. Results will be posted to <#{guild_config(PRIMARY_GUILD_ID).log_channel_id}>.", ephemeral=True)
 
 
+@bot.tree.command(name="profile-stop", description="Stop the running profiler early and upload results (admins only)")
+async def profile_stop_cmd(interaction: discord.Interaction):
+    member = interaction.user
+    if not isinstance(member, discord.Member) or not is_admin_member(member):
+        await interaction.response.send_message("No permission.", ephemeral=True)
+        return
+    if profile_session is None:
+        await interaction.response.send_message("No profiling session is running.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    await finish_profile_session(f"Stopped by {member}")
+    await interaction.followup.send("Profiling stopped. Results posted to the log channel.", ephemeral=True)
 
 
-@bot.tree.command(name="add-user-to-ticket", description="Add a user to the ticket (staff only).")
-@app_commands.describe(user="The user to add to the ticket")
-async def add_people_cmd(interaction: discord.Interaction, user: discord.User):
+def tracked_object_counts() -> Dict[str, int]:
+    """Sizes of long-lived containers plus live instances of our View/Modal classes (common leak suspects)."""
+    counts = {
+        "sticky_tasks": len(sticky_tasks),
+        "sticky_messages": len(sticky_messages),
+        "open tickets": len(ticket_store),
+        "pending_auto_closes": len(pending_auto_closes),
+    }
+    views = Counter(type(o).__name__ for o in gc.get_objects() if isinstance(o, (View, Modal)))
+    for name, n in sorted(views.items()):
+        counts[f"{name} instances"] = n
+    return counts
+
+
+def memory_snapshot_report(snapshot: tracemalloc.Snapshot, baseline: tracemalloc.Snapshot, limit: int) -> str:
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ]
+    snapshot = snapshot.filter_traces(filters)
+    baseline = baseline.filter_traces(filters)
+    current, peak = tracemalloc.get_traced_memory()
+
+    lines = [f"Traced memory: current {current / 1024 / 1024:.2f} MiB, peak {peak / 1024 / 1024:.2f} MiB", "", "Tracked objects:"]
+    lines.extend(f"  {name}: {n}" for name, n in tracked_object_counts().items())
+
+    lines += ["", f"Top {limit} allocation sites by growth since baseline:"]
+    for diff in snapshot.compare_to(baseline, "lineno")[:limit]:
+        lines.append(f"  {diff}")
+
+    lines += ["", "Tracebacks for the top 5 growing sites:"]
+    for diff in snapshot.compare_to(baseline, "traceback")[:5]:
+        lines.append(f"  {diff.size_diff / 1024:+.1f} KiB, {diff.count_diff:+d} blocks")
+        lines.extend(f"    {line}" for line in diff.traceback.format())
+    return "\n".join(lines)
+
+
+@bot.tree.command(name="memory-snapshot", description="Diff tracemalloc allocation snapshots and upload to the log channel (admins only)")
+@app_commands.describe(action="diff (starts tracing on first use), reset the baseline, or stop tracing", limit="Number of allocation sites to show")
+@app_commands.choices(action=[
+    app_commands.Choice(name="Diff against baseline", value="diff"),
+    app_commands.Choice(name="Reset baseline", value="reset"),
+    app_commands.Choice(name="Stop tracing", value="stop"),
+])
+async def memory_snapshot_cmd(interaction: discord.Interaction, action: str = "diff", limit: int = 25):
+    global tracemalloc_baseline
     member = interaction.user
-    if not isinstance(member, discord.Member) or not (is_admin_member(member) or any(r.id == SUPPORT_ROLE_ID for r in member.roles)):
-        await interaction.response.send_message("You don't have permission to add users to tickets.", ephemeral=True)
+    if not isinstance(member, discord.Member) or not is_admin_member(member):
+        await interaction.response.send_message("No permission.", ephemeral=True)
+        return
+
+    if action == "stop":
+        tracemalloc.stop()
+        tracemalloc_baseline = None
+        await interaction.response.send_message("tracemalloc stopped.", ephemeral=True)
         return
 
-    channel = interaction.channel
-    if not isinstance(channel, discord.TextChannel):
-        await interaction.response.send_message("This command can only be used in a ticket channel.", ephemeral=True)
+    if not tracemalloc.is_tracing() or tracemalloc_baseline is None or action == "reset":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        tracemalloc_baseline = tracemalloc.take_snapshot()
+        await interaction.response.send_message("Baseline snapshot taken. Run `/memory-snapshot` again later to see what grew.", ephemeral=True)
         return
 
-    # Build overwrites for the user
-    overwrites = channel.overwrites_for(user)
-    overwrites.view_channel = True
-    overwrites.send_messages = True
-    await channel.set_permissions(user, overwrite=overwrites)
+    await interaction.response.defer(ephemeral=True)
+    snapshot = tracemalloc.take_snapshot()
+    report = memory_snapshot_report(snapshot, tracemalloc_baseline, max(1, min(limit, 200)))
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    file = discord.File(io.BytesIO(report.encode("utf-8")), filename=f"memory_{ts}.txt")
+    if await upload_diagnostics(f"Memory snapshot diff • Requested by: {member.mention} ({member.id})", [file]):
+        await interaction.followup.send("Snapshot diff posted to the log channel.", ephemeral=True)
+    else:
+        await interaction.followup.send("Couldn't reach the log channel.", ephemeral=True)
+
+
+
+
+
+
+
+
+
+
+# ---------------------------
+# Traffic recorder (opt-in): anonymized gateway traces for replay.py
+# ---------------------------
+# Set TRACE_DIR to record. Ids are salted hashes and message text is reduced to its length, so traces
+# can be shared for benchmarking without exposing users. Files are gzipped JSON lines, one event per line.
+# Events are encoded on the event loop and handed to a writer thread over a bounded queue; compression,
+# file writes and pruning old traces happen there. If the writer falls TRACE_QUEUE_SIZE events behind,
+# new events are dropped and counted rather than blocking the loop.
+TRACE_DIR = os.getenv("TRACE_DIR")
+TRACE_ROTATE_BYTES = int(float(os.getenv("TRACE_ROTATE_MB", "16")) * 1024 * 1024)  # uncompressed event bytes per file
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "48"))  # newest files kept; older ones are deleted on rotation
+TRACE_FLUSH_SECONDS = 5
+TRACE_QUEUE_SIZE = 10000
+TRACE_FORMAT_VERSION = 1
+RANDOM_CUSTOM_ID = re.compile(r"[0-9a-f]{32}")  # discord.py's auto-generated ids carry no meaning across runs
+
+
+class TrafficRecorder:
+    def __init__(self, directory: str, rotate_bytes: int, keep: int, salt: bytes):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.keep = keep
+        self.salt = salt
+        self.written = 0  # event bytes queued for the current file; its header doesn't count
+        self.sequence = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(TRACE_QUEUE_SIZE)
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def anon(self, snowflake: Any) -> int:
+        digest = hashlib.blake2b(str(snowflake).encode(), key=self.salt, digest_size=7).digest()
+        return int.from_bytes(digest, "big")
+
+    def record(self, event: Dict[str, Any]):
+        try:
+            if self.sequence == 0 or self.written >= self.rotate_bytes:
+                self._rotate()
+            event["t"] = round(time.time(), 3)
+            line = json.dumps(event, separators=(",", ":")) + "\n"
+            if self._put(line):
+                self.written += len(line)
+        except Exception as e:
+            log.warning("Trace recording failed: %s", e)
+
+    def _put(self, item) -> bool:
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _rotate(self):
+        path = os.path.join(self.directory, f"trace-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.sequence:04d}.jsonl.gz")
+        # Each file starts with enough state for the replayer to stand alone. The snapshot is taken here,
+        # on the loop, where the ticket store and channel cache are consistent; it isn't counted against
+        # rotate_bytes, or a snapshot bigger than that would rotate again on every event.
+        header = {"e": "header", "v": TRACE_FORMAT_VERSION, "tickets": self.ticket_snapshot(), "sticky": [self.anon(c) for c in sticky_messages], "t": round(time.time(), 3)}
+        if self._put((path, json.dumps(header, separators=(",", ":")) + "\n")):
+            self.sequence += 1
+            self.written = 0
+
+    def _run(self):
+        file = None
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=TRACE_FLUSH_SECONDS)
+            except queue.Empty:
+                item = ""  # idle: only the flush below
+            if item is None:
+                break
+            try:
+                if isinstance(item, tuple):
+                    path, header = item
+                    if file is not None:
+                        file.close()
+                    file = gzip.open(path, "wt", encoding="utf-8")
+                    file.write(header)
+                    self._prune()
+                elif item and file is not None:
+                    file.write(item)
+                # bound what a crash can lose; a truncated gzip tail is tolerated by replay.py
+                if file is not None and time.monotonic() - last_flush >= TRACE_FLUSH_SECONDS:
+                    file.flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                log.warning("Trace recording failed: %s", e)
+        if file is not None:
+            file.close()
 
-    await interaction.response.send_message(f"{user.mention} has been added to the ticket.", ephemeral=True)
+    def _prune(self):
+        traces = sorted(p for p in os.listdir(self.directory) if p.startswith("trace-") and p.endswith(".jsonl.gz"))
+        for old in traces[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
 
+    def ticket_snapshot(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        snapshot = []
+        for uid, user_tickets in ticket_store.snapshot().items():
+            for ticket in user_tickets:
+                channel = bot.get_channel(ticket.channel_id)
+                snapshot.append({
+                    "c": self.anon(ticket.channel_id),
+                    "cat": getattr(channel, "category_id", None),
+                    "o": self.anon(uid),
+                    "d": ticket.delivery_type,
+                    "sub": ticket.subtype,
+                    "pm": ticket.payment_method,
+                    "amt": ticket.amount,
+                    "cost": ticket.total_cost,
+                    "idle": round(now - ticket.last_activity),
+                    "w": ticket.warned,
+                })
+        return snapshot
+
+    def close(self):
+        """Write out everything queued and close the current file (registered with atexit)."""
+        if self._thread.is_alive():
+            # a blocking put: at shutdown, wait for the writer to make room rather than lose the tail
+            self._queue.put(None)
+            self._thread.join()
+
+
+traffic_recorder: Optional[TrafficRecorder] = None
+if TRACE_DIR:
+    salt = os.getenv("TRACE_SALT")
+    # Without a fixed salt, ids are only consistent within one bot run
+    traffic_recorder = TrafficRecorder(TRACE_DIR, TRACE_ROTATE_BYTES, TRACE_KEEP, salt.encode()[:64] if salt else os.urandom(32))
+    atexit.register(traffic_recorder.close)
+
+
+def is_staff_member(member: Any) -> bool:
+    if not isinstance(member, discord.Member):
+        return False
+    return is_admin_member(member) or has_support_role(member)
+
+
+def anonymize_interaction(interaction: discord.Interaction) -> Dict[str, Any]:
+    anon = traffic_recorder.anon
+    data = interaction.data or {}
+    event = {
+        "e": "int",
+        "k": interaction.type.value,
+        "c": anon(interaction.channel_id),
+        "u": anon(interaction.user.id),
+        "s": is_staff_member(interaction.user),
+    }
+    if interaction.type == discord.InteractionType.application_command:
+        event["cmd"] = data.get("name")
+        options = {}
+        for opt in data.get("options", []):
+            # 6 user, 7 channel, 8 role, 9 mentionable: ids; anything else is a plain value
+            if opt.get("type") in (6, 7, 9):
+                options[opt["name"]] = {"id": anon(opt.get("value"))}
+            elif opt.get("type") == 3:
+                options[opt["name"]] = {"len": len(str(opt.get("value", "")))}
+            else:
+                options[opt["name"]] = {"v": opt.get("value")}
+        if options:
+            event["opt"] = options
+    elif interaction.type == discord.InteractionType.component:
+        custom_id = data.get("custom_id", "")
+        if not RANDOM_CUSTOM_ID.fullmatch(custom_id):
+            event["cid"] = custom_id
+        if data.get("values"):
+            # select values are our own option keys (delivery type, subtype, payment method), never user text
+            event["v"] = data["values"]
+    elif interaction.type == discord.InteractionType.modal_submit:
+        for row in data.get("components", []):
+            for comp in row.get("components") or [row.get("component") or {}]:
+                raw = str(comp.get("value", "")).strip().replace(",", "")
+                if raw.isdigit():
+                    event["amt"] = int(raw)
+                else:
+                    event["len"] = len(raw)
+    return event
 
 
+@bot.listen("on_message")
+async def record_message(message: discord.Message):
+    if traffic_recorder is None or message.author.bot:
+        return
+    event = {"e": "msg", "c": traffic_recorder.anon(message.channel.id), "u": traffic_recorder.anon(message.author.id), "s": is_staff_member(message.author), "len": len(message.content)}
+    if message.content.startswith(bot.command_prefix):
+        event["cmd"] = message.content[len(bot.command_prefix):].split(" ", 1)[0]
+    traffic_recorder.record(event)
 
 
+@bot.listen("on_interaction")
+async def record_interaction(interaction: discord.Interaction):
+    if traffic_recorder is None:
+        return
+    traffic_recorder.record(anonymize_interaction(interaction))
 
 
+@bot.listen("on_member_update")
+async def record_member_update(before: discord.Member, after: discord.Member):
+    if traffic_recorder is None or before.roles == after.roles:
+        return
+    # role ids are server config, not personal data
+    traffic_recorder.record({"e": "member", "u": traffic_recorder.anon(after.id), "r": [r.id for r in after.roles if not r.is_default()]})
 
 
+@bot.listen("on_guild_channel_create")
+async def record_channel_create(channel: discord.abc.GuildChannel):
+    if traffic_recorder is None:
+        return
+    # Ticket channels carry "Ticket for name (id)" in the topic; lets the replayer bind the trace's channel id
+    # to the channel its own create_ticket_for_user makes
+    match = re.search(r"\((\d+)\)$", getattr(channel, "topic", None) or "")
+    traffic_recorder.record({"e": "chan", "c": traffic_recorder.anon(channel.id), "o": traffic_recorder.anon(match.group(1)) if match else None})
 
 
-# Start the bot
-bot.run(TOKEN)
+# Start the bot (python main.py runs this through the guard at the top of the file)
+def run():
+    # log_handler=None: discord.py's records go through the queue handler set up above
+    bot.run(TOKEN, log_handler=None)
@@ -0,0 +1,994 @@
+# mock_discord.py
+# A local stand-in for the Discord REST API and gateway, for end-to-end load and rate-limit testing on one box.
+# It implements only what main.py uses (channels, messages, history, roles, members, users, interactions)
+# plus Discord-style 429 buckets and configurable latency.
+#
+#   python mock_discord.py serve --port 8787                       # then run the bot with:
+#       DISCORD_API_BASE=http://127.0.0.1:8787/api/v10 DISCORD_GATEWAY_URL=ws://127.0.0.1:8787/gateway \
+#       TOKEN=mock GIT_SYNC=0 python main.py
+#   python mock_discord.py rush --buyers 200 --rate 20              # starts the mock + bot and simulates a sale rush
+#
+# The guild layout (categories, roles, log channel...) is read from main.py's config so the bot finds everything.
+import argparse
+import ast
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web, WSMsgType
+
+DISCORD_EPOCH = 1420070400000
+API_PREFIX = "/api/v10"
+EPHEMERAL = 1 << 6
+
+# Route template -> (requests, per seconds). Buckets are keyed per major parameter (channel/guild/webhook),
+# roughly like Discord's own limits.
+DEFAULT_BUCKETS: Dict[str, Tuple[int, float]] = {
+    "POST /channels/{channel_id}/messages": (5, 5.0),
+    "GET /channels/{channel_id}/messages": (10, 1.0),
+    "GET /channels/{channel_id}/messages/{message_id}": (10, 1.0),
+    "DELETE /channels/{channel_id}/messages/{message_id}": (5, 1.0),
+    "GET /channels/{channel_id}": (10, 1.0),
+    "PATCH /channels/{channel_id}": (2, 600.0),
+    "DELETE /channels/{channel_id}": (5, 5.0),
+    "PUT /channels/{channel_id}/permissions/{overwrite_id}": (10, 10.0),
+    "POST /guilds/{guild_id}/channels": (5, 10.0),
+    "GET /guilds/{guild_id}/members/{user_id}": (10, 1.0),
+    "PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}": (10, 10.0),
+    "DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}": (10, 10.0),
+    "POST /users/@me/channels": (10, 10.0),
+    "GET /users/{user_id}": (30, 1.0),
+    "PUT /applications/{application_id}/commands": (2, 60.0),
+}
+DEFAULT_BUCKET = (50, 1.0)
+GLOBAL_LIMIT = (50, 1.0)
+# Interaction callbacks and follow-ups don't count towards the global limit
+GLOBAL_EXEMPT_PREFIXES = ("/interactions/", "/webhooks/")
+
+
+class Snowflakes:
+    def __init__(self):
+        self._seq = itertools.count()
+
+    def next(self) -> int:
+        ms = int(time.time() * 1000) - DISCORD_EPOCH
+        return (ms << 22) | (next(self._seq) & 0x3FFFFF)
+
+
+def json_response(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    # discord.py only decodes bodies whose Content-Type is exactly "application/json" (no charset suffix)
+    return web.Response(body=json.dumps(data).encode("utf-8"), status=status, headers={**(headers or {}), "Content-Type": "application/json"})
+
+
+def iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def read_bot_config(path: str) -> Dict[str, Any]:
+    """Pull the literal config constants out of main.py without importing (and so running) it."""
+    wanted = {"ADMIN_ROLE_IDS", "SUPPORT_ROLE_ID", "LOG_CHANNEL_ID", "CATEGORY_IDS", "TICKET_PANEL_CHANNEL_ID",
+              "ROLE_THRESHOLDS", "INACTIVITY_CATEGORIES", "NEEDS_IGG_ID", "NEEDS_GF_ID", "NEEDS_GP_ID"}
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    config: Dict[str, Any] = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name in wanted:
+                try:
+                    config[name] = ast.literal_eval(node.value)
+                except ValueError:
+                    pass
+    return config
+
+
+# ---------------------------
+# Rate limiting
+# ---------------------------
+class Bucket:
+    __slots__ = ("limit", "per", "remaining", "reset_at")
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def take(self, now: float) -> Optional[float]:
+        """Consume one request; returns retry_after seconds if the bucket is exhausted."""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining <= 0:
+            return self.reset_at - now
+        self.remaining -= 1
+        return None
+
+
+class RateLimiter:
+    def __init__(self, buckets: Dict[str, Tuple[int, float]], default: Tuple[int, float], global_limit: Tuple[int, float], enabled: bool = True):
+        self.specs = buckets
+        self.default = default
+        self.global_bucket = Bucket(*global_limit)
+        self.enabled = enabled
+        self.buckets: Dict[Tuple[str, str], Bucket] = {}
+
+    def check(self, template: str, major: str, path: str) -> Tuple[Optional[float], bool, Dict[str, str]]:
+        """Returns (retry_after, is_global, headers) for a request."""
+        if not self.enabled:
+            return None, False, {}
+        now = time.monotonic()
+        if not path.startswith(GLOBAL_EXEMPT_PREFIXES):
+            retry = self.global_bucket.take(now)
+            if retry is not None:
+                return retry, True, {"X-RateLimit-Global": "true", "X-RateLimit-Scope": "global", "Retry-After": f"{retry:.3f}"}
+
+        spec = self.specs.get(template, self.default)
+        key = (template, major)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(*spec)
+        retry = bucket.take(now)
+        reset_after = max(bucket.reset_at - now, 0.0)
+        headers = {
+            "X-RateLimit-Limit": str(bucket.limit),
+            "X-RateLimit-Remaining": str(max(bucket.remaining, 0)),
+            "X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": f"{abs(hash(template)):x}",
+        }
+        if retry is not None:
+            headers["X-RateLimit-Scope"] = "user"
+            headers["Retry-After"] = f"{retry:.3f}"
+        return retry, False, headers
+
+
+def parse_bucket_override(value: str) -> Tuple[str, Tuple[int, float]]:
+    # "POST /guilds/{guild_id}/channels=5/10"
+    route, _, limit = value.rpartition("=")
+    count, _, per = limit.partition("/")
+    return route.strip(), (int(count), float(per or 1))
+
+
+# ---------------------------
+# Gateway
+# ---------------------------
+class GatewaySession:
+    HEARTBEAT_INTERVAL = 41250
+
+    def __init__(self, ws: web.WebSocketResponse):
+        self.ws = ws
+        self.seq = 0
+        self.identified = False
+        self.shard = (0, 1)
+        self.session_id = os.urandom(16).hex()
+
+    async def send(self, op: int, d: Any, t: Optional[str] = None):
+        payload: Dict[str, Any] = {"op": op, "d": d, "s": None, "t": t}
+        if op == 0:
+            self.seq += 1
+            payload["s"] = self.seq
+        if not self.ws.closed:
+            await self.ws.send_str(json.dumps(payload))
+
+    def owns_guild(self, guild_id: int) -> bool:
+        shard_id, shard_count = self.shard
+        return (guild_id >> 22) % shard_count == shard_id
+
+
+# ---------------------------
+# Mock server
+# ---------------------------
+class MockDiscord:
+    def __init__(self, bot_config: Dict[str, Any], *, members: int = 1000, latency: float = 0.0, jitter: float = 0.0,
+                 buckets: Optional[Dict[str, Tuple[int, float]]] = None, rate_limits: bool = True,
+                 interaction_deadline: float = 3.0, shards: int = 1, seed: int = 1234):
+        self.ids = Snowflakes()
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.interaction_deadline = interaction_deadline
+        self.shards = shards
+        self.limiter = RateLimiter({**DEFAULT_BUCKETS, **(buckets or {})}, DEFAULT_BUCKET, GLOBAL_LIMIT, enabled=rate_limits)
+        self.base_url = ""
+
+        self.stats: Counter = Counter()
+        self.route_stats: Counter = Counter()
+        self.ratelimited: Counter = Counter()
+        self.sessions: List[GatewaySession] = []
+
+        self.users: Dict[int, Dict[str, Any]] = {}
+        self.members: Dict[int, Dict[str, Any]] = {}
+        self.roles: Dict[int, Dict[str, Any]] = {}
+        self.channels: Dict[int, Dict[str, Any]] = {}
+        self.messages: Dict[int, "OrderedDict[int, Dict[str, Any]]"] = defaultdict(OrderedDict)
+        self.dm_channels: Dict[int, int] = {}
+        self.commands: List[Dict[str, Any]] = []
+        self.interactions: Dict[int, Dict[str, Any]] = {}
+        self.message_waiters: List[Tuple[Any, asyncio.Future]] = []
+
+        self.app_id = self.ids.next()
+        self.bot_user = self.add_user(self.app_id, "xts-bot", bot=True)
+        self.guild_id = self.ids.next()
+        self.build_guild(bot_config, members)
+
+    # ----- state builders -----
+    def add_user(self, user_id: int, name: str, bot: bool = False) -> Dict[str, Any]:
+        user = {"id": str(user_id), "username": name, "global_name": name, "discriminator": "0", "avatar": None,
+                "bot": bot, "public_flags": 0}
+        self.users[user_id] = user
+        return user
+
+    def add_member(self, user_id: int, name: str, roles: Optional[List[int]] = None, bot: bool = False) -> Dict[str, Any]:
+        user = self.users.get(user_id) or self.add_user(user_id, name, bot=bot)
+        member = {"user": user, "roles": [str(r) for r in roles or []], "joined_at": iso_now(), "deaf": False, "mute": False,
+                  "flags": 0, "pending": False, "nick": None, "avatar": None, "premium_since": None,
+                  "communication_disabled_until": None}
+        self.members[user_id] = member
+        return member
+
+    def add_role(self, role_id: int, name: str, permissions: int = 0, position: int = 1) -> Dict[str, Any]:
+        role = {"id": str(role_id), "name": name, "color": 0, "colors": {"primary_color": 0}, "hoist": False,
+                "position": position, "permissions": str(permissions), "managed": False, "mentionable": True,
+                "flags": 0, "icon": None, "unicode_emoji": None}
+        self.roles[role_id] = role
+        return role
+
+    def add_channel(self, channel_id: int, name: str, type: int = 0, parent_id: Optional[int] = None,
+                    topic: Optional[str] = None, overwrites: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        channel = {"id": str(channel_id), "type": type, "guild_id": str(self.guild_id), "name": name,
+                   "position": len(self.channels), "permission_overwrites": overwrites or [],
+                   "parent_id": str(parent_id) if parent_id else None, "topic": topic, "nsfw": False,
+                   "rate_limit_per_user": 0, "last_message_id": None, "flags": 0}
+        self.channels[channel_id] = channel
+        return channel
+
+    def build_guild(self, config: Dict[str, Any], members: int):
+        self.add_role(self.guild_id, "@everyone", permissions=0x400 | 0x800, position=0)
+        bot_role = self.ids.next()
+        self.add_role(bot_role, "xts-bot", permissions=8, position=50)
+        self.add_member(self.app_id, "xts-bot", roles=[bot_role], bot=True)
+
+        self.admin_role_id = (config.get("ADMIN_ROLE_IDS") or [self.ids.next()])[0]
+        self.support_role_id = config.get("SUPPORT_ROLE_ID", self.admin_role_id)
+        for rid in {self.admin_role_id, self.support_role_id}:
+            self.add_role(rid, "Staff", permissions=8, position=40)
+        for _, rid in config.get("ROLE_THRESHOLDS", []):
+            self.add_role(rid, f"Spender {rid}", position=10)
+
+        category_ids = set()
+        for value in config.get("CATEGORY_IDS", {}).values():
+            category_ids.update(value if isinstance(value, list) else [value])
+        for key in ("NEEDS_IGG_ID", "NEEDS_GF_ID", "NEEDS_GP_ID"):
+            if key in config:
+                category_ids.add(config[key])
+        category_ids.update(config.get("INACTIVITY_CATEGORIES", []))
+        # getting_info is both a "category" key and a text channel the bot posts into
+        getting_info = config.get("CATEGORY_IDS", {}).get("getting_info")
+        for cid in sorted(category_ids):
+            if cid == getting_info:
+                self.add_channel(cid, "getting-info")
+            else:
+                self.add_channel(cid, f"category-{cid}", type=4)
+        for key, name in (("LOG_CHANNEL_ID", "ticket-logs"), ("TICKET_PANEL_CHANNEL_ID", "create-ticket")):
+            if key in config:
+                self.add_channel(config[key], name)
+        self.log_channel_id = config.get("LOG_CHANNEL_ID")
+        self.panel_channel_id = config.get("TICKET_PANEL_CHANNEL_ID") or int(self.add_channel(self.ids.next(), "create-ticket")["id"])
+
+        self.staff_id = self.ids.next()
+        self.add_member(self.staff_id, "staff", roles=[self.support_role_id, self.admin_role_id])
+        self.buyer_ids: List[int] = []
+        for i in range(members):
+            uid = self.ids.next()
+            self.add_member(uid, f"buyer{i}")
+            self.buyer_ids.append(uid)
+
+    # ----- payloads -----
+    def guild_payload(self, session: GatewaySession, large_threshold: int) -> Dict[str, Any]:
+        members = list(self.members.values())
+        return {
+            "id": str(self.guild_id), "name": "Mock Storefront", "icon": None, "owner_id": str(self.staff_id),
+            "afk_timeout": 300, "verification_level": 0, "default_message_notifications": 0, "explicit_content_filter": 0,
+            "features": [], "mfa_level": 0, "system_channel_flags": 0, "premium_tier": 0, "nsfw_level": 0,
+            "preferred_locale": "en-US", "roles": list(self.roles.values()), "emojis": [], "stickers": [],
+            "channels": [c for c in self.channels.values()], "threads": [], "voice_states": [], "presences": [],
+            "stage_instances": [], "guild_scheduled_events": [], "soundboard_sounds": [],
+            "member_count": len(members), "large": len(members) > large_threshold, "unavailable": False,
+            "joined_at": iso_now(),
+            "members": members if len(members) <= large_threshold else [self.members[self.app_id]],
+        }
+
+    def message_payload(self, channel_id: int, author_id: int, content: str = "", *, embeds=None, components=None,
+                        attachments=None, flags: int = 0, interaction_id: Optional[int] = None) -> Dict[str, Any]:
+        msg = {
+            "id": str(self.ids.next()), "channel_id": str(channel_id), "guild_id": str(self.guild_id),
+            "author": self.users[author_id], "content": content or "", "timestamp": iso_now(), "edited_timestamp": None,
+            "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": attachments or [],
+            "embeds": embeds or [], "pinned": False, "type": 0, "flags": flags, "components": components or [],
+        }
+        if author_id in self.members:
+            member = dict(self.members[author_id])
+            member.pop("user", None)
+            msg["member"] = member
+        if interaction_id is not None:
+            msg["application_id"] = str(self.app_id)
+            msg["interaction_metadata"] = {"id": str(interaction_id), "type": 2, "user": self.users[self.staff_id]}
+        return msg
+
+    # ----- gateway -----
+    async def dispatch(self, event: str, data: Dict[str, Any]):
+        self.stats[f"gateway {event}"] += 1
+        for session in list(self.sessions):
+            if session.identified and session.owns_guild(self.guild_id):
+                await session.send(0, data, event)
+
+    async def gateway_handler(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        session = GatewaySession(ws)
+        self.sessions.append(session)
+        await session.send(10, {"heartbeat_interval": session.HEARTBEAT_INTERVAL})
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(msg.data)
+                await self.gateway_op(session, payload.get("op"), payload.get("d"))
+        finally:
+            self.sessions.remove(session)
+        return ws
+
+    async def gateway_op(self, session: GatewaySession, op: int, d: Any):
+        self.stats[f"gateway op {op}"] += 1
+        if op == 1:
+            await session.send(11, None)
+        elif op == 2:
+            session.shard = tuple(d.get("shard") or (0, 1))
+            session.identified = True
+            await session.send(0, {
+                "v": 10, "user": self.users[self.app_id], "session_id": session.session_id,
+                "resume_gateway_url": self.gateway_url, "shard": list(session.shard),
+                "guilds": [{"id": str(self.guild_id), "unavailable": True}] if session.owns_guild(self.guild_id) else [],
+                "application": {"id": str(self.app_id), "flags": 0}, "private_channels": [], "relationships": [],
+            }, "READY")
+            if session.owns_guild(self.guild_id):
+                await session.send(0, self.guild_payload(session, d.get("large_threshold", 250)), "GUILD_CREATE")
+        elif op == 6:
+            # No resume support: make the client start a fresh session
+            await session.send(9, False)
+        elif op == 8:
+            await self.send_member_chunks(session, d)
+
+    async def send_member_chunks(self, session: GatewaySession, d: Dict[str, Any]):
+        user_ids = d.get("user_ids")
+        if user_ids is not None:
+            ids = [int(u) for u in (user_ids if isinstance(user_ids, list) else [user_ids])]
+            found = [self.members[i] for i in ids if i in self.members]
+            not_found = [str(i) for i in ids if i not in self.members]
+        else:
+            query = (d.get("query") or "").lower()
+            found = [m for m in self.members.values() if m["user"]["username"].lower().startswith(query)]
+            not_found = []
+            if d.get("limit"):
+                found = found[:d["limit"]]
+        chunks = [found[i:i + 1000] for i in range(0, len(found), 1000)] or [[]]
+        for index, chunk in enumerate(chunks):
+            payload = {"guild_id": str(self.guild_id), "members": chunk, "chunk_index": index, "chunk_count": len(chunks)}
+            if d.get("nonce"):
+                payload["nonce"] = d["nonce"]
+            if index == 0 and not_found:
+                payload["not_found"] = not_found
+            await session.send(0, payload, "GUILD_MEMBERS_CHUNK")
+
+    # ----- REST plumbing -----
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if not request.path.startswith(API_PREFIX):
+            return await handler(request)
+        resource = request.match_info.route.resource
+        template = resource.canonical[len(API_PREFIX):] if resource is not None else request.path
+        route = f"{request.method} {template}"
+        params = request.match_info
+        major = params.get("channel_id") or params.get("guild_id") or params.get("webhook_id") or ""
+        self.route_stats[route] += 1
+        self.stats["rest requests"] += 1
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+        retry_after, is_global, headers = self.limiter.check(route, major, template)
+        if retry_after is not None:
+            self.stats["rest 429"] += 1
+            self.ratelimited["global" if is_global else route] += 1
+            body = {"message": "You are being rate limited.", "retry_after": round(retry_after, 3), "global": is_global, "code": 0}
+            return json_response(body, status=429, headers=headers)
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    @staticmethod
+    def error(status: int, message: str, code: int = 0) -> web.Response:
+        return json_response({"message": message, "code": code}, status=status)
+
+    async def read_body(self, request: web.Request) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """JSON body or multipart (payload_json + files); returns (payload, attachments)."""
+        if not request.content_type.startswith("multipart/"):
+            if not request.can_read_body:
+                return {}, []
+            return await request.json(), []
+        payload: Dict[str, Any] = {}
+        attachments = []
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == "payload_json":
+                payload = json.loads(await part.text())
+            else:
+                data = await part.read()
+                attachment_id = self.ids.next()
+                attachments.append({"id": str(attachment_id), "filename": part.filename or "file", "size": len(data),
+                                    "url": f"{self.base_url}/attachments/{attachment_id}/{part.filename}",
+                                    "proxy_url": f"{self.base_url}/attachments/{attachment_id}/{part.filename}"})
+                self.stats["upload bytes"] += len(data)
+        return payload, attachments
+
+    def store_message(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        channel_id = int(msg["channel_id"])
+        self.messages[channel_id][int(msg["id"])] = msg
+        if channel_id in self.channels:
+            self.channels[channel_id]["last_message_id"] = msg["id"]
+        for predicate, future in list(self.message_waiters):
+            if not future.done() and predicate(msg):
+                future.set_result(msg)
+        return msg
+
+    def wait_for_message(self, predicate) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.message_waiters.append((predicate, future))
+        future.add_done_callback(lambda f: self.message_waiters.remove((predicate, f)))
+        return future
+
+    # ----- REST handlers -----
+    async def get_gateway(self, request: web.Request) -> web.Response:
+        return json_response({"url": self.gateway_url, "shards": self.shards,
+                                  "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1}})
+
+    async def get_me(self, request: web.Request) -> web.Response:
+        return json_response({**self.users[self.app_id], "verified": True, "mfa_enabled": False, "flags": 0})
+
+    async def get_application(self, request: web.Request) -> web.Response:
+        return json_response({"id": str(self.app_id), "name": "xts-bot", "icon": None, "description": "",
+                                  "rpc_origins": [], "bot_public": False, "bot_require_code_grant": False,
+                                  "owner": self.users[self.staff_id], "team": None, "verify_key": "0" * 64,
+                                  "flags": 0, "bot": self.users[self.app_id]})
+
+    async def put_commands(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.commands = [{**cmd, "id": str(self.ids.next()), "application_id": str(self.app_id), "version": str(self.ids.next()),
+                          "default_member_permissions": cmd.get("default_member_permissions"), "type": cmd.get("type", 1)}
+                         for cmd in payload]
+        return json_response(self.commands)
+
+    async def get_commands(self, request: web.Request) -> web.Response:
+        return json_response(self.commands)
+
+    async def get_user(self, request: web.Request) -> web.Response:
+        user = self.users.get(int(request.match_info["user_id"]))
+        return json_response(user) if user else self.error(404, "Unknown User", 10013)
+
+    async def get_member(self, request: web.Request) -> web.Response:
+        member = self.members.get(int(request.match_info["user_id"]))
+        return json_response(member) if member else self.error(404, "Unknown Member", 10007)
+
+    async def member_role(self, request: web.Request) -> web.Response:
+        member = self.members.get(int(request.match_info["user_id"]))
+        if member is None:
+            return self.error(404, "Unknown Member", 10007)
+        role_id = request.match_info["role_id"]
+        if request.method == "PUT" and role_id not in member["roles"]:
+            member["roles"].append(role_id)
+        elif request.method == "DELETE" and role_id in member["roles"]:
+            member["roles"].remove(role_id)
+        await self.dispatch("GUILD_MEMBER_UPDATE", {"guild_id": str(self.guild_id), **member})
+        return web.Response(status=204)
+
+    async def get_channel(self, request: web.Request) -> web.Response:
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        return json_response(channel) if channel else self.error(404, "Unknown Channel", 10003)
+
+    async def create_channel(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        parent = payload.get("parent_id")
+        if parent is not None and sum(1 for c in self.channels.values() if c["parent_id"] == str(parent)) >= 50:
+            return self.error(400, "Maximum number of channels in category reached (50)", 50035)
+        channel = self.add_channel(self.ids.next(), payload["name"], type=payload.get("type", 0),
+                                   parent_id=int(parent) if parent else None, topic=payload.get("topic"),
+                                   overwrites=payload.get("permission_overwrites") or [])
+        await self.dispatch("CHANNEL_CREATE", channel)
+        return json_response(channel)
+
+    async def edit_channel(self, request: web.Request) -> web.Response:
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return self.error(404, "Unknown Channel", 10003)
+        payload = await request.json()
+        for key in ("name", "topic", "position", "permission_overwrites"):
+            if key in payload:
+                channel[key] = payload[key]
+        if "parent_id" in payload:
+            channel["parent_id"] = str(payload["parent_id"]) if payload["parent_id"] else None
+        await self.dispatch("CHANNEL_UPDATE", channel)
+        return json_response(channel)
+
+    async def delete_channel(self, request: web.Request) -> web.Response:
+        channel = self.channels.pop(int(request.match_info["channel_id"]), None)
+        if channel is None:
+            return self.error(404, "Unknown Channel", 10003)
+        self.messages.pop(int(channel["id"]), None)
+        self.stats["channels deleted"] += 1
+        await self.dispatch("CHANNEL_DELETE", channel)
+        return json_response(channel)
+
+    async def set_permissions(self, request: web.Request) -> web.Response:
+        channel = self.channels.get(int(request.match_info["channel_id"]))
+        if channel is None:
+            return self.error(404, "Unknown Channel", 10003)
+        payload = await request.json()
+        target = request.match_info["overwrite_id"]
+        overwrites = [o for o in channel["permission_overwrites"] if o["id"] != target]
+        overwrites.append({"id": target, "type": payload.get("type", 1), "allow": str(payload.get("allow", 0)), "deny": str(payload.get("deny", 0))})
+        channel["permission_overwrites"] = overwrites
+        await self.dispatch("CHANNEL_UPDATE", channel)
+        return web.Response(status=204)
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        channel_id = int(request.match_info["channel_id"])
+        if channel_id not in self.channels and channel_id not in self.dm_channels.values():
+            return self.error(404, "Unknown Channel", 10003)
+        payload, attachments = await self.read_body(request)
+        msg = self.store_message(self.message_payload(channel_id, self.app_id, payload.get("content") or "",
+                                                      embeds=payload.get("embeds"), components=payload.get("components"),
+                                                      attachments=attachments))
+        if channel_id in self.dm_channels.values():
+            self.stats["dms sent"] += 1
+        else:
+            await self.dispatch("MESSAGE_CREATE", msg)
+        return json_response(msg)
+
+    async def get_message(self, request: web.Request) -> web.Response:
+        msg = self.messages.get(int(request.match_info["channel_id"]), {}).get(int(request.match_info["message_id"]))
+        return json_response(msg) if msg else self.error(404, "Unknown Message", 10008)
+
+    async def delete_message(self, request: web.Request) -> web.Response:
+        channel_id = int(request.match_info["channel_id"])
+        msg = self.messages.get(channel_id, {}).pop(int(request.match_info["message_id"]), None)
+        if msg is None:
+            return self.error(404, "Unknown Message", 10008)
+        await self.dispatch("MESSAGE_DELETE", {"id": msg["id"], "channel_id": str(channel_id), "guild_id": str(self.guild_id)})
+        return web.Response(status=204)
+
+    async def history(self, request: web.Request) -> web.Response:
+        channel_id = int(request.match_info["channel_id"])
+        if channel_id not in self.channels:
+            return self.error(404, "Unknown Channel", 10003)
+        limit = min(int(request.query.get("limit", 50)), 100)
+        msgs = sorted(self.messages.get(channel_id, {}).values(), key=lambda m: int(m["id"]))
+        if "after" in request.query:
+            after = int(request.query["after"])
+            msgs = [m for m in msgs if int(m["id"]) > after][:limit]
+        elif "before" in request.query:
+            before = int(request.query["before"])
+            msgs = [m for m in msgs if int(m["id"]) < before][-limit:]
+        else:
+            msgs = msgs[-limit:]
+        # Discord always returns newest first
+        return json_response(list(reversed(msgs)))
+
+    async def create_dm(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        recipient = int(payload["recipient_id"])
+        if recipient not in self.users:
+            return self.error(404, "Unknown User", 10013)
+        channel_id = self.dm_channels.get(recipient)
+        if channel_id is None:
+            channel_id = self.dm_channels[recipient] = self.ids.next()
+        return json_response({"id": str(channel_id), "type": 1, "recipients": [self.users[recipient]], "last_message_id": None})
+
+    async def interaction_callback(self, request: web.Request) -> web.Response:
+        interaction_id = int(request.match_info["interaction_id"])
+        record = self.interactions.get(interaction_id)
+        if record is None or record["token"] != request.match_info["token"]:
+            return self.error(404, "Unknown interaction", 10062)
+        if record["responded"]:
+            return self.error(400, "Interaction has already been acknowledged.", 40060)
+        if time.monotonic() - record["created"] > self.interaction_deadline:
+            self.stats["interactions expired"] += 1
+            return self.error(404, "Unknown interaction", 10062)
+
+        payload, attachments = await self.read_body(request)
+        kind = payload.get("type")
+        data = payload.get("data") or {}
+        record["responded"] = True
+        record["response_type"] = kind
+        self.stats[f"interaction response type {kind}"] += 1
+        result: Dict[str, Any] = {"interaction": {"id": str(interaction_id), "type": record["type"]}}
+        if kind in (4, 5):
+            flags = data.get("flags", 0)
+            msg = self.store_message(self.message_payload(record["channel_id"], self.app_id, data.get("content") or "",
+                                                          embeds=data.get("embeds"), components=data.get("components"),
+                                                          attachments=attachments, flags=flags, interaction_id=interaction_id))
+            msg["interaction_token"] = record["token"]
+            result["interaction"].update({"response_message_id": msg["id"], "response_message_loading": kind == 5,
+                                          "response_message_ephemeral": bool(flags & EPHEMERAL)})
+            result["resource"] = {"type": kind, "message": msg}
+            if not flags & EPHEMERAL:
+                await self.dispatch("MESSAGE_CREATE", msg)
+        elif kind == 9:
+            result["resource"] = {"type": kind}
+        record["response"] = payload
+        if not record["future"].done():
+            record["future"].set_result(payload)
+        return json_response(result)
+
+    async def webhook_message(self, request: web.Request) -> web.Response:
+        token = request.match_info["token"]
+        record = next((r for r in self.interactions.values() if r["token"] == token), None)
+        if record is None:
+            return self.error(404, "Unknown Webhook", 10015)
+        payload, attachments = await self.read_body(request)
+        msg = self.store_message(self.message_payload(record["channel_id"], self.app_id, payload.get("content") or "",
+                                                      embeds=payload.get("embeds"), components=payload.get("components"),
+                                                      attachments=attachments, flags=payload.get("flags", 0)))
+        msg["interaction_token"] = token
+        record["followups"].append(payload)
+        return json_response(msg)
+
+    async def mock_stats(self, request: web.Request) -> web.Response:
+        return json_response(self.snapshot_stats())
+
+    async def mock_dispatch(self, request: web.Request) -> web.Response:
+        """Inject an arbitrary gateway event: {"t": "MESSAGE_CREATE", "d": {...}}."""
+        payload = await request.json()
+        await self.dispatch(payload["t"], payload["d"])
+        return web.Response(status=204)
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        return {"stats": dict(self.stats), "routes": dict(self.route_stats), "rate_limited": dict(self.ratelimited),
+                "channels": len(self.channels), "gateway_sessions": len(self.sessions)}
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware], client_max_size=64 * 1024 * 1024)
+        p = API_PREFIX
+        app.router.add_get("/gateway", self.gateway_handler)
+        app.router.add_get("/_mock/stats", self.mock_stats)
+        app.router.add_post("/_mock/dispatch", self.mock_dispatch)
+        app.router.add_get(p + "/gateway", self.get_gateway)
+        app.router.add_get(p + "/gateway/bot", self.get_gateway)
+        app.router.add_get(p + "/users/@me", self.get_me)
+        app.router.add_post(p + "/users/@me/channels", self.create_dm)
+        app.router.add_get(p + "/users/{user_id}", self.get_user)
+        app.router.add_get(p + "/oauth2/applications/@me", self.get_application)
+        app.router.add_get(p + "/applications/{application_id}/commands", self.get_commands)
+        app.router.add_put(p + "/applications/{application_id}/commands", self.put_commands)
+        app.router.add_get(p + "/applications/{application_id}/guilds/{guild_id}/commands", self.get_commands)
+        app.router.add_put(p + "/applications/{application_id}/guilds/{guild_id}/commands", self.put_commands)
+        app.router.add_get(p + "/guilds/{guild_id}/members/{user_id}", self.get_member)
+        app.router.add_put(p + "/guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.member_role)
+        app.router.add_delete(p + "/guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.member_role)
+        app.router.add_post(p + "/guilds/{guild_id}/channels", self.create_channel)
+        app.router.add_get(p + "/channels/{channel_id}", self.get_channel)
+        app.router.add_patch(p + "/channels/{channel_id}", self.edit_channel)
+        app.router.add_delete(p + "/channels/{channel_id}", self.delete_channel)
+        app.router.add_put(p + "/channels/{channel_id}/permissions/{overwrite_id}", self.set_permissions)
+        app.router.add_get(p + "/channels/{channel_id}/messages", self.history)
+        app.router.add_post(p + "/channels/{channel_id}/messages", self.send_message)
+        app.router.add_get(p + "/channels/{channel_id}/messages/{message_id}", self.get_message)
+        app.router.add_delete(p + "/channels/{channel_id}/messages/{message_id}", self.delete_message)
+        app.router.add_post(p + "/interactions/{interaction_id}/{token}/callback", self.interaction_callback)
+        app.router.add_post(p + "/webhooks/{webhook_id}/{token}", self.webhook_message)
+        app.router.add_patch(p + "/webhooks/{webhook_id}/{token}/messages/{message_id}", self.webhook_message)
+        return app
+
+    async def start(self, host: str, port: int) -> web.AppRunner:
+        runner = web.AppRunner(self.make_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        self.base_url = f"http://{host}:{port}"
+        self.gateway_url = f"ws://{host}:{port}/gateway"
+        return runner
+
+    # ----- client-side actions used by scenarios -----
+    def channel_ref(self, channel_id: int) -> Dict[str, Any]:
+        channel = self.channels.get(channel_id) or {"id": str(channel_id), "type": 0, "guild_id": str(self.guild_id), "name": "unknown"}
+        return channel
+
+    async def interact(self, user_id: int, channel_id: int, type: int, data: Dict[str, Any],
+                       message: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send an INTERACTION_CREATE as user_id and return its tracking record (await record["future"])."""
+        interaction_id = self.ids.next()
+        token = os.urandom(24).hex()
+        member = dict(self.members[user_id])
+        member["permissions"] = "8" if self.support_role_id and str(self.support_role_id) in member["roles"] else "104324673"
+        payload = {
+            "id": str(interaction_id), "application_id": str(self.app_id), "type": type, "data": data,
+            "guild_id": str(self.guild_id), "channel": self.channel_ref(channel_id), "channel_id": str(channel_id),
+            "member": member, "token": token, "version": 1, "app_permissions": "8", "locale": "en-US",
+            "guild_locale": "en-US", "entitlements": [], "authorizing_integration_owners": {"0": str(self.guild_id)},
+            "context": 0, "attachment_size_limit": 26214400,
+        }
+        if message is not None:
+            payload["message"] = message
+        record = {"id": interaction_id, "token": token, "type": type, "channel_id": channel_id, "created": time.monotonic(),
+                  "responded": False, "followups": [], "future": asyncio.get_running_loop().create_future()}
+        self.interactions[interaction_id] = record
+        await self.dispatch("INTERACTION_CREATE", payload)
+        return record
+
+    async def user_message(self, user_id: int, channel_id: int, content: str) -> Dict[str, Any]:
+        msg = self.store_message(self.message_payload(channel_id, user_id, content))
+        await self.dispatch("MESSAGE_CREATE", msg)
+        return msg
+
+
+def find_components(components: List[Dict[str, Any]], type: int) -> List[Dict[str, Any]]:
+    """Flatten action rows / labels and return the components of a given type."""
+    found = []
+    for comp in components or []:
+        if comp.get("type") == type:
+            found.append(comp)
+        found.extend(find_components(comp.get("components", []), type))
+        if "component" in comp:
+            found.extend(find_components([comp["component"]], type))
+    return found
+
+
+def modal_submit_components(modal: Dict[str, Any], value: str) -> List[Dict[str, Any]]:
+    """Mirror the modal's layout back with every text input filled in."""
+    rows = []
+    for comp in modal.get("components", []):
+        if comp.get("type") == 1:
+            rows.append({"type": 1, "components": [{"type": 4, "custom_id": c["custom_id"], "value": value} for c in comp["components"] if c.get("type") == 4]})
+        elif comp.get("type") == 18:
+            rows.append({"type": 18, "component": {"type": 4, "custom_id": comp["component"]["custom_id"], "value": value}})
+    return rows
+
+
+# ---------------------------
+# Scenario: sale rush
+# ---------------------------
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class SaleRush:
+    """Buyers arrive at a fixed rate, go through the real panel -> subtype/method -> amount modal flow,
+    chat in their ticket, and staff close it with /close."""
+    def __init__(self, mock: MockDiscord, buyers: int, rate: float, messages: int, timeout: float, think: float = 0.3, seed: int = 1234):
+        self.mock = mock
+        self.buyers = buyers
+        self.rate = rate
+        self.messages = messages
+        self.timeout = timeout
+        self.think = think
+        self.rng = random.Random(seed)
+        self.create_latencies: List[float] = []
+        self.close_latencies: List[float] = []
+        self.failures: Counter = Counter()
+        self.panel: Optional[Dict[str, Any]] = None
+
+    async def wait(self, record: Dict[str, Any], step: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = await asyncio.wait_for(asyncio.shield(record["future"]), self.timeout)
+        except asyncio.TimeoutError:
+            self.failures[f"{step}: no response"] += 1
+            return None
+        # Think time before the next click. It also stops us racing the bot, which only registers a
+        # view/modal once it has read the callback response.
+        await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think)
+        return response
+
+    async def post_panel(self):
+        mock = self.mock
+        record = await mock.interact(mock.staff_id, mock.panel_channel_id, 2, {"id": str(mock.ids.next()), "name": "ticket-panel", "type": 1})
+        response = await self.wait(record, "ticket-panel")
+        if response is None:
+            raise RuntimeError("Bot did not answer /ticket-panel; is it connected?")
+        self.panel = next(m for m in mock.messages[mock.panel_channel_id].values() if m.get("interaction_token") == record["token"])
+
+    async def buyer(self, user_id: int):
+        mock = self.mock
+        panel = self.panel
+        started = time.perf_counter()
+        delivery = find_components(panel["components"], 3)[0]
+        record = await mock.interact(user_id, mock.panel_channel_id, 3, {"custom_id": delivery["custom_id"], "component_type": 3, "values": ["robux"]}, message=panel)
+        if await self.wait(record, "delivery select") is None:
+            return
+        view_msg = next(m for m in mock.messages[mock.panel_channel_id].values() if m.get("interaction_token") == record["token"])
+        subtype_select, method_select = find_components(view_msg["components"], 3)[:2]
+        for select, value in ((subtype_select, self.rng.choice(["gamepass", "groupfunds", "ingame"])),
+                              (method_select, self.rng.choice([o["value"] for o in method_select["options"]]))):
+            record = await mock.interact(user_id, mock.panel_channel_id, 3, {"custom_id": select["custom_id"], "component_type": 3, "values": [value]}, message=view_msg)
+            if await self.wait(record, "option select") is None:
+                return
+        proceed = find_components(view_msg["components"], 2)[0]
+        record = await mock.interact(user_id, mock.panel_channel_id, 3, {"custom_id": proceed["custom_id"], "component_type": 2}, message=view_msg)
+        response = await self.wait(record, "proceed button")
+        if response is None:
+            return
+        if response.get("type") != 9:
+            self.failures["proceed button: no modal (" + (response.get("data", {}).get("content") or "?")[:40] + ")"] += 1
+            return
+
+        modal = response["data"]
+        channel_created = mock.wait_for_message(lambda m: m["author"]["id"] == str(mock.app_id) and f"<@{user_id}>" in m["content"] and "Ticket created by" in m["content"])
+        record = await mock.interact(user_id, mock.panel_channel_id, 5, {"custom_id": modal["custom_id"], "components": modal_submit_components(modal, str(self.rng.choice([1000, 5000, 10000])))})
+        if await self.wait(record, "amount modal") is None:
+            channel_created.cancel()
+            return
+        try:
+            ticket_msg = await asyncio.wait_for(channel_created, self.timeout)
+        except asyncio.TimeoutError:
+            self.failures["ticket channel: never posted"] += 1
+            return
+        self.create_latencies.append(time.perf_counter() - started)
+        channel_id = int(ticket_msg["channel_id"])
+
+        for i in range(self.messages):
+            await asyncio.sleep(self.rng.uniform(0.05, 0.5))
+            await mock.user_message(user_id if i % 2 == 0 else mock.staff_id, channel_id, f"message {i}")
+
+        started = time.perf_counter()
+        record = await mock.interact(mock.staff_id, channel_id, 2, {"id": str(mock.ids.next()), "name": "close", "type": 1, "options": []})
+        if await self.wait(record, "/close") is None:
+            return
+        # the bot answers at once and archives and deletes the channel in a background job
+        deadline = time.perf_counter() + self.timeout
+        while channel_id in mock.channels and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        if channel_id in mock.channels:
+            self.failures["/close: channel not deleted"] += 1
+            return
+        self.close_latencies.append(time.perf_counter() - started)
+
+    async def run(self) -> Dict[str, Any]:
+        await self.post_panel()
+        started = time.perf_counter()
+        tasks = []
+        for user_id in self.mock.buyer_ids[:self.buyers]:
+            tasks.append(asyncio.create_task(self.buyer(user_id)))
+            await asyncio.sleep(self.rng.expovariate(self.rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        return {
+            "buyers": self.buyers, "elapsed_s": round(elapsed, 2),
+            "tickets_created": len(self.create_latencies), "tickets_closed": len(self.close_latencies),
+            "throughput_closed_per_s": round(len(self.close_latencies) / elapsed, 2) if elapsed else 0.0,
+            "create_p50_s": round(percentile(self.create_latencies, 0.5), 3), "create_p99_s": round(percentile(self.create_latencies, 0.99), 3),
+            "close_p50_s": round(percentile(self.close_latencies, 0.5), 3), "close_p99_s": round(percentile(self.close_latencies, 0.99), 3),
+            "failures": dict(self.failures),
+        }
+
+
+async def wait_for_bot(mock: MockDiscord, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if any(s.identified for s in mock.sessions) and mock.stats["gateway op 1"] + mock.stats["gateway op 2"] > 0:
+            # give discord.py a moment to finish processing GUILD_CREATE
+            await asyncio.sleep(1.0)
+            return
+        await asyncio.sleep(0.1)
+    raise RuntimeError("Bot never connected to the mock gateway")
+
+
+def bot_env(mock: MockDiscord) -> Dict[str, str]:
+    return {**os.environ, "TOKEN": "mock-token", "GIT_SYNC": "0", "PYTHONUNBUFFERED": "1",
+            "DISCORD_API_BASE": mock.base_url + API_PREFIX, "DISCORD_GATEWAY_URL": mock.gateway_url}
+
+
+async def run_rush(args: argparse.Namespace):
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    mock = build_mock(args, members=max(args.members, args.buyers))
+    runner = await mock.start(args.host, args.port)
+    workdir = tempfile.mkdtemp(prefix="xts-rush-")
+    bot = None
+    try:
+        if args.spawn_bot:
+            for name in ("payment_info.json", "stickymessages.json"):
+                if os.path.exists(os.path.join(repo_dir, name)):
+                    shutil.copy(os.path.join(repo_dir, name), workdir)
+            log = open(os.path.join(workdir, "bot.log"), "w")
+            bot = subprocess.Popen([sys.executable, os.path.join(repo_dir, "main.py")], cwd=workdir, env=bot_env(mock), stdout=log, stderr=subprocess.STDOUT)
+            print(f"Spawned bot (pid {bot.pid}), log: {log.name}")
+        else:
+            print("Waiting for a bot to connect. Point it at the mock with:")
+            for key, value in bot_env(mock).items():
+                if key.startswith("DISCORD_"):
+                    print(f"  {key}={value}")
+        await wait_for_bot(mock, args.connect_timeout)
+        result = await SaleRush(mock, args.buyers, args.rate, args.messages, args.timeout, think=args.think_ms / 1000.0, seed=args.seed).run()
+        result["mock"] = mock.snapshot_stats()
+        print(json.dumps(result, indent=2))
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+    finally:
+        if bot is not None:
+            # SIGINT lets bot.run shut down cleanly (flushes traces, closes the gateway) while the mock still answers
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.to_thread(bot.wait, 10)
+            except subprocess.TimeoutExpired:
+                bot.terminate()
+                bot.wait(10)
+        await runner.cleanup()
+
+
+def build_mock(args: argparse.Namespace, members: int) -> MockDiscord:
+    config = read_bot_config(args.config)
+    buckets = dict(parse_bucket_override(b) for b in args.bucket or [])
+    return MockDiscord(config, members=members, latency=args.latency_ms / 1000.0, jitter=args.jitter_ms / 1000.0,
+                       buckets=buckets, rate_limits=not args.no_rate_limits, interaction_deadline=args.interaction_deadline,
+                       shards=args.shards, seed=args.seed)
+
+
+async def run_serve(args: argparse.Namespace):
+    mock = build_mock(args, members=args.members)
+    await mock.start(args.host, args.port)
+    for key, value in bot_env(mock).items():
+        if key.startswith("DISCORD_"):
+            print(f"{key}={value}")
+    print(f"Stats: {mock.base_url}/_mock/stats")
+    await asyncio.Event().wait()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local mock Discord REST/gateway server for load and rate-limit testing.")
+    p.add_argument("mode", choices=["serve", "rush"])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8787)
+    p.add_argument("--config", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"), help="Bot file to read guild IDs from")
+    p.add_argument("--members", type=int, default=1000, help="Guild members to simulate")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Added latency per REST request")
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--bucket", action="append", help='Override a bucket, e.g. "POST /guilds/{guild_id}/channels=5/10"')
+    p.add_argument("--no-rate-limits", action="store_true")
+    p.add_argument("--interaction-deadline", type=float, default=3.0, help="Seconds before an interaction token expires for the initial response")
+    p.add_argument("--shards", type=int, default=1, help="Shard count reported by /gateway/bot")
+    p.add_argument("--seed", type=int, default=1234)
+    # rush
+    p.add_argument("--buyers", type=int, default=50)
+    p.add_argument("--rate", type=float, default=10.0, help="Buyer arrivals per second")
+    p.add_argument("--messages", type=int, default=4, help="Messages per ticket before it is closed")
+    p.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for each bot response")
+    p.add_argument("--think-ms", type=float, default=300.0, help="Average pause between a buyer's clicks")
+    p.add_argument("--connect-timeout", type=float, default=60.0)
+    p.add_argument("--no-spawn-bot", dest="spawn_bot", action="store_false", help="Don't start main.py; wait for an external bot")
+    p.add_argument("--json", dest="json_out")
+    return p.parse_args(argv)
+
+
+def cli(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(run_rush(args) if args.mode == "rush" else run_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,419 @@
+# replay.py
+# Replays traffic traces recorded with TRACE_DIR (see "Traffic recorder" in main.py) through the bot's real
+# handlers, against the in-memory fakes in fakes.py. No token or network is needed.
+#
+#   python replay.py traces/                           # real time (1x)
+#   python replay.py traces/ --speed 20                # 20x faster than recorded
+#   python replay.py traces/trace-2025*.jsonl.gz --speed 0 --json results.json   # as fast as possible
+#
+# State (open tickets, sticky channels) is seeded from the header of the first trace file. Like bench.py,
+# everything runs inside a temporary working directory so the real state files are never touched.
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from bench import GUILD_ID, percentile, peak_rss_mb
+
+# Interaction types (discord.InteractionType values)
+APPLICATION_COMMAND = 2
+COMPONENT = 3
+MODAL_SUBMIT = 5
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Replay recorded gateway traces through the bot's handlers.")
+    p.add_argument("paths", nargs="+", help="Trace files or directories containing trace-*.jsonl.gz")
+    p.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier; 0 replays as fast as possible")
+    p.add_argument("--limit", type=int, default=0, help="Stop after this many events (0 = all)")
+    p.add_argument("--history", type=int, default=30, help="Messages seeded into each pre-existing ticket channel")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per REST call")
+    p.add_argument("--verbose", action="store_true", help="Print handler errors as they happen")
+    p.add_argument("--json", dest="json_out", help="Also write results to this JSON file")
+    return p.parse_args(argv)
+
+
+def trace_files(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, p) for p in sorted(os.listdir(path)) if p.startswith("trace-") and p.endswith(".jsonl.gz"))
+        else:
+            files.append(path)
+    # file names start with the UTC start time, so name order is time order
+    return sorted(files, key=os.path.basename)
+
+
+def read_events(files: List[str]) -> Iterator[Dict[str, Any]]:
+    for path in files:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # partially written last line
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            # the bot was killed before the file was closed; keep what was flushed
+            print(f"note: {path} is truncated, replaying the readable part")
+
+
+class Replayer:
+    def __init__(self, main, args: argparse.Namespace, header: Dict[str, Any]):
+        from fakes import FakeWorld
+
+        self.main = main
+        self.tickets = sys.modules["extensions.tickets"]
+        self.args = args
+        self.world = world = FakeWorld(main.bot, GUILD_ID, latency=args.latency_ms / 1000.0)
+        self.support = world.add_bot_layout(main)
+        self.panel = self.tickets.TicketPanelView()
+        self.views: Dict[int, Any] = {}   # user -> last ephemeral view the bot sent them
+        self.modals: Dict[int, Any] = {}  # user -> last modal the bot opened for them
+        self.unbound: Dict[int, int] = {}  # trace channel id -> owner, for ticket channels not yet matched
+        self.channels: Dict[int, Any] = {}
+        self.locks: Dict[int, asyncio.Lock] = {}
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.skipped = 0
+        self.seed(header)
+
+    def seed(self, header: Dict[str, Any]):
+        main = self.main
+        now = datetime.now(timezone.utc)
+        tickets: Dict[str, Any] = {}
+        for t in header.get("tickets", []):
+            owner = self.member(t["o"])
+            chan = self.channel(t["c"], category_id=t.get("cat"))
+            last = (now - timedelta(seconds=t.get("idle", 0))).isoformat()
+            tickets.setdefault(str(t["o"]), []).append({
+                "channel_id": chan.id,
+                "user_id": owner.id,
+                "created_at": last,
+                "last_activity": last,
+                "delivery_type": t.get("d") or "Robux",
+                "subtype": t.get("sub"),
+                "payment_method": t.get("pm"),
+                "amount": t.get("amt", 0),
+                "total_cost": t.get("cost", 0),
+                "warned": t.get("w", False),
+                "warn_time": now.isoformat() if t.get("w") else None,
+            })
+            for n in range(self.args.history):
+                chan.add_history(owner, f"message {n}", created_at=now - timedelta(minutes=self.args.history - n))
+        main.write_json(main.TICKET_JSON, tickets)
+        main.ticket_store.replace_all(main.load_tickets())
+        main.pending_auto_closes.clear()
+        main.sticky_messages.clear()
+        main.sticky_message_ids.clear()
+        for cid in header.get("sticky", []):
+            main.sticky_messages[str(self.channel(cid).id)] = "Sticky message (replay)"
+
+    def member(self, uid: int, staff: bool = False):
+        # trace ids are 56-bit hashes, which work fine as fake snowflakes
+        guild = self.world.guild
+        member = guild.get_member(uid) or guild.add_member(uid, f"user{uid % 100000}")
+        if staff and self.support not in member.roles:
+            member.roles.append(self.support)
+        return member
+
+    def channel(self, cid: int, category_id: Optional[int] = None):
+        chan = self.channels.get(cid)
+        if chan is not None:
+            return chan
+        owner = self.unbound.pop(cid, None)
+        if owner is not None:
+            # bind to the ticket channel this replay's create_ticket_for_user made for the same owner
+            bound = set(id(c) for c in self.channels.values())
+            for c in reversed(self.world.guild.channels):
+                if (getattr(c, "topic", None) or "").endswith(f"({owner})") and id(c) not in bound:
+                    chan = c
+                    break
+        if chan is None:
+            chan = self.world.guild.get_channel(cid) or self.world.guild.add_text_channel(cid, f"channel-{cid % 100000}", category_id=category_id)
+        self.channels[cid] = chan
+        return chan
+
+    def interaction(self, user, chan):
+        from fakes import FakeInteraction
+        return FakeInteraction(self.world.rest, user, chan)
+
+    # ---------------------------
+    # Event handlers
+    # ---------------------------
+    async def on_msg(self, ev: Dict[str, Any]) -> str:
+        from fakes import FakeMessage
+
+        author = self.member(ev["u"], ev.get("s", False))
+        chan = self.channel(ev["c"])
+        # text was reduced to its length when recording; prefix commands are re-run through their shared handlers
+        await self.tickets.on_message(FakeMessage(chan, author, "x" * ev.get("len", 0)))
+        if ev.get("cmd"):
+            return await self.run_command(ev["cmd"], author, chan, {}, self.interaction(author, chan), prefix=True)
+        return "msg"
+
+    async def on_int(self, ev: Dict[str, Any]) -> str:
+        user = self.member(ev["u"], ev.get("s", False))
+        chan = self.channel(ev["c"])
+        interaction = self.interaction(user, chan)
+        kind = ev.get("k")
+        if kind == APPLICATION_COMMAND:
+            return await self.run_command(ev.get("cmd") or "", user, chan, ev.get("opt") or {}, interaction)
+        if kind == COMPONENT:
+            return await self.run_component(ev, user, interaction)
+        if kind == MODAL_SUBMIT:
+            return await self.run_modal(ev, user, interaction)
+        self.skipped += 1
+        return "int:other"
+
+    async def run_command(self, name: str, user, chan, options: Dict[str, Any], interaction, prefix: bool = False) -> str:
+        main = self.main
+        label = f"{'prefix' if prefix else 'cmd'}:{name}"
+        target = chan
+        kwargs = {}
+        for opt, value in options.items():
+            if "id" in value:
+                kwargs[opt] = self.channel(value["id"]) if opt == "channel" else self.member(value["id"])
+            elif "len" in value:
+                kwargs[opt] = "x" * value["len"]
+            else:
+                kwargs[opt] = value.get("v")
+        if isinstance(kwargs.get("channel"), type(chan)):
+            target = kwargs["channel"]
+
+        # The fakes aren't discord.Member instances, so commands gated on isinstance() are driven through
+        # the same shared handlers their slash and prefix forms call
+        staff = main.is_admin_member(user) or main.has_support_role(user)
+        if name == "close":
+            if staff:
+                await self.tickets.handle_close(user, target, interaction=interaction)
+            else:
+                await interaction.response.send_message("You don't have permission to close tickets.", ephemeral=True)
+        elif name == "close-without-payment":
+            if staff:
+                await main.closefail_ticket(target, closer=user)
+            await interaction.response.send_message("Done.", ephemeral=True)
+        elif name == "confirm-payment":
+            await self.tickets.handle_confirmation(user, target, interaction=interaction)
+        else:
+            command = main.bot.tree.get_command(name)
+            if command is None or prefix:
+                self.skipped += 1
+                return label
+            await command.callback(interaction, **kwargs)
+        return label
+
+    async def run_component(self, ev: Dict[str, Any], user, interaction) -> str:
+        custom_id = ev.get("cid")
+        values = ev.get("v")
+        view = self.views.get(user.id)
+        item = None
+        if values:
+            # select values are unique option keys, so find the select offering the value
+            for candidate in list(getattr(view, "children", [])) + list(self.panel.children):
+                if any(o.value == values[0] for o in getattr(candidate, "options", [])):
+                    item = candidate
+                    break
+        elif custom_id:
+            for candidate in getattr(view, "children", []):
+                if getattr(candidate, "custom_id", None) == custom_id:
+                    item = candidate
+                    break
+            if item is None:
+                standalone = {
+                    "close_ticket_btn": self.tickets.CloseTicketButton,
+                    "confirm_close_btn": self.tickets.ConfirmCloseButton,
+                    "cancel_close_btn": self.tickets.CancelCloseButton,
+                    "keep_ticket_open": self.tickets.KeepTicketOpenButton,
+                }.get(custom_id)
+                item = standalone() if standalone else None
+        if item is None:
+            self.skipped += 1
+            return "component:unmatched"
+
+        # what discord.py's view store does before invoking a callback
+        item._refresh_state(interaction, {"custom_id": item.custom_id, "values": values or []})
+        await item.callback(interaction)
+        self.remember_response(user, interaction)
+        return f"button:{custom_id}" if custom_id else f"select:{type(item).__name__}"
+
+    async def run_modal(self, ev: Dict[str, Any], user, interaction) -> str:
+        from discord.ui import TextInput
+
+        main = self.main
+        modal = self.modals.pop(user.id, None)
+        if modal is None:
+            # the flow started before recording did; open the modal the submit implies
+            if "amt" in ev:
+                modal = self.tickets.RobuxAmountModal(next(iter(main.PRICES)), next(iter(main.PAYMENT_FEES)))
+            else:
+                modal = self.tickets.OtherTicketModal()
+        value = str(ev["amt"]) if "amt" in ev else "x" * ev.get("len", 1)
+        for child in modal.children:
+            if isinstance(child, TextInput):
+                child._refresh_state(interaction, {"value": value})
+        await modal.on_submit(interaction)
+        return f"modal:{type(modal).__name__}"
+
+    def remember_response(self, user, interaction):
+        for sent in interaction.response.sent:
+            if sent.get("view") is not None:
+                self.views[user.id] = sent["view"]
+            if sent.get("modal") is not None:
+                self.modals[user.id] = sent["modal"]
+
+    async def on_member(self, ev: Dict[str, Any]) -> str:
+        member = self.member(ev["u"])
+        guild = self.world.guild
+        member.roles = [guild.get_role(rid) or guild.add_role(rid, f"role-{rid}") for rid in ev.get("r", [])]
+        return "member"
+
+    def on_chan(self, ev: Dict[str, Any]):
+        if ev.get("o") is not None and ev["c"] not in self.channels:
+            self.unbound[ev["c"]] = ev["o"]
+
+    # ---------------------------
+    # Playback
+    # ---------------------------
+    async def handle(self, ev: Dict[str, Any], scheduled: float):
+        kind = ev.get("e")
+        owner = self.unbound.get(ev.get("c"))
+        if owner is not None and owner != ev.get("u"):
+            # staff talking in a ticket the replay hasn't finished creating yet: wait for the owner's queue
+            async with self.locks.setdefault(owner, asyncio.Lock()):
+                pass
+        # one user's events stay ordered (a submit can't overtake the click that opened the modal);
+        # everyone else's run concurrently, like real gateway dispatch
+        lock = self.locks.setdefault(ev.get("u", 0), asyncio.Lock())
+        async with lock:
+            t0 = time.perf_counter()
+            label = kind
+            try:
+                label = await getattr(self, f"on_{kind}")(ev)
+            except Exception as e:
+                self.errors[label] = self.errors.get(label, 0) + 1
+                if self.args.verbose:
+                    print(f"error replaying {ev}: {e!r}")
+            elapsed = time.perf_counter() - t0
+        self.latencies.setdefault(label, []).append(elapsed)
+        self.lag.append(max(0.0, t0 - scheduled))
+
+    async def play(self, events: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        speed = self.args.speed
+        self.lag: List[float] = []
+        tasks = []
+        started = time.perf_counter()
+        first_t = None
+        count = 0
+        for ev in events:
+            kind = ev.get("e")
+            if kind == "header":
+                continue
+            if first_t is None:
+                first_t = ev["t"]
+            scheduled = started + ((ev["t"] - first_t) / speed if speed > 0 else 0.0)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if kind == "chan":
+                self.on_chan(ev)
+            elif hasattr(self, f"on_{kind}"):
+                tasks.append(asyncio.create_task(self.handle(ev, scheduled)))
+            count += 1
+            if self.args.limit and count >= self.args.limit:
+                break
+        await asyncio.gather(*tasks)
+        # closes and confirmations finish as background jobs after the handler has answered
+        await self.main.job_queue.join()
+        elapsed = time.perf_counter() - started
+        # drop fire-and-forget work still pending (sticky reposts, inactivity timers)
+        pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        rows = []
+        for label, values in sorted(self.latencies.items()):
+            values.sort()
+            rows.append({
+                "event": label,
+                "count": len(values),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000,
+                "errors": self.errors.get(label, 0),
+            })
+        self.lag.sort()
+        return {
+            "events": count,
+            "trace_seconds": (ev["t"] - first_t) if first_t is not None else 0.0,
+            "wall_seconds": elapsed,
+            "events_per_sec": count / elapsed if elapsed else 0.0,
+            "lag_p99_ms": percentile(self.lag, 0.99) * 1000,
+            "lag_max_ms": (self.lag[-1] if self.lag else 0.0) * 1000,
+            "rest_calls": self.world.rest.calls,
+            "skipped": self.skipped,
+            "peak_rss_mb": peak_rss_mb(),
+            "by_event": rows,
+        }
+
+
+def print_report(result: Dict[str, Any]):
+    print(f"\nreplayed {result['events']} events: {result['trace_seconds']:.1f}s of traffic in {result['wall_seconds']:.1f}s "
+          f"({result['events_per_sec']:.1f} ev/s), dispatch lag p99 {result['lag_p99_ms']:.1f}ms max {result['lag_max_ms']:.1f}ms, "
+          f"REST calls {result['rest_calls']}, skipped {result['skipped']}, peak RSS {result['peak_rss_mb']:.1f}MB")
+    header = f"{'event':<36}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in result["by_event"]:
+        print(f"{r['event']:<36}{r['count']:>8}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}{r['errors']:>8}")
+
+
+async def run(args: argparse.Namespace, files: List[str]) -> Dict[str, Any]:
+    import main
+
+    # the ticket flow, staff lookups and background loops register from extensions/ (the loops only start on_ready)
+    await main.load_extensions()
+    events = read_events(files)
+    header = next(events, None)
+    if header is None or header.get("e") != "header":
+        raise SystemExit(f"{files[0]} doesn't start with a trace header")
+    if header.get("v") != main.TRACE_FORMAT_VERSION:
+        print(f"note: trace format v{header.get('v')}, replayer expects v{main.TRACE_FORMAT_VERSION}")
+    replayer = Replayer(main, args, header)
+    return await replayer.play(events)
+
+
+def cli(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    files = trace_files(args.paths)
+    if not files:
+        raise SystemExit("no trace files found")
+    files = [os.path.abspath(f) for f in files]
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo_dir)
+    os.environ["GIT_SYNC"] = "0"
+    os.environ.pop("TRACE_DIR", None)  # never record the replay itself
+    os.environ.setdefault("TOKEN", "")
+    with tempfile.TemporaryDirectory(prefix="xts-replay-") as workdir:
+        os.chdir(workdir)
+        result = asyncio.run(run(args, files))
+        # main.py writes state files from a background thread; let them land before the directory goes
+        sys.modules["main"].state_writer.flush()
+        os.chdir(repo_dir)
+
+    print_report(result)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "files": files, "result": result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,29 @@
+# tests/conftest.py
+# main.py reads and writes its state files relative to the cwd from import time on, so the tests import it
+# inside a scratch directory, the same way bench.py and replay.py do.
+#
+#   python -m pytest -q
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture(scope="session")
+def main():
+    os.environ["GIT_SYNC"] = "0"
+    os.environ["STATE_FSYNC"] = "0"
+    os.environ.setdefault("TOKEN", "")
+    os.environ.setdefault("LOG_CONSOLE_LEVEL", "ERROR")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="xts-tests-") as workdir:
+        os.chdir(workdir)
+        import main as module
+        yield module
+        # state files are written from a background thread; let them land before the directory goes
+        module.state_writer.flush()
+        os.chdir(cwd)
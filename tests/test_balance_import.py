@@ -0,0 +1,115 @@
+# tests/test_balance_import.py
+# /import-balances: CSV parsing, applying rows, and the dry-run preview.
+import asyncio
+import json
+import os
+
+import discord
+import pytest
+
+import fakes
+
+ALICE = 1_300_000_000_000_000_001
+BOB = 1_300_000_000_000_000_002
+CAROL = 1_300_000_000_000_000_003
+
+
+def csv_bytes(*lines: str) -> bytes:
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8-sig")
+
+
+def test_parse_skips_header_and_blank_lines(main):
+    rows, errors = main.parse_balance_csv(csv_bytes("user_id,delta,note", f"{ALICE},12.5,refund", "", ",,", f"{BOB},-3"))
+    assert errors == []
+    assert rows == [(ALICE, 12.5, "refund"), (BOB, -3.0, "")]
+
+
+def test_parse_reports_bad_rows_with_line_numbers(main):
+    rows, errors = main.parse_balance_csv(csv_bytes(
+        f"{ALICE},abc",
+        f"{ALICE},nan",
+        f"{ALICE},-inf",
+        "12345,5",
+        f"{ALICE}",
+        f"{BOB},1",
+    ))
+    assert errors == [
+        "line 1: 'abc' isn't an amount",
+        "line 2: 'nan' isn't an amount",
+        "line 3: '-inf' isn't an amount",
+        "line 4: '12345' isn't a user id",
+        "line 5: expected user id, delta[, note]",
+    ]
+    assert rows == [(BOB, 1.0, "")]
+
+
+def test_parse_stops_after_max_errors(main):
+    lines = [f"{ALICE},x{i}" for i in range(main.IMPORT_MAX_ERRORS + 5)]
+    _, errors = main.parse_balance_csv(csv_bytes(*lines))
+    assert len(errors) == main.IMPORT_MAX_ERRORS
+
+
+def test_apply_duplicate_rows_in_order(main):
+    users = {str(ALICE): {"spent": 10.0}}
+    rows = [(ALICE, 5.0, "a"), (ALICE, -20.0, "b"), (ALICE, 2.0, "c"), (BOB, 1.0, "")]
+    summary = main.apply_balance_rows(users, rows)
+    # the subtraction stops at 0 and the later addition starts from there
+    assert users[str(ALICE)]["spent"] == 2.0
+    assert users[str(BOB)]["spent"] == 1.0
+    assert [(e["before"], e["after"]) for e in summary["audit"]] == [(10.0, 15.0), (15.0, 0.0), (0.0, 2.0), (0.0, 1.0)]
+    assert (summary["rows"], summary["users"], summary["new_users"], summary["clamped"]) == (4, 2, 1, 1)
+    assert (summary["added"], summary["removed"]) == (8.0, 15.0)
+    # net per user, not per row
+    assert summary["largest"] == [(-8.0, str(ALICE)), (1.0, str(BOB))]
+
+
+@pytest.fixture
+def admin_world(main, monkeypatch):
+    """(fake world, admin member) for driving the command."""
+    world = fakes.FakeWorld(main.bot, main.PRIMARY_GUILD_ID)
+    role = world.guild.add_role(main.guild_config(main.PRIMARY_GUILD_ID).admin_role_ids[0], "Admin")
+    # the command only accepts guild members; the fakes aren't discord.Member instances
+    monkeypatch.setattr(discord, "Member", fakes.FakeMember)
+    return world, world.guild.add_member(fakes.next_id(), "admin", roles=[role])
+
+
+def run_import(main, world, member, raw: bytes, dry_run: bool):
+    class Attachment:
+        filename = "balances.csv"
+        size = len(raw)
+
+        async def read(self):
+            return raw
+
+    interaction = fakes.FakeInteraction(world.rest, member)
+    asyncio.run(main.import_balances_cmd.callback(interaction, Attachment(), dry_run=dry_run))
+    return interaction.followup.sent[-1]
+
+
+def test_dry_run_previews_without_writing(main, admin_world):
+    world, admin = admin_world
+    main.write_accounting({"users": {str(ALICE): {"spent": 10.0}, str(CAROL): {"spent": 50.0}}})
+    raw = csv_bytes("user_id,delta,note", f"{ALICE},-25,chargeback", f"{ALICE},4", f"{BOB},7.5")
+
+    sent = run_import(main, world, admin, raw, dry_run=True)
+    assert sent["embed"].title == "Balance Import Preview"
+    assert "1 subtractions stopped at $0.00" in sent["embed"].description
+    assert main.read_accounting()["users"] == {str(ALICE): {"spent": 10.0}, str(CAROL): {"spent": 50.0}}
+    assert not os.path.exists(main.BALANCE_IMPORTS_LOG)
+
+    sent = run_import(main, world, admin, raw, dry_run=False)
+    assert sent["embed"].title == "Balance Import Applied ✅"
+    assert main.read_accounting()["users"] == {str(ALICE): {"spent": 4.0}, str(BOB): {"spent": 7.5}, str(CAROL): {"spent": 50.0}}
+    with open(main.BALANCE_IMPORTS_LOG, encoding="utf-8") as f:
+        audit = [json.loads(line) for line in f]
+    assert [(e["user_id"], e["before"], e["after"], e["by"]) for e in audit] == [(ALICE, 10.0, 0.0, admin.id), (ALICE, 0.0, 4.0, admin.id), (BOB, 0.0, 7.5, admin.id)]
+
+
+def test_rows_with_errors_apply_nothing(main, admin_world):
+    world, admin = admin_world
+    main.write_accounting({"users": {str(ALICE): {"spent": 10.0}}})
+
+    sent = run_import(main, world, admin, csv_bytes(f"{ALICE},5", f"{BOB},five"), dry_run=False)
+    assert sent["content"].startswith("Nothing was applied")
+    assert "line 2: 'five' isn't an amount" in sent["content"]
+    assert main.read_accounting()["users"] == {str(ALICE): {"spent": 10.0}}
@@ -0,0 +1,139 @@
+# tests/test_ticket_store.py
+# TicketStore's secondary indexes and work queues must always match what a fresh load of the same tickets builds.
+import random
+
+import pytest
+
+GUILD = 945694600377552916
+OTHER_GUILD = 1_000_000_000_000_000_001
+STAFF = 1_100_000_000_000_000_000
+
+
+def make_tickets(main, n: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    tickets = {}
+    for i in range(n):
+        uid = 1_200_000_000_000_000_000 + i % (n // 2 or 1)  # some users hold two tickets
+        created = 1_700_000_000.0 + rng.uniform(0, 86400)
+        tickets.setdefault(str(uid), []).append(main.Ticket(
+            channel_id=1_400_000_000_000_000_000 + i,
+            user_id=uid,
+            created_at=created,
+            last_activity=created + rng.uniform(0, 3600),
+            subtype=rng.choice(["gamepass", "groupfunds", "ingame", None]),
+            payment_method=rng.choice(["PayPal", "crypto", None]),
+            amount=rng.choice([1000, 5000, 25000]),
+            total_cost=rng.choice([5.0, 25.0, 125.0]),
+            guild_id=rng.choice([GUILD, OTHER_GUILD, None]),
+            stage=rng.choice(["new", "payment", "needs_gamepass"]),
+        ))
+    return tickets
+
+
+def assert_consistent(main, store):
+    """Compare every index against a store rebuilt from the current tickets."""
+    fresh = main.TicketStore({uid: list(ts) for uid, ts in store.snapshot().items()})
+    assert len(store) == len(fresh)
+    assert store._by_channel == fresh._by_channel
+    assert store._owner_by_channel == fresh._owner_by_channel
+    assert store._by_key == fresh._by_key
+    assert store._by_time == fresh._by_time
+    assert store._queued == fresh._queued
+    # heaps may hold stale entries; the live ones must be exactly the unclaimed tickets in that queue
+    for key in set(store._queues) | set(fresh._queues):
+        live = {(p, cid) for p, cid in store._queues.get(key, ())
+                if (t := store._by_channel.get(cid)) is not None and t.claimed_by is None
+                and store._queue_key(t) == key and main.queue_priority(t) == p}
+        assert live == set(fresh._queues.get(key, ())), key
+
+
+def test_load(main):
+    assert_consistent(main, main.TicketStore(make_tickets(main, 200)))
+
+
+def test_add_update_remove(main):
+    store = main.TicketStore(make_tickets(main, 100))
+    extra = main.Ticket(channel_id=1_500_000_000_000_000_000, user_id=42_000_000_000_000_000, created_at=1.0, last_activity=2.0, guild_id=GUILD)
+    store.add(extra)
+    assert_consistent(main, store)
+    assert store.search(user_id=extra.user_id) == [extra]
+
+    channel_ids = sorted(store._by_channel)
+    for cid in channel_ids[:30]:
+        store.update(cid, last_activity=9_999_999_999.0, payment_method="Wise", stage="payment", stage_since=5.0)
+    assert_consistent(main, store)
+    assert {t.channel_id for t in store.search(payment_method="wise")} == set(channel_ids[:30])
+
+    # close: what the close path does to the store
+    for cid in channel_ids[::3]:
+        assert store.remove(cid).channel_id == cid
+    assert store.remove(channel_ids[0]) is None
+    assert_consistent(main, store)
+    assert not any(t.channel_id in channel_ids[::3] for t in store.search())
+
+
+def test_stale_update_is_rejected(main):
+    store = main.TicketStore(make_tickets(main, 10))
+    cid = min(store._by_channel)
+    _, before = store.find(cid)
+    assert store.update(cid, expected=before, warned=True) is not None
+    assert store.update(cid, expected=before, warned=False) is None
+    assert store.find(cid)[1].warned is True
+    assert_consistent(main, store)
+
+
+def test_claim_next(main):
+    store = main.TicketStore(make_tickets(main, 300))
+    claimed = []
+    while (ticket := store.claim_next(GUILD, ["new"], STAFF)) is not None:
+        claimed.append(ticket)
+        assert_consistent(main, store)
+    assert claimed, "no tickets in the guild's new queue"
+    # each handed out once and moved along
+    assert len({t.channel_id for t in claimed}) == len(claimed)
+    assert all(t.claimed_by == STAFF and t.stage == main.STAGE_ON_CLAIM["new"] for t in claimed)
+    assert store.queue_depths(GUILD)["new"] == 0
+    assert store.queue_depths(OTHER_GUILD)["new"] > 0
+
+    # releasing a claim puts the ticket back in a queue
+    depth = store.queue_depths(GUILD)["payment"]
+    released = store.update(claimed[0].channel_id, claimed_by=None)
+    assert_consistent(main, store)
+    assert store.queue_depths(GUILD)["payment"] == depth + 1
+    drained = iter(lambda: store.claim_next(GUILD, ["payment"], STAFF), None)
+    assert released.channel_id in {t.channel_id for t in drained}
+
+
+def test_claim_order(main):
+    store = main.TicketStore({})
+    for i, (since, cost) in enumerate([(100.0, 0.0), (50.0, 0.0), (100.0, 500.0)]):
+        store.add(main.Ticket(channel_id=i + 1, user_id=i + 1, created_at=since, last_activity=since, total_cost=cost, guild_id=GUILD))
+    order = [store.claim_next(GUILD, ["new"], STAFF).channel_id for _ in range(3)]
+    # worth more than it has waited less
+    assert order == [3, 2, 1]
+    assert store.claim_next(GUILD, ["new"], STAFF) is None
+
+
+def test_requeue_churn_keeps_heap_bounded(main):
+    # one busy guild and a tiny one sharing a stage: the tiny one's heap is sized by its own queue
+    tickets = {}
+    for i in range(2000):
+        tickets[str(i + 1)] = [main.Ticket(channel_id=i + 1, user_id=i + 1, created_at=1.0, last_activity=1.0, guild_id=GUILD)]
+    tickets["9999"] = [main.Ticket(channel_id=9999, user_id=9999, created_at=1.0, last_activity=1.0, guild_id=OTHER_GUILD)]
+    store = main.TicketStore(tickets)
+    for n in range(1000):
+        store.update(9999, stage_since=2.0 + n)
+    assert len(store._queues[(OTHER_GUILD, "new")]) <= 2 * 1 + 65
+    assert_consistent(main, store)
+
+
+@pytest.mark.parametrize("reload_size", [0, 50])
+def test_replace_all(main, reload_size):
+    store = main.TicketStore(make_tickets(main, 120))
+    snapshot = store.snapshot()
+    store.claim_next(GUILD, ["new", "payment"], STAFF)
+    store.replace_all(make_tickets(main, reload_size, seed=7))
+    assert_consistent(main, store)
+    assert len(store) == reload_size
+    # a snapshot taken before is untouched
+    assert sum(len(ts) for ts in snapshot.values()) == 120